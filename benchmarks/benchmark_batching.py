@@ -0,0 +1,60 @@
+# benchmarks/benchmark_batching.py
+
+import argparse
+import time
+from fmp.routing import Router
+from fmp.transport import Listener
+
+
+def run(transport, batch_size, packets, packet_size, flush_interval=0.0):
+    """
+    Push pre-built packets through a Router to a Listener on one loopback path.
+    Returns (packets delivered, wall seconds, CPU seconds). Sender and listener share
+    this process, so CPU seconds cover both ends of the path.
+    """
+    received = [0]
+    last = [time.perf_counter()]
+
+    def on_fragment(fragment, path):
+        received[0] += 1
+        last[0] = time.perf_counter()
+
+    listener = Listener([('127.0.0.1', 0)], on_fragment, transport=transport)
+    path = listener.start()[0]
+    router = Router([path], transport=transport, probe_interval=None, batch_size=batch_size,
+                    flush_interval=flush_interval)
+    packet = b'\0' * packet_size
+    cpu = time.process_time()
+    start = time.perf_counter()
+    for _ in range(packets):
+        router.send_fragment(packet)
+    router.flush()
+    # UDP may drop under load, so stop once the listener has been idle for a moment
+    while received[0] < packets and time.perf_counter() - last[0] < 0.5:
+        time.sleep(0.01)
+    elapsed = last[0] - start
+    cpu = time.process_time() - cpu
+    router.close()
+    listener.stop()
+    return received[0], elapsed, cpu
+
+
+def benchmark_batching(transports=('udp', 'tcp'), batch_sizes=(1, 8, 64), packets=100_000, packet_size=64):
+    print(f"{packets} packets of {packet_size} bytes over one loopback path")
+    for transport in transports:
+        for batch_size in batch_sizes:
+            delivered, elapsed, cpu = run(transport, batch_size, packets, packet_size)
+            print(f"{transport} batch {batch_size:>3}: {delivered / elapsed:>9.0f} packets/s | "
+                  f"{delivered / cpu:>9.0f} packets/s per core | delivered {delivered / packets:.1%}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Packets per second with batched path workers.")
+    parser.add_argument('--packets', type=int, default=100_000)
+    parser.add_argument('--packet-size', type=int, default=64)
+    parser.add_argument('--transport', choices=('udp', 'tcp'), action='append',
+                        help="transport to measure (repeatable; default both)")
+    parser.add_argument('--batch-size', type=int, action='append', help="batch size to measure (repeatable)")
+    args = parser.parse_args()
+    benchmark_batching(transports=args.transport or ('udp', 'tcp'), batch_sizes=args.batch_size or (1, 8, 64),
+                       packets=args.packets, packet_size=args.packet_size)
@@ -0,0 +1,64 @@
+# benchmarks/benchmark_ciphers.py
+
+import argparse
+import secrets
+import time
+from fmp.ciphers import SUITES, fastest_suite
+from fmp.core import FMPCore
+from fmp.metrics import Registry
+
+
+def throughput(suite, fragment_size, total_mb):
+    """
+    Encrypt and reassemble total_mb megabytes in 1 MB messages. Returns MB/s.
+    """
+    sender = FMPCore(fragment_size=fragment_size, cipher=suite, metrics=Registry())
+    receiver = FMPCore(master_key=sender.master_key, metrics=Registry())
+    data = secrets.token_bytes(1_000_000)
+    start = time.perf_counter()
+    for _ in range(total_mb):
+        receiver.decrypt_and_reassemble(sender.fragment_and_encrypt(data))
+    return total_mb / (time.perf_counter() - start)
+
+
+def setup_cost(instances):
+    """
+    Microseconds per FMPCore built with a shared key, with a fresh key each time, and for
+    a bare AEAD context, per suite.
+    """
+    key = secrets.token_bytes(32)
+    metrics = Registry()
+    results = {}
+    for label, make in (('shared key', lambda: FMPCore(master_key=key, metrics=metrics)),
+                        ('fresh key', lambda: FMPCore(master_key=secrets.token_bytes(32), metrics=metrics))):
+        start = time.perf_counter()
+        for _ in range(instances):
+            make()
+        results[label] = (time.perf_counter() - start) / instances * 1e6
+    for suite, aead in SUITES.items():
+        start = time.perf_counter()
+        for _ in range(instances):
+            aead(key)
+        results[f'{suite} context'] = (time.perf_counter() - start) / instances * 1e6
+    return results
+
+
+def benchmark_ciphers(fragment_sizes=(1200, 8192, 65000), total_mb=50, instances=2000):
+    start = time.perf_counter()
+    fastest = fastest_suite.__wrapped__(tuple(SUITES))
+    print(f"Startup benchmark picks {fastest} in {(time.perf_counter() - start) * 1000:.2f} ms")
+    print(f"\nEncrypt and reassemble {total_mb} MB in 1 MB messages")
+    for fragment_size in fragment_sizes:
+        row = [f"{suite}: {throughput(suite, fragment_size, total_mb):7.1f} MB/s" for suite in SUITES]
+        print(f"{fragment_size:>6} byte fragments | " + " | ".join(row))
+    print(f"\nSetup cost per instance over {instances} instances")
+    for label, micros in setup_cost(instances).items():
+        print(f"{label:>26}: {micros:8.1f} us")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cipher suite throughput, selection and context setup cost.")
+    parser.add_argument('--total-mb', type=int, default=50)
+    parser.add_argument('--instances', type=int, default=2000)
+    args = parser.parse_args()
+    benchmark_ciphers(total_mb=args.total_mb, instances=args.instances)
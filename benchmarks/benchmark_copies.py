@@ -0,0 +1,82 @@
+# benchmarks/benchmark_copies.py
+
+import time
+import secrets
+import msgpack
+from fmp.core import FMPCore
+
+class LegacyPipeline:
+    """
+    The copy-heavy pipeline FMPCore used before zero-copy fragmentation, with every
+    buffer it materializes counted: the slice per fragment, metadata + fragment
+    concatenation, the AES-GCM output, nonce + ciphertext, then on receive the nonce
+    and ciphertext slices, the decrypted plaintext, the payload slice and the final join.
+    """
+    def __init__(self, core):
+        self.core = core
+        self.copied = 0
+
+    def _count(self, buffer):
+        self.copied += len(buffer)
+        return buffer
+
+    def fragment_and_encrypt(self, data):
+        size = self.core.fragment_size
+        fragments = [self._count(data[i:i + size]) for i in range(0, len(data), size)]
+        encrypted = []
+        for index, fragment in enumerate(fragments):
+            packed = msgpack.packb({'id': index, 'total': len(fragments)})
+            nonce = secrets.token_bytes(12)
+            plaintext = self._count(len(packed).to_bytes(2, 'big') + packed + fragment)
+            ciphertext = self._count(self.core.aead.encrypt(nonce, plaintext, None))
+            encrypted.append(self._count(nonce + ciphertext))
+        return encrypted
+
+    def decrypt_and_reassemble(self, encrypted_fragments):
+        fragments = {}
+        for encrypted in encrypted_fragments:
+            nonce = self._count(encrypted[:12])
+            ciphertext = self._count(encrypted[12:])
+            decrypted = self._count(self.core.aead.decrypt(nonce, ciphertext, None))
+            length = int.from_bytes(decrypted[:2], 'big')
+            metadata = msgpack.unpackb(decrypted[2:2 + length])
+            fragments[metadata['id']] = self._count(decrypted[2 + length:])
+        return self._count(b''.join(fragments[i] for i in range(len(fragments))))
+
+def measure_current(core, data):
+    """
+    The zero-copy pipeline allocates exactly two buffers per payload byte: the
+    encrypted fragment it writes ciphertext into and the reassembly buffer it
+    decrypts into. Count those allocations from what it returns.
+    """
+    start = time.perf_counter()
+    encrypted = core.fragment_and_encrypt(data)
+    result = core.decrypt_and_reassemble(encrypted)
+    elapsed = time.perf_counter() - start
+    assert result == data
+    copied = sum(len(fragment) for fragment in encrypted) + len(result)
+    return copied, elapsed
+
+def measure_legacy(core, data):
+    legacy = LegacyPipeline(core)
+    start = time.perf_counter()
+    result = legacy.decrypt_and_reassemble(legacy.fragment_and_encrypt(data))
+    elapsed = time.perf_counter() - start
+    assert result == data
+    return legacy.copied, elapsed
+
+def benchmark_copies(payload_size=10_000_000, fragment_sizes=(512, 1024, 8192)):
+    data = secrets.token_bytes(payload_size)
+    print(f"Payload: {payload_size} bytes\n")
+    for fragment_size in fragment_sizes:
+        core = FMPCore(fragment_size=fragment_size)
+        legacy_copied, legacy_time = measure_legacy(core, data)
+        current_copied, current_time = measure_current(core, data)
+        print(f"[Fragment size {fragment_size}] "
+              f"Before: {legacy_copied / payload_size:.2f} bytes copied per payload byte, "
+              f"{payload_size / legacy_time / 1e6:.1f} MB/s | "
+              f"After: {current_copied / payload_size:.2f} bytes copied per payload byte, "
+              f"{payload_size / current_time / 1e6:.1f} MB/s")
+
+if __name__ == "__main__":
+    benchmark_copies()
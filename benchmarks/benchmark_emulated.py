@@ -0,0 +1,99 @@
+# benchmarks/benchmark_emulated.py
+
+import argparse
+import struct
+import threading
+import time
+from fmp.protocol import FMPProtocol
+from fmp.emulation import LinkProfile, NetworkEmulator
+
+MB = 1_000_000
+
+# Each scenario gives one LinkProfile per path and extra FMPProtocol options
+SCENARIOS = {
+    'clean': ([LinkProfile(delay=0.005), LinkProfile(delay=0.005)], {}),
+    'asymmetric': ([LinkProfile(delay=0.005, bandwidth=4 * MB),
+                    LinkProfile(delay=0.040, jitter=0.005, bandwidth=1 * MB)], {}),
+    'jitter': ([LinkProfile(delay=0.010, jitter=0.005), LinkProfile(delay=0.010, jitter=0.005)], {}),
+    'reordering': ([LinkProfile(delay=0.005, reorder=0.1), LinkProfile(delay=0.005, reorder=0.1)], {}),
+    'lossy': ([LinkProfile(delay=0.010, loss=0.02), LinkProfile(delay=0.010, loss=0.02)], {}),
+    'lossy+fec': ([LinkProfile(delay=0.010, loss=0.02), LinkProfile(delay=0.010, loss=0.02)], {'fec': (8, 1)}),
+    'dead path': ([LinkProfile(delay=0.005), LinkProfile(loss=1.0)], {}),
+}
+
+# Every message starts with its sequence number and send time so latency is measured end to end
+STAMP = struct.Struct('!Id')
+
+
+def _percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def run_scenario(profiles, options, messages=200, message_size=64_000, fragment_size=1200, timeout=30.0, seed=1):
+    """
+    Send messages through FMPProtocol over emulated paths to a listening FMPProtocol.
+    Returns goodput in MB/s, p50/p99 message latency in seconds, delivered message
+    count and the sender's retransmission count.
+    """
+    master_key = b'0' * 32
+    latencies = []
+    done = threading.Event()
+    lock = threading.Lock()
+
+    def on_message(data):
+        _, sent_at = STAMP.unpack_from(data)
+        with lock:
+            latencies.append(time.perf_counter() - sent_at)
+            if len(latencies) == messages:
+                done.set()
+
+    receiver = FMPProtocol(fragment_size=fragment_size, paths=[], master_key=master_key, probe_interval=None,
+                           **options)
+    bound = receiver.listen([('127.0.0.1', 0)] * len(profiles), on_message)
+    emulator = NetworkEmulator(dict(zip(bound, profiles)), seed=seed)
+    proxies = emulator.start()
+    sender = FMPProtocol(fragment_size=fragment_size, paths=list(proxies.values()), master_key=master_key,
+                         probe_interval=0.25, reliable=True, **options)
+
+    padding = bytes(message_size - STAMP.size)
+    start = time.perf_counter()
+    for sequence in range(messages):
+        sender.send_data(STAMP.pack(sequence, time.perf_counter()) + padding)
+    done.wait(timeout)
+    elapsed = time.perf_counter() - start
+    retransmits = sender.router.reliability.stats['retransmits']
+
+    sender.close()
+    receiver.close()
+    emulator.stop()
+
+    with lock:
+        delivered = len(latencies)
+        samples = list(latencies)
+    if not samples:
+        return 0.0, None, None, 0, retransmits
+    return (delivered * message_size / MB / elapsed, _percentile(samples, 0.50), _percentile(samples, 0.99),
+            delivered, retransmits)
+
+
+def benchmark_emulated(scenarios=None, messages=200, message_size=64_000, fragment_size=1200):
+    """
+    Run each named scenario end to end and print one result line per scenario.
+    """
+    for name in scenarios or SCENARIOS:
+        profiles, options = SCENARIOS[name]
+        goodput, p50, p99, delivered, retransmits = run_scenario(profiles, options, messages, message_size,
+                                                                 fragment_size)
+        latency = f"p50 {p50 * 1000:7.1f} ms | p99 {p99 * 1000:7.1f} ms" if p50 is not None else "no messages"
+        print(f"{name:>12}: {goodput:6.2f} MB/s goodput | {latency} | "
+              f"{delivered}/{messages} delivered | {retransmits} retransmits")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="End-to-end FMP benchmark over emulated lossy, delayed paths.")
+    parser.add_argument('--scenario', action='append', choices=list(SCENARIOS))
+    parser.add_argument('--messages', type=int, default=200)
+    parser.add_argument('--message-size', type=int, default=64_000)
+    parser.add_argument('--fragment-size', type=int, default=1200)
+    args = parser.parse_args()
+    benchmark_emulated(args.scenario, args.messages, args.message_size, args.fragment_size)
@@ -0,0 +1,95 @@
+# benchmarks/benchmark_files.py
+
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import secrets
+import tempfile
+import subprocess
+from fmp.core import FMPCore
+from fmp.files import FileReceiver, read_fragments
+
+MB = 1024 * 1024
+
+
+def write_file(path, size_mb):
+    chunk = secrets.token_bytes(MB)
+    with open(path, 'wb') as f:
+        for _ in range(size_mb):
+            f.write(chunk)
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def transfer(mode, source, destination, fragment_size):
+    """
+    Encrypt the file at source and decrypt it into destination in this process.
+    'memory' reads the whole file, sends it with fragment_and_encrypt and writes the
+    reassembled message; 'mmap' pipes fragments of a mapped source into a FileReceiver.
+    """
+    sender = FMPCore(fragment_size=fragment_size)
+    receiver = FMPCore(fragment_size=fragment_size, master_key=sender.master_key)
+    start = time.perf_counter()
+    if mode == 'memory':
+        with open(source, 'rb') as f:
+            fragments = sender.fragment_and_encrypt(f.read())
+        data = receiver.decrypt_and_reassemble(fragments)
+        del fragments
+        with open(destination, 'wb') as f:
+            f.write(data)
+    else:
+        total, payloads = read_fragments(source, fragment_size)
+        file_receiver = FileReceiver(receiver, destination)
+        for fragment in sender.encrypt_fragments(payloads, total):
+            file_receiver.add(fragment)
+        file_receiver.close()
+    return time.perf_counter() - start
+
+
+def run(mode, size_mb, fragment_size):
+    """
+    Run one transfer in a fresh interpreter so its peak RSS is measured on its own.
+    """
+    output = subprocess.run([sys.executable, __file__, '--child', mode, '--size-mb', str(size_mb),
+                             '--fragment-size', str(fragment_size)], check=True, stdout=subprocess.PIPE)
+    return json.loads(output.stdout)
+
+
+def child(mode, size_mb, fragment_size):
+    with tempfile.TemporaryDirectory() as directory:
+        source = os.path.join(directory, 'source.bin')
+        destination = os.path.join(directory, 'received.bin')
+        write_file(source, size_mb)
+        baseline = peak_rss_mb()
+        elapsed = transfer(mode, source, destination, fragment_size)
+        if os.path.getsize(destination) != size_mb * MB:
+            raise RuntimeError("Received file has the wrong size.")
+    print(json.dumps({'seconds': elapsed, 'rss_mb': peak_rss_mb() - baseline}))
+
+
+def benchmark_files(sizes=(64, 256, 1024), fragment_size=8192):
+    print(f"Encrypt a file and decrypt it into another in process, {fragment_size} byte fragments")
+    for size_mb in sizes:
+        row = []
+        for mode in ('memory', 'mmap'):
+            result = run(mode, size_mb, fragment_size)
+            row.append(f"{mode}: {size_mb / result['seconds']:7.1f} MB/s, peak RSS +{result['rss_mb']:7.1f} MB")
+        print(f"{size_mb:>6} MB | " + " | ".join(row))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Throughput and peak RSS of in-memory versus mmap file transfer.")
+    parser.add_argument('--size-mb', type=int, action='append', help="file size in MB (repeatable)")
+    parser.add_argument('--fragment-size', type=int, default=8192)
+    parser.add_argument('--child', choices=('memory', 'mmap'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(args.child, args.size_mb[0], args.fragment_size)
+    else:
+        benchmark_files(sizes=args.size_mb or (64, 256, 1024), fragment_size=args.fragment_size)
@@ -0,0 +1,91 @@
+# benchmarks/benchmark_fragment_size.py
+
+import argparse
+import threading
+import time
+import secrets
+from fmp.core import HEADER_SIZE, NONCE_SIZE, TAG_SIZE
+from fmp.protocol import FMPProtocol
+from fmp.transport import UDP_HEADER_SIZE, IP_HEADER_SIZES
+import socket
+
+MB = 1_000_000
+IP_HEADER = IP_HEADER_SIZES[socket.AF_INET]
+
+
+def wire_overhead(payload_size, fragment_size, mtu):
+    """
+    Wire bytes per payload byte for one message over IPv4/UDP, counting the IP fragments
+    a datagram larger than the MTU is split into.
+    """
+    fragments = -(-payload_size // fragment_size)
+    wire = 0
+    for index in range(fragments):
+        payload = min(fragment_size, payload_size - index * fragment_size)
+        datagram = payload + HEADER_SIZE + NONCE_SIZE + TAG_SIZE + UDP_HEADER_SIZE
+        packets = -(-datagram // (mtu - IP_HEADER))
+        wire += datagram + packets * IP_HEADER
+    return wire / payload_size, -(-(fragment_size + HEADER_SIZE + NONCE_SIZE + TAG_SIZE + UDP_HEADER_SIZE)
+                                  // (mtu - IP_HEADER))
+
+
+def run(fragment_size, total_mb, message_size, mtu, paths=2):
+    """
+    Deliver total_mb megabytes reliably over local UDP paths. With fragment_size='auto'
+    the sender's paths are given a max_datagram matching mtu, as a path MTU lookup would.
+    Returns (goodput in MB/s, fragment size used).
+    """
+    master_key = secrets.token_bytes(32)
+    messages = max(1, total_mb * MB // message_size)
+    received = []
+    done = threading.Event()
+
+    def on_message(data):
+        received.append(len(data))
+        if len(received) == messages:
+            done.set()
+
+    receiver = FMPProtocol(paths=[], master_key=master_key, probe_interval=None)
+    bound = receiver.listen([('127.0.0.1', 0)] * paths, on_message)
+    sender = FMPProtocol(fragment_size=fragment_size, paths=bound, master_key=master_key, probe_interval=None,
+                         reliable=True)
+    if fragment_size == 'auto' and mtu is not None:
+        for metrics in sender.router.paths.values():
+            metrics['max_datagram'] = mtu - IP_HEADER - UDP_HEADER_SIZE
+    data = secrets.token_bytes(message_size)
+    start = time.perf_counter()
+    for _ in range(messages):
+        sender.send_data(data)
+    delivered = done.wait(60)
+    elapsed = time.perf_counter() - start
+    used = sender.router.sizer.current if fragment_size == 'auto' else fragment_size
+    sender.close()
+    receiver.close()
+    if not delivered:
+        raise RuntimeError(f"Only {len(received)} of {messages} messages delivered.")
+    return messages * message_size / MB / elapsed, used
+
+
+def benchmark_fragment_size(sizes=(100, 512, 1024, 1400, 8192, 'auto'), total_mb=20, message_size=1_000_000,
+                            mtu=1500):
+    print(f"{total_mb} MB in {message_size // 1000} KB messages over 2 loopback paths; "
+          f"overhead computed for a {mtu} byte MTU")
+    for size in sizes:
+        goodput, used = run(size, total_mb, message_size, mtu)
+        ratio, packets = wire_overhead(message_size, used, mtu)
+        label = f"auto ({used})" if size == 'auto' else str(size)
+        print(f"Fragment size {label:>12}: overhead {ratio - 1:6.2%} | {packets} IP packet(s) per fragment | "
+              f"goodput {goodput:6.1f} MB/s")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fixed versus adaptive fragment sizes: overhead and goodput.")
+    parser.add_argument('--total-mb', type=int, default=20)
+    parser.add_argument('--message-size', type=int, default=1_000_000)
+    parser.add_argument('--mtu', type=int, default=1500,
+                        help="path MTU used for the overhead figures and given to auto mode")
+    args = parser.parse_args()
+    benchmark_fragment_size(total_mb=args.total_mb, message_size=args.message_size, mtu=args.mtu)
+    print()
+    # Without an MTU limit (loopback), auto mode grows fragments to the path's 64 KiB datagrams
+    benchmark_fragment_size(sizes=(8192, 'auto'), total_mb=args.total_mb, message_size=args.message_size,
+                            mtu=65535)
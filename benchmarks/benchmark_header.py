@@ -0,0 +1,87 @@
+# benchmarks/benchmark_header.py
+
+import time
+import secrets
+import msgpack
+from fmp.core import FMPCore, FragmentHeader, FRAGMENT_HEADER, HEADER_SIZE, NONCE_SIZE, TAG_SIZE
+
+class MsgpackCore(FMPCore):
+    """
+    FMPCore with the previous header layout: 2-byte length + msgpack {'id', 'total'}
+    as associated data. Everything else (fragmentation, reassembly) is shared, so the
+    comparison isolates the cost of the header itself.
+    """
+    def _encrypt_fragment(self, fragment, message_id, index, total, session, nonce=None):
+        packed = msgpack.packb({'id': index, 'total': total})
+        header = len(packed).to_bytes(2, 'big') + packed
+        header_length = len(header)
+        nonce = nonce or session.next_nonce()
+        encrypted = bytearray(header_length + NONCE_SIZE + len(fragment) + TAG_SIZE)
+        encrypted[:header_length + NONCE_SIZE] = header + nonce
+        view = memoryview(encrypted)
+        session.aead.encrypt_into(nonce, fragment, view[:header_length], view[header_length + NONCE_SIZE:])
+        return encrypted
+
+    def _parse(self, encrypted):
+        view = memoryview(encrypted)
+        header_length = 2 + int.from_bytes(view[:2], 'big')
+        metadata = msgpack.unpackb(view[2:header_length])
+        payload_length = len(view) - header_length - NONCE_SIZE - TAG_SIZE
+        return FragmentHeader(0, 0, 0, 0, metadata['id'], metadata['total'], payload_length), (view, header_length)
+
+    def _decrypt(self, header, parsed, out=None):
+        view, header_length = parsed
+        nonce = view[header_length:header_length + NONCE_SIZE]
+        args = (nonce, view[header_length + NONCE_SIZE:], view[:header_length])
+        if out is None:
+            return self.aead.decrypt(*args)
+        self.aead.decrypt_into(*args, out)
+
+def header_only(count=200_000):
+    """
+    Pack and parse headers alone, without any AES-GCM work.
+    """
+    start = time.perf_counter()
+    for index in range(count):
+        packed = msgpack.packb({'id': index, 'total': count})
+        buffer = len(packed).to_bytes(2, 'big') + packed
+        msgpack.unpackb(buffer[2:2 + int.from_bytes(buffer[:2], 'big')])
+    legacy = count / (time.perf_counter() - start)
+
+    buffer = bytearray(HEADER_SIZE)
+    start = time.perf_counter()
+    for index in range(count):
+        FRAGMENT_HEADER.pack_into(buffer, 0, 2, 0, 0, 7, index, count, 100)
+        FRAGMENT_HEADER.unpack_from(buffer)
+    current = count / (time.perf_counter() - start)
+    return legacy, current
+
+def end_to_end(fragment_size, payload_size):
+    key = secrets.token_bytes(32)
+    data = secrets.token_bytes(payload_size)
+    results = {}
+    # Both layouts use random nonces under the master key so only the header differs
+    nonces = lambda: secrets.token_bytes(NONCE_SIZE)
+    for name, codec in (('msgpack', MsgpackCore(fragment_size=fragment_size, master_key=key, nonce_generator=nonces)),
+                        ('struct', FMPCore(fragment_size=fragment_size, master_key=key, nonce_generator=nonces))):
+        start = time.perf_counter()
+        fragments = codec.fragment_and_encrypt(data)
+        assert codec.decrypt_and_reassemble(fragments) == data
+        elapsed = time.perf_counter() - start
+        overhead = sum(len(f) for f in fragments) / payload_size - 1
+        results[name] = (len(fragments) / elapsed, overhead)
+    return results
+
+def benchmark_header(payload_size=2_000_000, fragment_sizes=(100, 512, 1400)):
+    legacy, current = header_only()
+    print(f"Header pack+parse: msgpack {legacy:,.0f}/s | struct {current:,.0f}/s ({current / legacy:.1f}x)")
+    print(f"Fixed header: {HEADER_SIZE} bytes + {NONCE_SIZE}-byte nonce + {TAG_SIZE}-byte tag per fragment\n")
+    for fragment_size in fragment_sizes:
+        results = end_to_end(fragment_size, payload_size)
+        (legacy_rate, legacy_overhead), (rate, overhead) = results['msgpack'], results['struct']
+        print(f"[Fragment size {fragment_size}] "
+              f"msgpack: {legacy_rate:,.0f} fragments/s, {legacy_overhead:.1%} wire overhead | "
+              f"struct: {rate:,.0f} fragments/s, {overhead:.1%} wire overhead")
+
+if __name__ == "__main__":
+    benchmark_header()
@@ -0,0 +1,52 @@
+# benchmarks/benchmark_journal.py
+
+import argparse
+import random
+import secrets
+import tempfile
+import time
+from fmp.core import FMPCore
+from fmp.journal import Journal
+from fmp.reassembly import Reassembler
+
+MB = 1_000_000
+
+
+def run(fragments, sync_every=None):
+    """
+    Reassemble shuffled fragments, journaling them with fsyncs every sync_every fragments
+    (no journal when None). Returns MB/s of plaintext reassembled.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        journal = None if sync_every is None else Journal(directory, sync_every=sync_every, sync_interval=3600)
+        reassembler = Reassembler(FMPCore(master_key=b'k' * 32), max_bytes=1 << 31, journal=journal)
+        start = time.perf_counter()
+        size = 0
+        for fragment in fragments:
+            data = reassembler.add(fragment)
+            if data is not None:
+                size += len(data)
+        elapsed = time.perf_counter() - start
+        reassembler.close()
+    return size / MB / elapsed
+
+
+def benchmark_journal(total_mb=64, message_mb=16, fragment_size=8192, batches=(1, 16, 256, 1024)):
+    core = FMPCore(fragment_size=fragment_size, master_key=b'k' * 32)
+    fragments = []
+    for _ in range(total_mb // message_mb):
+        fragments.extend(core.fragment_and_encrypt(secrets.token_bytes(message_mb * MB)))
+    random.Random(1).shuffle(fragments)
+    print(f"Reassembling {total_mb} MB in {message_mb} MB messages of {fragment_size} byte fragments")
+    print(f"{'no journal':>24}: {run(fragments):8.1f} MB/s")
+    for sync_every in batches:
+        print(f"{f'fsync every {sync_every}':>24}: {run(fragments, sync_every):8.1f} MB/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reassembly throughput with a journal and batched fsyncs.")
+    parser.add_argument('--total-mb', type=int, default=64)
+    parser.add_argument('--message-mb', type=int, default=16)
+    parser.add_argument('--fragment-size', type=int, default=8192)
+    args = parser.parse_args()
+    benchmark_journal(total_mb=args.total_mb, message_mb=args.message_mb, fragment_size=args.fragment_size)
@@ -0,0 +1,85 @@
+# benchmarks/benchmark_logging.py
+
+import os
+import time
+import logging
+import secrets
+from fmp.core import FMPCore
+
+logger = logging.getLogger('fmp.core')
+
+
+class LegacyLoggingCore(FMPCore):
+    """
+    FMPCore with the per-fragment debug lines the hot paths used to emit.
+    """
+
+    def _encrypt_fragment(self, fragment, message_id, index, total, session, nonce=None):
+        nonce = nonce or session.next_nonce()
+        encrypted = super()._encrypt_fragment(fragment, message_id, index, total, session, nonce)
+        logger.debug(f"Encrypted fragment {index} with nonce {nonce.hex()}.")
+        return encrypted
+
+    def _decrypt(self, header, view, out=None):
+        data = super()._decrypt(header, view, out)
+        logger.debug(f"Decrypted fragment {header.index} of {header.total}.")
+        return data
+
+
+def attach_stream_handler(stream):
+    """
+    Reproduce the import-time configuration fmp used to apply: DEBUG level and a StreamHandler.
+    """
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(logging.Formatter('[%(asctime)s] %(levelname)s - %(message)s'))
+    logger.addHandler(handler)
+    logger.setLevel(logging.DEBUG)
+    return handler
+
+
+def detach_stream_handler(handler):
+    logger.removeHandler(handler)
+    logger.setLevel(logging.NOTSET)
+
+
+def run(core, data, rounds):
+    encrypted_fragments = core.fragment_and_encrypt(data)
+    start = time.perf_counter()
+    for _ in range(rounds):
+        encrypted_fragments = core.fragment_and_encrypt(data)
+    encrypt_rate = rounds * len(encrypted_fragments) / (time.perf_counter() - start)
+    start = time.perf_counter()
+    for _ in range(rounds):
+        reassembled = core.decrypt_and_reassemble(encrypted_fragments)
+    decrypt_rate = rounds * len(encrypted_fragments) / (time.perf_counter() - start)
+    assert reassembled == data
+    return encrypt_rate, decrypt_rate
+
+
+def benchmark_logging(payload_size=1_000_000, fragment_sizes=(100, 1400), rounds=5):
+    """
+    Compare fragments/sec with logging off (the default now that fmp installs no handlers)
+    against the previous behaviour of DEBUG records formatted for every fragment.
+    Records go to os.devnull, so a terminal on stderr would only widen the gap.
+    """
+    data = secrets.token_bytes(payload_size)
+    with open(os.devnull, 'w') as devnull:
+        for fragment_size in fragment_sizes:
+            results = {}
+            results['off'] = run(FMPCore(fragment_size=fragment_size), data, rounds)
+            handler = attach_stream_handler(devnull)
+            try:
+                results['debug summaries'] = run(FMPCore(fragment_size=fragment_size), data, rounds)
+                results['debug per-fragment (previous)'] = run(LegacyLoggingCore(fragment_size=fragment_size), data, rounds)
+            finally:
+                detach_stream_handler(handler)
+            baseline_encrypt, baseline_decrypt = results['debug per-fragment (previous)']
+            for mode, (encrypt_rate, decrypt_rate) in results.items():
+                print(f"[Fragment size {fragment_size} | Logging {mode}] "
+                      f"Encrypt: {encrypt_rate:,.0f} fragments/s ({encrypt_rate / baseline_encrypt:.1f}x) | "
+                      f"Decrypt: {decrypt_rate:,.0f} fragments/s ({decrypt_rate / baseline_decrypt:.1f}x)")
+            print()
+
+
+if __name__ == "__main__":
+    benchmark_logging()
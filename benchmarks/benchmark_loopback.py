@@ -0,0 +1,75 @@
+# benchmarks/benchmark_loopback.py
+
+import argparse
+import threading
+import time
+from fmp.core import FMPCore
+from fmp.protocol import FMPProtocol
+from fmp.transport import Listener
+
+def benchmark_loopback(total_mb=256, fragment_size=8192, message_size=1_000_000, transport='udp'):
+    """
+    Push total_mb megabytes through FMPProtocol across two local paths and
+    report the sustained throughput seen by the listener.
+    """
+    master_key = b'0' * 32
+    counters = {'fragments': 0, 'bytes': 0, 'last': time.perf_counter()}
+    lock = threading.Lock()
+
+    receiver = FMPCore(fragment_size=fragment_size, master_key=master_key)
+
+    def on_fragment(fragment, path):
+        _, _, data = receiver.decrypt_fragment(fragment)
+        with lock:
+            counters['fragments'] += 1
+            counters['bytes'] += len(data)
+            counters['last'] = time.perf_counter()
+
+    listener = Listener([('127.0.0.1', 0), ('127.0.0.1', 0)], on_fragment, transport=transport)
+    bound = listener.start()
+    protocol = FMPProtocol(
+        fragment_size=fragment_size,
+        paths=bound,
+        master_key=master_key,
+        transport=transport
+    )
+
+    message = b'A' * message_size
+    messages = max(1, (total_mb * 1_000_000) // message_size)
+    expected_fragments = messages * -(-message_size // fragment_size)
+
+    start = time.perf_counter()
+    for _ in range(messages):
+        protocol.send_data(message)
+    protocol.flush()
+    send_done = time.perf_counter()
+
+    # Wait until everything has arrived or the listener has been idle for a second
+    while True:
+        time.sleep(0.05)
+        with lock:
+            if counters['fragments'] >= expected_fragments:
+                break
+            if time.perf_counter() - counters['last'] > 1.0 and time.perf_counter() - send_done > 1.0:
+                break
+    end = counters['last']
+
+    listener.stop()
+    protocol.close()
+
+    elapsed = end - start
+    delivered_mb = counters['bytes'] / 1_000_000
+    loss = 1 - counters['fragments'] / expected_fragments
+    print(f"Transport: {transport} | Paths: {len(bound)} | Fragment size: {fragment_size} bytes")
+    print(f"Sent {messages} messages ({messages * message_size / 1_000_000:.1f} MB) in {send_done - start:.2f} seconds.")
+    print(f"Delivered {delivered_mb:.1f} MB in {elapsed:.2f} seconds "
+          f"({delivered_mb / elapsed:.1f} MB/s sustained, {loss:.2%} fragments lost).")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Loopback throughput harness for the FMP transport layer.")
+    parser.add_argument('--total-mb', type=int, default=256)
+    parser.add_argument('--fragment-size', type=int, default=8192)
+    parser.add_argument('--message-size', type=int, default=1_000_000)
+    parser.add_argument('--transport', choices=['udp', 'tcp'], default='udp')
+    args = parser.parse_args()
+    benchmark_loopback(args.total_mb, args.fragment_size, args.message_size, args.transport)
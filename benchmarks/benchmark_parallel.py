@@ -0,0 +1,36 @@
+# benchmarks/benchmark_parallel.py
+
+import os
+import time
+import secrets
+from fmp.core import FMPCore
+
+def run(core, data):
+    start = time.perf_counter()
+    encrypted_fragments = core.fragment_and_encrypt(data)
+    encrypt_time = time.perf_counter() - start
+    start = time.perf_counter()
+    reassembled = core.decrypt_and_reassemble(encrypted_fragments)
+    decrypt_time = time.perf_counter() - start
+    assert reassembled == data
+    return encrypt_time, decrypt_time
+
+def benchmark_parallel(payload_sizes=(10_000_000, 50_000_000), fragment_size=8192, worker_counts=(1, 2, 4, 8)):
+    print(f"CPU cores: {os.cpu_count()} | Fragment size: {fragment_size} bytes\n")
+    for payload_size in payload_sizes:
+        data = secrets.token_bytes(payload_size)
+        baseline = None
+        for workers in worker_counts:
+            core = FMPCore(fragment_size=fragment_size, workers=workers)
+            run(core, data)  # Warm up the pool and allocator
+            encrypt_time, decrypt_time = run(core, data)
+            core.close()
+            total = encrypt_time + decrypt_time
+            baseline = baseline or total
+            print(f"[Payload {payload_size // 1_000_000} MB | Workers {workers}] "
+                  f"Encrypt: {payload_size / encrypt_time / 1e6:.1f} MB/s | "
+                  f"Decrypt: {payload_size / decrypt_time / 1e6:.1f} MB/s | "
+                  f"Speedup: {baseline / total:.2f}x")
+
+if __name__ == "__main__":
+    benchmark_parallel()
@@ -0,0 +1,64 @@
+# benchmarks/benchmark_selection.py
+
+import argparse
+import threading
+import time
+from fmp.routing import Router
+
+
+class NullTransport:
+    name = 'udp'
+    connections = {}
+
+    def send(self, path, fragment):
+        pass
+
+    def close(self):
+        pass
+
+
+def locked_select(router):
+    # Per-fragment selection as before the selection table: the scheduler runs under the router lock
+    with router.lock:
+        return router.scheduler.select(router.paths)
+
+
+def run(select, router, threads, selections):
+    """
+    Call select(router) selections times from each of threads threads.
+    Returns selections per second across all threads.
+    """
+    barrier = threading.Barrier(threads + 1)
+
+    def work():
+        barrier.wait()
+        for _ in range(selections):
+            select(router)
+
+    workers = [threading.Thread(target=work) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for worker in workers:
+        worker.join()
+    return threads * selections / (time.perf_counter() - start)
+
+
+def benchmark_selection(path_counts=(2, 8, 32, 64), thread_counts=(1, 8), selections=20_000):
+    for paths in path_counts:
+        router = Router([('10.0.0.%d' % (i + 1), 9000) for i in range(paths)], transport=NullTransport(),
+                        probe_interval=None)
+        for threads in thread_counts:
+            locked = run(locked_select, router, threads, selections)
+            table = run(Router.select_path, router, threads, selections)
+            print(f"{paths:>3} paths, {threads} sender thread(s): locked select {locked:>10.0f}/s | "
+                  f"selection table {table:>10.0f}/s ({table / locked:.1f}x)")
+        router.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Path selections per second: locked scheduler versus table.")
+    parser.add_argument('--selections', type=int, default=20_000, help="selections per thread")
+    args = parser.parse_args()
+    benchmark_selection(selections=args.selections)
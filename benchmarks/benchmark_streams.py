@@ -0,0 +1,166 @@
+# benchmarks/benchmark_streams.py
+
+import argparse
+import secrets
+import threading
+import time
+from fmp.core import FRAGMENT_HEADER
+from fmp.protocol import FMPProtocol
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, round(fraction * (len(ordered) - 1)))]
+
+
+class Receiver:
+    """
+    A listening FMPProtocol recording when every message arrives.
+    """
+
+    def __init__(self, master_key, paths=2):
+        self.arrivals = {}
+        self.count = 0
+        self.lock = threading.Lock()
+        self.done = threading.Event()
+        self.expected = None
+        self.protocol = FMPProtocol(paths=[], master_key=master_key, probe_interval=None)
+        self.paths = self.protocol.listen([('127.0.0.1', 0)] * paths, self.on_message, with_stream=True)
+
+    def on_message(self, stream_id, data):
+        with self.lock:
+            # Messages carry their identity in the first 8 bytes
+            self.arrivals[bytes(data[:8])] = time.perf_counter()
+            self.count += 1
+            if self.count == self.expected:
+                self.done.set()
+
+    def close(self):
+        self.protocol.close()
+
+
+def messages_per_second(senders, messages, message_size, shared=True):
+    """
+    senders threads each send messages messages reliably, over streams of one shared
+    FMPProtocol or over one FMPProtocol per thread. Returns delivered messages per second.
+    """
+    master_key = secrets.token_bytes(32)
+    receiver = Receiver(master_key)
+    receiver.expected = senders * messages
+    options = dict(fragment_size=1200, paths=receiver.paths, master_key=master_key, probe_interval=None,
+                   reliable=True)
+    protocols = [FMPProtocol(**options)] if shared else [FMPProtocol(**options) for _ in range(senders)]
+    body = secrets.token_bytes(message_size - 8)
+
+    def send(index):
+        if shared:
+            stream = protocols[0].open_stream()
+            send_one = stream.send
+        else:
+            send_one = protocols[index].send_data
+        for number in range(messages):
+            send_one((index * messages + number).to_bytes(8, 'big') + body)
+
+    threads = [threading.Thread(target=send, args=(index,)) for index in range(senders)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    delivered = receiver.done.wait(120)
+    elapsed = time.perf_counter() - start
+    count = receiver.count
+    for protocol in protocols:
+        protocol.close()
+    receiver.close()
+    if not delivered:
+        raise RuntimeError(f"Only {count} of {senders * messages} messages delivered.")
+    return count / elapsed
+
+
+class PacedTransport:
+    """
+    Transport whose paths send at a fixed bandwidth, so fragments queue up in the router
+    as on a slow link. Records when each fragment smaller than small_size is sent.
+    """
+    name = 'udp'
+    connections = {}
+
+    def __init__(self, bandwidth, small_size):
+        self.bandwidth = bandwidth
+        self.small_size = small_size
+        self.sent_at = {}
+
+    def send(self, path, fragment):
+        self.send_batch(path, [fragment])
+
+    def send_batch(self, path, fragments):
+        for fragment in fragments:
+            time.sleep(len(fragment) / self.bandwidth)
+            if len(fragment) < self.small_size:
+                self.sent_at[FRAGMENT_HEADER.unpack_from(fragment)[3]] = time.perf_counter()
+
+    def close(self):
+        pass
+
+
+def small_message_latency(bulk_mb, small_messages, separate_streams=True, bandwidth=20_000_000):
+    """
+    Send small messages while a bulk transfer keeps the send queues of two paths of
+    bandwidth bytes/s full, on separate streams or all on the default stream (first in,
+    first out). Returns the (p50, p99) time in seconds from send_data until a small
+    message is handed to its path.
+    """
+    transport = PacedTransport(bandwidth, small_size=100)
+    sender = FMPProtocol(fragment_size=1200, paths=[('10.0.0.1', 9000), ('10.0.0.2', 9000)],
+                         transport=transport, probe_interval=None)
+    bulk = sender.open_stream() if separate_streams else None
+    small = sender.open_stream() if separate_streams else None
+    bulk_data = secrets.token_bytes(bulk_mb * 1_000_000)
+
+    def send_bulk():
+        if bulk is None:
+            sender.send_data(bulk_data)
+        else:
+            bulk.send(bulk_data)
+
+    bulk_thread = threading.Thread(target=send_bulk)
+    bulk_thread.start()
+    while sum(sender.router.queue_depths().values()) < sender.router.queues[('10.0.0.1', 9000)].maxsize:
+        time.sleep(0.001)  # Let the bulk transfer fill the queues
+    send_times = {}
+    for _ in range(small_messages):
+        fragment = sender.core.fragment_and_encrypt(b'small', stream_id=small.id if small else 0)[0]
+        message_id = sender.core.parse_fragment(fragment).message_id
+        send_times[message_id] = time.perf_counter()
+        sender.router.send_fragment(fragment, small.id if small else 0)
+        time.sleep(0.002)
+    bulk_thread.join()
+    sender.close()
+    latencies = [transport.sent_at[message_id] - at for message_id, at in send_times.items()]
+    return percentile(latencies, 0.5), percentile(latencies, 0.99)
+
+
+def benchmark_streams(concurrency=(1, 8, 64), messages=2000, message_size=1000, bulk_mb=20, small_messages=100):
+    print(f"Reliable delivery of {message_size} byte messages over 2 loopback paths")
+    for senders in concurrency:
+        per_sender = max(1, messages // senders)
+        shared = messages_per_second(senders, per_sender, message_size, shared=True)
+        separate = messages_per_second(senders, per_sender, message_size, shared=False)
+        print(f"{senders:>4} concurrent senders: one protocol, a stream each {shared:>8.0f} msg/s | "
+              f"one protocol each {separate:>8.0f} msg/s")
+    print(f"\nQueueing delay of small messages during a {bulk_mb} MB bulk transfer on two 20 MB/s paths")
+    for separate_streams, label in ((False, "same stream (FIFO)"), (True, "separate streams")):
+        p50, p99 = small_message_latency(bulk_mb, small_messages, separate_streams)
+        print(f"{label:>20}: p50 {p50 * 1000:8.2f} ms | p99 {p99 * 1000:8.2f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Messages/sec and fairness of streams over one protocol.")
+    parser.add_argument('--concurrency', type=int, action='append', help="concurrent senders (repeatable)")
+    parser.add_argument('--messages', type=int, default=2000, help="messages per run, split across senders")
+    parser.add_argument('--message-size', type=int, default=1000)
+    parser.add_argument('--bulk-mb', type=int, default=20)
+    args = parser.parse_args()
+    benchmark_streams(concurrency=args.concurrency or (1, 8, 64), messages=args.messages,
+                      message_size=args.message_size, bulk_mb=args.bulk_mb)
@@ -0,0 +1,248 @@
+# benchmarks/benchmark_suite.py
+
+import argparse
+import csv
+import gc
+import itertools
+import json
+import os
+import platform
+import statistics
+import sys
+import threading
+import time
+import tracemalloc
+import fmp
+from fmp.core import FMPCore
+from fmp.protocol import FMPProtocol
+
+MB = 1_000_000
+MASTER_KEY = b'0' * 32
+# Cases are matched across runs on these fields
+CASE_FIELDS = ('mode', 'fragment_size', 'payload_size', 'paths', 'workers')
+FIELDS = CASE_FIELDS + ('repeat', 'mb_per_s', 'fragments_per_s', 'mean_ms', 'stdev_ms', 'p50_ms', 'p95_ms', 'p99_ms',
+                        'rss_bytes', 'alloc_peak_bytes')
+
+
+def measure(operation, warmup, repeat):
+    """
+    Run operation warmup times untimed, then repeat times timed. Returns durations in nanoseconds.
+    """
+    for _ in range(warmup):
+        operation()
+    samples = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter_ns()
+        operation()
+        samples.append(time.perf_counter_ns() - start)
+    return samples
+
+
+def peak_allocation(operation):
+    """
+    Peak bytes allocated by Python (all threads) during one traced run of operation.
+    Traced separately because tracemalloc slows everything it watches.
+    """
+    tracemalloc.start()
+    try:
+        operation()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def resident_bytes():
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        import resource
+        # Peak rather than current where /proc is unavailable; kilobytes on Linux, bytes on macOS
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return maxrss if sys.platform == 'darwin' else maxrss * 1024
+
+
+def percentile(ordered, fraction):
+    """
+    Nearest-rank percentile of already sorted samples.
+    """
+    rank = -(-round(fraction * 100) * len(ordered) // 100)
+    return ordered[min(len(ordered), max(1, rank)) - 1]
+
+
+class CoreCase:
+    """
+    Fragment, encrypt, decrypt and reassemble one payload in process.
+    """
+
+    def __init__(self, fragment_size, payload_size, workers):
+        self.core = FMPCore(fragment_size=fragment_size, master_key=MASTER_KEY, workers=workers)
+        self.data = os.urandom(payload_size)
+
+    def __call__(self):
+        if self.core.decrypt_and_reassemble(self.core.fragment_and_encrypt(self.data)) != self.data:
+            raise RuntimeError("Reassembled payload does not match.")
+
+    def close(self):
+        self.core.close()
+
+
+class LoopbackCase:
+    """
+    Send one payload across local UDP paths with reliable delivery and wait until the
+    listening receiver has reassembled it.
+    """
+
+    def __init__(self, fragment_size, payload_size, paths, workers, timeout=60.0):
+        self.data = os.urandom(payload_size)
+        self.timeout = timeout
+        self.arrived = threading.Event()
+        self.receiver = FMPProtocol(fragment_size=fragment_size, paths=[], master_key=MASTER_KEY,
+                                    probe_interval=None, workers=workers)
+        bound = self.receiver.listen([('127.0.0.1', 0)] * paths, self._on_message)
+        self.sender = FMPProtocol(fragment_size=fragment_size, paths=bound, master_key=MASTER_KEY,
+                                  probe_interval=None, workers=workers, reliable=True)
+
+    def _on_message(self, data):
+        self.arrived.set()
+
+    def __call__(self):
+        self.arrived.clear()
+        self.sender.send_data(self.data)
+        if not self.arrived.wait(self.timeout):
+            raise RuntimeError(f"Payload not delivered within {self.timeout} seconds.")
+
+    def close(self):
+        self.sender.flush(timeout=5)
+        self.sender.close()
+        self.receiver.close()
+
+
+def cases(modes, fragment_sizes, payload_sizes, path_counts, worker_counts):
+    for mode in modes:
+        for fragment_size, payload_size, workers in itertools.product(fragment_sizes, payload_sizes, worker_counts):
+            if mode == 'core':
+                yield {'mode': mode, 'fragment_size': fragment_size, 'payload_size': payload_size, 'paths': 0,
+                       'workers': workers}
+            else:
+                for paths in path_counts:
+                    yield {'mode': mode, 'fragment_size': fragment_size, 'payload_size': payload_size,
+                           'paths': paths, 'workers': workers}
+
+
+def run_case(case, warmup, repeat):
+    if case['mode'] == 'core':
+        operation = CoreCase(case['fragment_size'], case['payload_size'], case['workers'])
+    else:
+        operation = LoopbackCase(case['fragment_size'], case['payload_size'], case['paths'], case['workers'])
+    try:
+        samples = sorted(measure(operation, warmup, repeat))
+        alloc_peak = peak_allocation(operation)
+        rss = resident_bytes()
+    finally:
+        operation.close()
+    median = statistics.median(samples) / 1e9
+    fragments = -(-case['payload_size'] // case['fragment_size'])
+    return dict(case,
+                repeat=repeat,
+                mb_per_s=round(case['payload_size'] / median / MB, 3),
+                fragments_per_s=round(fragments / median, 1),
+                mean_ms=round(statistics.mean(samples) / 1e6, 4),
+                stdev_ms=round(statistics.stdev(samples) / 1e6, 4) if len(samples) > 1 else 0.0,
+                p50_ms=round(percentile(samples, 0.50) / 1e6, 4),
+                p95_ms=round(percentile(samples, 0.95) / 1e6, 4),
+                p99_ms=round(percentile(samples, 0.99) / 1e6, 4),
+                rss_bytes=rss,
+                alloc_peak_bytes=alloc_peak)
+
+
+def environment(warmup, repeat):
+    return {
+        'fmp_version': fmp.__version__,
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'warmup': warmup,
+        'repeat': repeat,
+    }
+
+
+def write_json(path, meta, results):
+    with open(path, 'w') as output:
+        json.dump({'meta': meta, 'results': results}, output, indent=2)
+
+
+def write_csv(path, results):
+    with open(path, 'w', newline='') as output:
+        writer = csv.DictWriter(output, fieldnames=FIELDS)
+        writer.writeheader()
+        writer.writerows(results)
+
+
+def compare(baseline_path, results, tolerance):
+    """
+    Print cases whose median throughput fell more than tolerance below a baseline JSON run.
+    Returns the number of regressions.
+    """
+    with open(baseline_path) as source:
+        baseline = {tuple(row[field] for field in CASE_FIELDS): row for row in json.load(source)['results']}
+    regressions = 0
+    for row in results:
+        previous = baseline.get(tuple(row[field] for field in CASE_FIELDS))
+        if previous is None:
+            continue
+        change = row['mb_per_s'] / previous['mb_per_s'] - 1
+        if change < -tolerance:
+            regressions += 1
+            print(f"REGRESSION {_label(row)}: {previous['mb_per_s']:.1f} -> {row['mb_per_s']:.1f} MB/s ({change:+.1%})")
+    return regressions
+
+
+def _label(row):
+    paths = f" | {row['paths']} paths" if row['paths'] else ""
+    return (f"[{row['mode']} | fragment {row['fragment_size']} | payload {row['payload_size']}{paths} | "
+            f"workers {row['workers']}]")
+
+
+def benchmark_suite(modes=('core', 'loopback'), fragment_sizes=(1024, 8192), payload_sizes=(100_000, 1_000_000),
+                    path_counts=(1, 2), worker_counts=(1, 4), warmup=1, repeat=5):
+    """
+    Run every case of the grid and print one line per case. Returns the result rows.
+    """
+    results = []
+    for case in cases(modes, fragment_sizes, payload_sizes, path_counts, worker_counts):
+        row = run_case(case, warmup, repeat)
+        results.append(row)
+        print(f"{_label(row)} {row['mb_per_s']:.1f} MB/s | {row['fragments_per_s']:.0f} fragments/s | "
+              f"p50 {row['p50_ms']:.2f} ms | p95 {row['p95_ms']:.2f} ms | p99 {row['p99_ms']:.2f} ms | "
+              f"RSS {row['rss_bytes'] / MB:.1f} MB | alloc peak {row['alloc_peak_bytes'] / MB:.1f} MB")
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="FMP benchmark suite: fragment size x payload size x path count "
+                                                 "x workers, with warmup, repetitions and JSON/CSV output.")
+    parser.add_argument('--mode', nargs='+', choices=['core', 'loopback'], default=['core', 'loopback'])
+    parser.add_argument('--fragment-sizes', nargs='+', type=int, default=[1024, 8192])
+    parser.add_argument('--payload-sizes', nargs='+', type=int, default=[100_000, 1_000_000])
+    parser.add_argument('--paths', nargs='+', type=int, default=[1, 2])
+    parser.add_argument('--workers', nargs='+', type=int, default=[1, 4])
+    parser.add_argument('--warmup', type=int, default=1)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--json', help="write results and environment to this JSON file")
+    parser.add_argument('--csv', help="write results to this CSV file")
+    parser.add_argument('--baseline', help="JSON file from an earlier run to check for regressions")
+    parser.add_argument('--tolerance', type=float, default=0.10,
+                        help="allowed fractional throughput drop against the baseline")
+    args = parser.parse_args()
+
+    results = benchmark_suite(args.mode, args.fragment_sizes, args.payload_sizes, args.paths, args.workers,
+                              args.warmup, args.repeat)
+    if args.json:
+        write_json(args.json, environment(args.warmup, args.repeat), results)
+    if args.csv:
+        write_csv(args.csv, results)
+    if args.baseline and compare(args.baseline, results, args.tolerance):
+        sys.exit(1)
@@ -1,3 +1,9 @@
 # fmp/__init__.py
 
+import logging
+
 __version__ = '0.1.0'
+
+# Never configure logging on import: without a handler from the application,
+# records from the fmp.* loggers are discarded instead of reaching the lastResort handler
+logging.getLogger(__name__).addHandler(logging.NullHandler())
@@ -0,0 +1,281 @@
+# fmp/async_protocol.py
+
+import asyncio
+import socket
+import logging
+import secrets
+from fmp.core import FMPCore
+from fmp.ciphers import AES_GCM, SUITES
+from fmp.reassembly import Reassembler, DEFAULT_TIMEOUT, DEFAULT_MAX_BYTES
+from fmp.scheduler import WeightedRoundRobinScheduler
+from fmp.transport import FRAME_HEADER, TRANSPORTS, is_probe
+from fmp.sizing import AUTO, AUTO_INITIAL_SIZE, FragmentSizer
+
+# Handlers and levels are left to the application; see fmp/__init__.py
+logger = logging.getLogger(__name__)
+
+# Payloads at least this large are encrypted on an executor instead of the event loop
+OFFLOAD_THRESHOLD = 64 * 1024
+# A path that failed a send is retried after this many seconds, doubling per consecutive
+# failure up to the maximum
+RETRY_INITIAL = 0.5
+RETRY_MAX = 30.0
+
+
+class _DatagramReceiver(asyncio.DatagramProtocol):
+    """
+    Queue every datagram received on a listening path; drop when the queue is full.
+    Probe datagrams are echoed back so senders can measure the path.
+    """
+
+    def __init__(self, incoming, path):
+        self.incoming = incoming
+        self.path = path
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        if is_probe(data):
+            self.transport.sendto(data, addr)
+            return
+        try:
+            self.incoming.put_nowait((data, self.path))
+        except asyncio.QueueFull:
+            logger.warning(f"Receive queue full; dropped fragment on {self.path}.")
+
+
+async def _resolve(path):
+    """
+    Resolve a (host, port) path to a UDP sockaddr without blocking the event loop.
+    """
+    host, port = path
+    infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_DGRAM)
+    return infos[0][4]
+
+
+class AsyncFMPProtocol:
+    def __init__(self, fragment_size=100, paths=None, master_key=None, nonce_generator=None, transport='udp',
+                 offload_threshold=OFFLOAD_THRESHOLD, executor=None, receive_queue_size=4096, scheduler=None,
+                 reassembly_timeout=DEFAULT_TIMEOUT, max_reassembly_bytes=DEFAULT_MAX_BYTES, fec=None,
+                 compression=None, cipher=AES_GCM, ciphers=tuple(SUITES)):
+        """
+        Initialize AsyncFMPProtocol with FMPCore and asyncio transports.
+        Path connections are opened lazily on the running event loop and shared by
+        every concurrent send_data call. AEAD work for payloads of at least
+        offload_threshold bytes runs on executor (the loop's default when None), as does
+        reassembly of messages that large, so neither blocks the loop.
+        A path that fails a send is skipped and retried after a backoff (RETRY_INITIAL
+        seconds, doubling per consecutive failure up to RETRY_MAX).
+        scheduler stripes fragments across paths, as in Router.
+        paths, fragment_size='auto', reassembly_timeout, max_reassembly_bytes, fec, compression, cipher
+        and ciphers behave as in FMPProtocol.
+        """
+        if transport not in TRANSPORTS:
+            raise ValueError(f"Unknown transport: {transport}")
+        if paths is None:
+            paths = [('localhost', 8001), ('localhost', 8002)]
+        master_key = master_key or secrets.token_bytes(32)
+        self.sizer = FragmentSizer() if fragment_size == AUTO else None
+        self.core = FMPCore(
+            fragment_size=AUTO_INITIAL_SIZE if self.sizer else fragment_size,
+            master_key=master_key,
+            nonce_generator=nonce_generator,
+            fec=fec,
+            compression=compression,
+            cipher=cipher,
+            ciphers=ciphers
+        )
+        self.paths = {path: {'latency': float('inf'), 'score': 1.0, 'active': True, 'failures': 0}
+                      for path in paths}
+        self.transport = transport
+        self.scheduler = scheduler or WeightedRoundRobinScheduler()
+        self.offload_threshold = offload_threshold
+        self.executor = executor
+        self.connections = {}
+        self._connecting = {}
+        self.servers = []
+        self.incoming = asyncio.Queue(maxsize=receive_queue_size)
+        self.reassembler = Reassembler(self.core, timeout=reassembly_timeout, max_bytes=max_reassembly_bytes)
+        logger.debug("Initialized AsyncFMPProtocol.")
+
+    async def _run(self, func, *args, size=0):
+        """
+        Run CPU-bound core work inline when small, otherwise on the executor.
+        """
+        if size < self.offload_threshold:
+            return func(*args)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, func, *args)
+
+    async def send_data(self, data):
+        """
+        Fragment, encrypt, and send data over the active paths. A fragment whose send
+        fails is sent again on another path. Raises ConnectionError when no path is left
+        to carry the message.
+        """
+        args = (data,) if self.sizer is None else (data, await self._fragment_size())
+        encrypted_fragments = await self._run(self.core.fragment_and_encrypt, *args, size=len(data))
+        logger.debug("Sending %d encrypted fragments.", len(encrypted_fragments))
+        for fragment in encrypted_fragments:
+            while True:
+                self._readmit()
+                path = self.scheduler.select(self.paths)
+                if path is None:
+                    logger.error("No active paths available to send fragment.")
+                    raise ConnectionError("No active paths available to send fragment.")
+                try:
+                    await self._send(fragment, path)
+                except OSError as e:
+                    logger.error(f"Failed to send fragment via {path}: {e}")
+                    await self._fail_path(path)
+                    continue
+                self.paths[path]['failures'] = 0
+                break
+
+    async def _fail_path(self, path):
+        """
+        Take a path out of rotation until its retry time.
+        """
+        metrics = self.paths[path]
+        metrics['failures'] += 1
+        metrics['active'] = False
+        metrics['retry_at'] = (asyncio.get_running_loop().time() +
+                               min(RETRY_MAX, RETRY_INITIAL * 2 ** (metrics['failures'] - 1)))
+        await self._close_path(path)
+
+    def _readmit(self):
+        """
+        Put failed paths whose retry time has come back in rotation; the next send tells
+        whether they work again.
+        """
+        now = asyncio.get_running_loop().time()
+        for metrics in self.paths.values():
+            if not metrics['active'] and metrics.get('retry_at', 0.0) <= now:
+                metrics['active'] = True
+
+    async def _fragment_size(self):
+        """
+        Per-message fragment size in auto mode (see FragmentSizer). Path MTUs are looked
+        up once per path, on the executor, since the lookup resolves the host.
+        """
+        loop = asyncio.get_running_loop()
+        for path, metrics in self.paths.items():
+            if 'max_datagram' not in metrics:
+                metrics['max_datagram'] = await loop.run_in_executor(self.executor, self._max_datagram_size, path)
+        active = [metrics for metrics in self.paths.values() if metrics['active']]
+        return self.sizer.update(active or self.paths.values(), self.core.fragment_overhead)
+
+    def _max_datagram_size(self, path):
+        return TRANSPORTS[self.transport]().max_datagram_size(path)
+
+    async def _connection(self, path):
+        """
+        Return the pooled asyncio transport for a path, opening it once even under concurrent senders.
+        """
+        conn = self.connections.get(path)
+        if conn is None:
+            async with self._connecting.setdefault(path, asyncio.Lock()):
+                conn = self.connections.get(path)
+                if conn is None:
+                    conn = await self._open(path)
+                    self.connections[path] = conn
+        return conn
+
+    async def _open(self, path):
+        loop = asyncio.get_running_loop()
+        if self.transport == 'udp':
+            sockaddr = await _resolve(path)
+            conn, _ = await loop.create_datagram_endpoint(asyncio.DatagramProtocol, remote_addr=sockaddr[:2])
+            return conn
+        _, writer = await asyncio.open_connection(*path)
+        return writer
+
+    async def _send(self, fragment, path):
+        conn = await self._connection(path)
+        if self.transport == 'udp':
+            conn.sendto(fragment)
+            # Datagram transports never push back, so yield to keep the loop responsive
+            await asyncio.sleep(0)
+        else:
+            conn.write(FRAME_HEADER.pack(len(fragment)) + fragment)
+            await conn.drain()
+
+    async def _close_path(self, path):
+        conn = self.connections.pop(path, None)
+        if conn is None:
+            return
+        conn.close()
+        if self.transport == 'tcp':
+            try:
+                await conn.wait_closed()
+            except OSError:
+                pass
+
+    async def listen(self, paths):
+        """
+        Start receiving fragments on local (host, port) paths.
+        Returns the bound paths (useful with port 0).
+        """
+        loop = asyncio.get_running_loop()
+        bound = []
+        for path in paths:
+            if self.transport == 'udp':
+                sockaddr = await _resolve(path)
+                server, receiver = await loop.create_datagram_endpoint(
+                    lambda: _DatagramReceiver(self.incoming, None), local_addr=sockaddr[:2]
+                )
+                local = server.get_extra_info('sockname')[:2]
+                receiver.path = local
+            else:
+                server = await asyncio.start_server(self._handle_stream, *path)
+                local = server.sockets[0].getsockname()[:2]
+            self.servers.append(server)
+            bound.append(local)
+        logger.debug(f"Listening for {self.transport} fragments on {bound}.")
+        return bound
+
+    async def _handle_stream(self, reader, writer):
+        path = writer.get_extra_info('sockname')[:2]
+        try:
+            while True:
+                header = await reader.readexactly(FRAME_HEADER.size)
+                (length,) = FRAME_HEADER.unpack(header)
+                fragment = await reader.readexactly(length)
+                await self.incoming.put((fragment, path))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def messages(self):
+        """
+        Async iterator yielding reassembled messages as their last fragment arrives.
+        Fragments of concurrent messages may arrive interleaved and in any order.
+        """
+        while True:
+            encrypted, path = await self.incoming.get()
+            try:
+                # Offload by the size of the whole message, so the fragment completing a large
+                # message is not inflated and copied on the loop
+                header = self.core.parse_fragment(encrypted)
+                size = (header.total or header.index + 1) * header.payload_length
+                message = await self._run(self.reassembler.add, encrypted, size=size)
+            except Exception as e:
+                logger.error(f"Dropped malformed fragment from {path}: {e}")
+                continue
+            if message is not None:
+                yield message
+
+    async def close(self):
+        """
+        Close every path connection and listening server.
+        """
+        for path in list(self.connections):
+            await self._close_path(path)
+        for server in self.servers:
+            server.close()
+            if isinstance(server, asyncio.AbstractServer):
+                await server.wait_closed()
+        self.servers.clear()
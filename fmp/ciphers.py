@@ -0,0 +1,80 @@
+# fmp/ciphers.py
+
+import time
+import logging
+import functools
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM, ChaCha20Poly1305
+
+# Handlers and levels are left to the application; see fmp/__init__.py
+logger = logging.getLogger(__name__)
+
+# AEAD cipher suites. Both take 32-byte keys and 12-byte nonces and add a 16-byte tag,
+# so fragments have the same layout whichever suite encrypted them.
+AES_GCM = 'aes-gcm'
+CHACHA20_POLY1305 = 'chacha20-poly1305'
+AUTO = 'auto'
+SUITES = {
+    AES_GCM: AESGCM,
+    CHACHA20_POLY1305: ChaCha20Poly1305,
+}
+
+# AEAD contexts shared by every FMPCore, keyed by suite and key
+CONTEXT_CACHE_SIZE = 1024
+
+# The startup benchmark encrypts this many bytes per round, a few times per suite
+BENCHMARK_SIZE = 8192
+BENCHMARK_ROUNDS = 32
+BENCHMARK_REPEAT = 3
+
+
+def check_suites(suites):
+    """
+    Return suites as a tuple, raising ValueError for unknown or missing suite names.
+    """
+    suites = tuple(suites)
+    unknown = [suite for suite in suites if suite not in SUITES]
+    if unknown or not suites:
+        raise ValueError(f"Cipher suites must be among {', '.join(SUITES)}; got {', '.join(unknown) or 'none'}.")
+    return suites
+
+
+@functools.lru_cache(maxsize=CONTEXT_CACHE_SIZE)
+def aead_context(suite, key):
+    """
+    Return the AEAD context of a suite for a key, built once and shared by every caller
+    with the same key. Contexts only hold the key schedule, so sharing them across
+    threads is safe.
+    """
+    return SUITES[suite](key)
+
+
+def _encrypt_time(suite):
+    aead = SUITES[suite](bytes(32))
+    nonce = bytes(12)
+    data = bytes(BENCHMARK_SIZE)
+    best = None
+    for _ in range(BENCHMARK_REPEAT):
+        start = time.perf_counter()
+        for _ in range(BENCHMARK_ROUNDS):
+            aead.encrypt(nonce, data, None)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+@functools.lru_cache(maxsize=None)
+def fastest_suite(suites=tuple(SUITES)):
+    """
+    Return the suite among suites that encrypts fastest on this host, measured once per
+    process with a short benchmark (about a millisecond with AES-NI). Hosts without AES
+    instructions run ChaCha20-Poly1305 several times faster than AES-GCM.
+    """
+    suites = check_suites(suites)
+    if len(suites) == 1:
+        return suites[0]
+    times = {suite: _encrypt_time(suite) for suite in suites}
+    fastest = min(times, key=times.get)
+    logger.info("Selected cipher suite %s (%s).", fastest,
+                ", ".join(f"{suite} {BENCHMARK_SIZE * BENCHMARK_ROUNDS / seconds / 1e6:.0f} MB/s"
+                          for suite, seconds in times.items()))
+    return fastest
@@ -1,122 +1,724 @@
 # fmp/core.py
 
-import msgpack
+import time
+import zlib
+import struct
 import secrets
+import itertools
+import functools
 import logging
-from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from fmp.fec import (PARITY_HEADER, validate_code, encode_parity, recover_missing, pack_parity, unpack_parity,
+                     block_span)
+from fmp.metrics import REGISTRY
+from fmp.ciphers import AES_GCM, CHACHA20_POLY1305, AUTO, SUITES, check_suites, aead_context, fastest_suite
 
-# Configure logging
+# Handlers and levels are left to the application; see fmp/__init__.py
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.DEBUG)  # Set to DEBUG for detailed logs
-handler = logging.StreamHandler()
-formatter = logging.Formatter('[%(asctime)s] %(levelname)s - %(message)s')
-handler.setFormatter(formatter)
-logger.addHandler(handler)
+
+# Fixed-width fragment header, sent in the clear and authenticated as AEAD associated data:
+# version, flags, stream id, message id, fragment index, total fragments (0 while a stream is open),
+# payload length. Version 2 added the stream id.
+FRAGMENT_HEADER = struct.Struct('!BBHIIIH')
+HEADER_VERSION = 2
+HEADER_SIZE = FRAGMENT_HEADER.size
+FLAG_LAST = 0x01
+FLAG_SESSION = 0x02
+FLAG_PARITY = 0x04  # FEC parity fragment; index is the block number within the message
+FLAG_COMPRESSED = 0x08  # The message was zlib-compressed before fragmentation
+FLAG_CHACHA20 = 0x10  # Encrypted with ChaCha20-Poly1305 instead of AES-GCM
+FLAG_RELIABLE = 0x20  # The sender retransmits what is not acknowledged; receivers answer with SACKs
+MAX_FRAGMENT_SIZE = 0xFFFF
+MAX_STREAM_ID = 0xFFFF
+NONCE_SIZE = 12
+TAG_SIZE = 16
+
+# Session mode: nonce = session id (8 bytes) + per-session fragment counter (4 bytes).
+# The session id also salts the HKDF derivation of the session key from the master key.
+SESSION_ID_SIZE = 8
+SESSION_INFO = b'fmp session key v1'
+CHACHA20_SESSION_INFO = b'fmp chacha20-poly1305 session key v1'
+SESSION_CACHE_SIZE = 1024
+
+# Header flags and session key labels of the cipher suites; keys never cross suites
+SUITE_FLAGS = {AES_GCM: 0, CHACHA20_POLY1305: FLAG_CHACHA20}
+SUITE_SESSION_INFO = {AES_GCM: SESSION_INFO, CHACHA20_POLY1305: CHACHA20_SESSION_INFO}
+
+# Compression: smaller messages are sent as they are; larger ones are compressed only when
+# a sample taken from COMPRESSION_SLICES places shrinks to COMPRESSION_THRESHOLD of its size
+MIN_COMPRESS_SIZE = 512
+COMPRESSION_SAMPLE = 4096
+COMPRESSION_SLICES = 4
+COMPRESSION_THRESHOLD = 0.9
+# Receivers refuse to inflate a message beyond this, so a small message cannot expand without bound
+MAX_DECOMPRESSED_SIZE = 1024 * 1024 * 1024
+
+# Parallel mode only pays off once a payload spans many fragments
+PARALLEL_THRESHOLD = 1024 * 1024
+PARALLEL_BATCH = 256
+
+# Errors list this many missing fragment indices at most
+MISSING_SHOWN = 8
+
+FragmentHeader = namedtuple('FragmentHeader', 'version flags stream_id message_id index total payload_length')
+
+
+def _missing_fragments(count, indices):
+    """
+    Describe count missing fragments by the first few of indices (any iterable, read lazily).
+    """
+    shown = [str(index) for index in itertools.islice(indices, MISSING_SHOWN)]
+    return f"Missing fragments: {count} ({', '.join(shown)}{', ...' if count > len(shown) else ''})"
+
+
+def derive_session_key(master_key, session_id, info=SESSION_INFO):
+    """
+    Derive the per-transfer 256-bit key for a session from the master key with HKDF-SHA256.
+    info labels the cipher suite the key is for.
+    """
+    return HKDF(algorithm=hashes.SHA256(), length=32, salt=session_id, info=info).derive(master_key)
+
+
+@functools.lru_cache(maxsize=SESSION_CACHE_SIZE)
+def _session_context(suite, master_key, session_id):
+    """
+    AEAD context of a session seen by a receiver, shared by every FMPCore with the same master key.
+    """
+    return SUITES[suite](derive_session_key(master_key, session_id, SUITE_SESSION_INFO[suite]))
+
+
+class _Session:
+    """
+    AEAD context, nonce source, header flags and stream id used to encrypt one message.
+    """
+    __slots__ = ('aead', 'next_nonce', 'flags', 'stream_id')
+
+    def __init__(self, aead, next_nonce, flags, stream_id=0):
+        self.aead = aead
+        self.next_nonce = next_nonce
+        self.flags = flags
+        self.stream_id = stream_id
+
+    @classmethod
+    def derive(cls, master_key, suite=AES_GCM):
+        """
+        Start a new session: a fresh random id, its derived key for suite and a counter nonce.
+        """
+        session_id = secrets.token_bytes(SESSION_ID_SIZE)
+        counter = itertools.count()
+
+        def next_nonce():
+            value = next(counter)
+            if value > 0xFFFFFFFF:
+                raise ValueError("Session nonce counter exhausted.")
+            return session_id + value.to_bytes(4, 'big')
+
+        aead = SUITES[suite](derive_session_key(master_key, session_id, SUITE_SESSION_INFO[suite]))
+        return cls(aead, next_nonce, FLAG_SESSION | SUITE_FLAGS[suite])
+
+
+# Older cryptography releases lack the *_into variants; fall back to one extra copy there
+_AEAD_INTO = all(hasattr(aead, 'encrypt_into') for aead in SUITES.values())
+
 
 class FMPCore:
-    def __init__(self, fragment_size=100, master_key=None, nonce_generator=None):
+    def __init__(self, fragment_size=100, master_key=None, nonce_generator=None, workers=None,
+                 parallel_threshold=PARALLEL_THRESHOLD, fec=None, metrics=None, compression=None, cipher=AES_GCM,
+                 ciphers=tuple(SUITES), reliable=False):
         """
         Initialize FMPCore with fragment size, master key, and nonce generator.
+        Without a nonce_generator, FMPCore runs in session mode: each message is encrypted
+        under its own key derived from master_key with HKDF, using counter nonces, so no
+        per-fragment randomness is needed and nonces cannot repeat. A nonce_generator
+        switches to encrypting directly under master_key with the supplied nonces.
+        With workers > 1, payloads of at least parallel_threshold bytes are encrypted and
+        decrypted in batches on a thread pool (AES-GCM releases the GIL). Nonces are still
+        drawn in fragment order on the calling thread, so output is deterministic.
+        fec=(n, k) adds k Reed-Solomon parity fragments after every block of n data
+        fragments of fragment_and_encrypt, so receivers rebuild a block that lost up to
+        k of its fragments without a retransmission. Streams are sent without parity.
+        compression=level (1-9) zlib-compresses each message of fragment_and_encrypt
+        before fragmentation, unless it is small or a quick sample shows it does not
+        shrink. FLAG_COMPRESSED tells receivers, so they need no configuration.
+        Streams are sent uncompressed.
+        cipher is the AEAD suite fragments are encrypted with: 'aes-gcm',
+        'chacha20-poly1305' (faster on hosts without AES instructions) or 'auto', which
+        picks the faster of ciphers on this host (see fmp.ciphers.fastest_suite).
+        ciphers are the suites this side allows: the choices for 'auto', and the only
+        suites accepted from peers. FLAG_CHACHA20 tells receivers which suite to use.
+        AEAD contexts are cached by suite and key and shared by every FMPCore.
+        reliable=True sets FLAG_RELIABLE on every fragment, asking receivers for selective
+        acknowledgements (see fmp.reliability).
+        metrics is the Registry fragment counters and stage timings are recorded in
+        (fmp.metrics.REGISTRY by default).
         """
-        self.fragment_size = fragment_size
+        if fec is not None:
+            validate_code(*fec)
+        if compression is not None and not 1 <= compression <= 9:
+            raise ValueError("Compression level must be between 1 and 9.")
+        self.fec = fec
+        self.compression = compression
+        self.reliable = reliable
+        self.fragment_size = self._check_fragment_size(fragment_size)
         self.master_key = master_key or secrets.token_bytes(32)  # 256-bit key
-        self.aesgcm = AESGCM(self.master_key)
-        self.nonce_generator = nonce_generator or (lambda: secrets.token_bytes(12))
-        # Note: Nonce will be generated per fragment to ensure uniqueness
+        self.ciphers = check_suites(ciphers)
+        if cipher == AUTO:
+            cipher = fastest_suite(self.ciphers)
+        elif cipher not in self.ciphers:
+            raise ValueError(f"Cipher suite {cipher} is not among the allowed suites {', '.join(self.ciphers)}.")
+        self.cipher = cipher
+        self.aead = aead_context(cipher, self.master_key)
+        self.nonce_generator = nonce_generator
+        # Message ids only need to be distinct among messages in flight; count from a random start
+        self._message_ids = itertools.count(secrets.randbits(32))
+        self.workers = workers
+        self.parallel_threshold = parallel_threshold
+        self._executor = None
+        self.metrics = metrics or REGISTRY
+        self._encrypted = self.metrics.counter('fmp_fragments_encrypted_total', "Fragments encrypted.")
+        self._decrypted = self.metrics.counter('fmp_fragments_decrypted_total', "Fragments decrypted and authenticated.")
+        self._auth_failures = self.metrics.counter('fmp_auth_failures_total',
+                                                   "Fragments rejected by AEAD authentication.")
+        stages = self.metrics.histogram('fmp_stage_seconds', "Time spent per message in each pipeline stage.",
+                                        ('stage',))
+        self._compressed = self.metrics.counter('fmp_messages_compressed_total', "Messages sent compressed.")
+        self._compression_skipped = self.metrics.counter(
+            'fmp_compression_skipped_total', "Messages sent uncompressed because a sample did not shrink.")
+        self._encrypt_seconds = stages.labels('encrypt')
+        self._reassemble_seconds = stages.labels('reassemble')
 
-    def fragment_and_encrypt(self, data):
+    def _check_fragment_size(self, fragment_size):
+        if not 0 < fragment_size <= MAX_FRAGMENT_SIZE:
+            raise ValueError(f"Fragment size must be between 1 and {MAX_FRAGMENT_SIZE} bytes.")
+        if self.fec is not None and fragment_size + PARITY_HEADER.size > MAX_FRAGMENT_SIZE:
+            raise ValueError(f"Fragment size plus the parity prefix must not exceed {MAX_FRAGMENT_SIZE} bytes.")
+        return fragment_size
+
+    @property
+    def fragment_overhead(self):
+        """
+        Bytes an encrypted fragment adds to its payload, counting the parity prefix when FEC is on.
+        """
+        return HEADER_SIZE + NONCE_SIZE + TAG_SIZE + (PARITY_HEADER.size if self.fec is not None else 0)
+
+    def _parallel(self, size):
+        """
+        Return the thread pool when a payload of this size should be processed in parallel.
+        """
+        if not self.workers or self.workers < 2 or size < self.parallel_threshold:
+            return None
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='fmp-core')
+        return self._executor
+
+    def close(self):
+        """
+        Shut down the parallel worker pool, if one was started.
+        """
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def _next_message_id(self):
+        return next(self._message_ids) & 0xFFFFFFFF
+
+    def _new_session(self, stream_id):
+        """
+        Return the encryption context for a new message on a stream.
+        """
+        if not 0 <= stream_id <= MAX_STREAM_ID:
+            raise ValueError(f"Stream id must be between 0 and {MAX_STREAM_ID}.")
+        if self.nonce_generator is None:
+            session = _Session.derive(self.master_key, self.cipher)
+        else:
+            session = _Session(self.aead, self.nonce_generator, SUITE_FLAGS[self.cipher])
+        session.stream_id = stream_id
+        if self.reliable:
+            session.flags |= FLAG_RELIABLE
+        return session
+
+    def fragment_and_encrypt(self, data, fragment_size=None, stream_id=0):
         """
         Fragment the data and encrypt each fragment.
+        fragment_size overrides the configured size for this message; receivers learn
+        the size of every message from its headers.
+        stream_id tags every fragment with the stream the message belongs to.
         """
+        fragment_size = self.fragment_size if fragment_size is None else self._check_fragment_size(fragment_size)
         if not data:
             logger.debug("No data to fragment and encrypt. Returning empty list.")
             return []
 
-        # Fragment data
-        fragments = [
-            data[i:i+self.fragment_size] for i in range(0, len(data), self.fragment_size)
-        ]
-        encrypted_fragments = [
-            self._encrypt_fragment(frag, i, len(fragments)) for i, frag in enumerate(fragments)
-        ]
-        logger.debug(f"Fragmented data into {len(fragments)} fragments.")
+        started = time.perf_counter()
+        # Fragment data as zero-copy views; any buffer (bytes, bytearray, mmap) works
+        view = memoryview(data)
+        session = self._new_session(stream_id)
+        compressed = self._compress(view)
+        if compressed is not None:
+            view = memoryview(compressed)
+            session.flags |= FLAG_COMPRESSED
+        total = -(-len(view) // fragment_size)
+        message_id = self._next_message_id()
+        executor = self._parallel(len(view))
+        if executor is None:
+            encrypted_fragments = [
+                self._encrypt_fragment(view[i * fragment_size:(i + 1) * fragment_size],
+                                       message_id, i, total, session)
+                for i in range(total)
+            ]
+        else:
+            nonces = [session.next_nonce() for _ in range(total)]
+
+            def encrypt_batch(start):
+                return [
+                    self._encrypt_fragment(view[i * fragment_size:(i + 1) * fragment_size],
+                                           message_id, i, total, session, nonces[i])
+                    for i in range(start, min(start + PARALLEL_BATCH, total))
+                ]
+
+            encrypted_fragments = []
+            for batch in executor.map(encrypt_batch, range(0, total, PARALLEL_BATCH)):
+                encrypted_fragments.extend(batch)
+        if self.fec is not None:
+            encrypted_fragments = self._add_parity(encrypted_fragments, view, message_id, total, session,
+                                                   fragment_size)
+        self._encrypted.inc(len(encrypted_fragments))
+        self._encrypt_seconds.observe(time.perf_counter() - started)
+        logger.debug("Encrypted message %08x: %d bytes in %d fragments.", message_id, len(view), total)
         return encrypted_fragments
 
-    def _encrypt_fragment(self, fragment, index, total):
-        """
-        Encrypt a single fragment with metadata.
-        Structure: nonce (12 bytes) + ciphertext
-        """
-        metadata = {'id': index, 'total': total}
-        packed_metadata = msgpack.packb(metadata)
-        metadata_length = len(packed_metadata)
-        
-        if metadata_length > 65535:
-            raise ValueError("Metadata too large to encode in 2 bytes.")
-        
-        # Pack metadata length as 2-byte unsigned integer (big endian)
-        metadata_length_bytes = metadata_length.to_bytes(2, 'big')
-        
-        nonce = self.nonce_generator()
-        plaintext = metadata_length_bytes + packed_metadata + fragment
-        ciphertext = self.aesgcm.encrypt(nonce, plaintext, None)
-        logger.debug(f"Encrypted fragment {index} with nonce {nonce.hex()}.")
-        # Prepend nonce to ciphertext for decryption
-        return nonce + ciphertext
+    def _compress(self, view):
+        """
+        Return the compressed message, or None when compression is off, the message is
+        small, or it would not shrink enough to pay for the time spent.
+        Large messages are judged from a sample first, so incompressible data costs
+        only the sample's compression.
+        """
+        if self.compression is None or len(view) < MIN_COMPRESS_SIZE:
+            return None
+        if len(view) > COMPRESSION_SAMPLE:
+            step = len(view) // COMPRESSION_SLICES
+            width = COMPRESSION_SAMPLE // COMPRESSION_SLICES
+            sample = b''.join(view[i * step:i * step + width] for i in range(COMPRESSION_SLICES))
+            if len(zlib.compress(sample, self.compression)) > COMPRESSION_THRESHOLD * len(sample):
+                self._compression_skipped.inc()
+                return None
+        compressed = zlib.compress(view, self.compression)
+        if len(compressed) > COMPRESSION_THRESHOLD * len(view):
+            self._compression_skipped.inc()
+            return None
+        self._compressed.inc()
+        return compressed
+
+    def decompress(self, data, max_size=MAX_DECOMPRESSED_SIZE):
+        """
+        Inflate the reassembled payload of a FLAG_COMPRESSED message.
+        Raises ValueError for corrupt data or output larger than max_size bytes.
+        """
+        inflater = zlib.decompressobj()
+        try:
+            inflated = inflater.decompress(data, max_size)
+        except zlib.error as e:
+            raise ValueError(f"Corrupt compressed message: {e}")
+        if inflater.unconsumed_tail:
+            raise ValueError(f"Compressed message inflates beyond {max_size} bytes.")
+        if not inflater.eof:
+            raise ValueError("Truncated compressed message.")
+        return inflated
+
+    def _add_parity(self, encrypted_fragments, view, message_id, total, session, fragment_size):
+        """
+        Encode parity for every block of data fragments and place each block's parity
+        fragments right after its data, so striping spreads a block across the paths.
+        """
+        block_size, parity = self.fec
+        with_parity = []
+        for block, start in enumerate(range(0, total, block_size)):
+            end = min(start + block_size, total)
+            data = [view[i * fragment_size:(i + 1) * fragment_size] for i in range(start, end)]
+            with_parity.extend(encrypted_fragments[start:end])
+            for row, parity_data in enumerate(encode_parity(data, parity, block_size)):
+                payload = pack_parity(block_size, parity, row, len(data[-1]), parity_data)
+                with_parity.append(self._encrypt_fragment(payload, message_id, block, total, session, flags=FLAG_PARITY))
+        return with_parity
+
+    def encrypt_stream(self, source, fragment_size=None, stream_id=0):
+        """
+        Read data from a file-like object or an iterable of byte chunks and yield
+        encrypted fragments as they are produced, fragment_size bytes each (by default
+        the configured size), tagged with stream_id.
+        The stream length is unknown up front, so every fragment carries total=0
+        except the last, which carries the real total.
+        """
+        fragment_size = self.fragment_size if fragment_size is None else self._check_fragment_size(fragment_size)
+        session = self._new_session(stream_id)
+        message_id = self._next_message_id()
+        previous = None
+        index = 0
+        for chunk in self._read_fragments(source, fragment_size):
+            if previous is not None:
+                yield self._encrypt_fragment(previous, message_id, index, 0, session)
+                self._encrypted.inc()
+                index += 1
+            previous = chunk
+        if previous is not None:
+            yield self._encrypt_fragment(previous, message_id, index, index + 1, session)
+            self._encrypted.inc()
+            logger.debug("Encrypted stream %08x in %d fragments.", message_id, index + 1)
+
+    def encrypt_fragments(self, payloads, total, stream_id=0, message_id=None, flags=0):
+        """
+        Encrypt (index, payload) pairs of one message of total fragments and yield the
+        encrypted fragments as they are produced, tagged with stream_id. Payloads may be
+        any buffers, e.g. views of a memory-mapped file, and any subset of the message's
+        fragments, e.g. those a receiver is missing. Nothing is compressed or protected
+        by parity, since the payloads are encrypted where they lie.
+        message_id continues an earlier message instead of starting a new one, and flags
+        adds header flags such as FLAG_COMPRESSED.
+        """
+        session = self._new_session(stream_id)
+        session.flags |= flags
+        message_id = self._next_message_id() if message_id is None else message_id
+        count = 0
+        for index, payload in payloads:
+            if not 0 <= index < total:
+                raise ValueError(f"Fragment index {index} is outside a message of {total} fragments.")
+            yield self._encrypt_fragment(payload, message_id, index, total, session)
+            self._encrypted.inc()
+            count += 1
+        logger.debug("Encrypted %d of %d fragments of message %08x.", count, total, message_id)
+
+    def encrypt_missing(self, data, message_id, fragment_size, indices, stream_id=0):
+        """
+        Encrypt again the fragments at indices of a message sent earlier with
+        fragment_and_encrypt, under its message id and fragment size, e.g. those a
+        restarted receiver reports missing. Compression is applied as before, so data
+        must be the same and the compression setting unchanged. Fragments are encrypted
+        under a new session; parity is not resent.
+        """
+        fragment_size = self._check_fragment_size(fragment_size)
+        view = memoryview(data)
+        flags = 0
+        compressed = self._compress(view)
+        if compressed is not None:
+            view = memoryview(compressed)
+            flags = FLAG_COMPRESSED
+        total = -(-len(view) // fragment_size)
+        payloads = ((index, view[index * fragment_size:(index + 1) * fragment_size]) for index in sorted(indices))
+        return list(self.encrypt_fragments(payloads, total, stream_id, message_id, flags))
+
+    def _read_fragments(self, source, fragment_size):
+        """
+        Re-chunk a file-like object or byte iterable into fragment_size pieces.
+        """
+        if hasattr(source, 'read'):
+            read = source.read
+            source = iter(lambda: read(fragment_size), b'')
+        buffer = bytearray()
+        for chunk in source:
+            buffer += chunk
+            while len(buffer) >= fragment_size:
+                yield bytes(buffer[:fragment_size])
+                del buffer[:fragment_size]
+        if buffer:
+            yield bytes(buffer)
+
+    def _encrypt_fragment(self, fragment, message_id, index, total, session, nonce=None, flags=0):
+        """
+        Encrypt a single fragment with its header; flags adds header flags such as FLAG_PARITY.
+        Structure: header (18 bytes) + nonce (12 bytes) + ciphertext
+        The header travels in the clear as AEAD associated data, so it is authenticated
+        and can be parsed before decryption. The ciphertext is written straight into the
+        preallocated output buffer.
+        """
+        flags |= session.flags
+        if index + 1 == total and not flags & FLAG_PARITY:
+            flags |= FLAG_LAST
+        nonce = nonce or session.next_nonce()
+        encrypted = bytearray(HEADER_SIZE + NONCE_SIZE + len(fragment) + TAG_SIZE)
+        FRAGMENT_HEADER.pack_into(encrypted, 0, HEADER_VERSION, flags, session.stream_id, message_id, index, total,
+                                  len(fragment))
+        encrypted[HEADER_SIZE:HEADER_SIZE + NONCE_SIZE] = nonce
+
+        view = memoryview(encrypted)
+        associated_data = view[:HEADER_SIZE]
+        if _AEAD_INTO:
+            session.aead.encrypt_into(nonce, fragment, associated_data, view[HEADER_SIZE + NONCE_SIZE:])
+        else:
+            view[HEADER_SIZE + NONCE_SIZE:] = session.aead.encrypt(nonce, fragment, associated_data)
+        return encrypted
+
+    def parse_fragment(self, encrypted):
+        """
+        Parse the clear-text header of a fragment without decrypting it.
+        The header is only trusted once the fragment has been decrypted.
+        Returns a FragmentHeader.
+        """
+        return self._parse(encrypted)[0]
+
+    def _parse(self, encrypted):
+        view = memoryview(encrypted)
+        if len(view) < HEADER_SIZE + NONCE_SIZE + TAG_SIZE:
+            raise ValueError("Fragment is too short to contain a header.")
+        header = FragmentHeader._make(FRAGMENT_HEADER.unpack_from(view))
+        if header.version != HEADER_VERSION:
+            raise ValueError(f"Unsupported fragment header version {header.version}.")
+        if header.payload_length != len(view) - HEADER_SIZE - NONCE_SIZE - TAG_SIZE:
+            raise ValueError("Fragment payload length does not match its header.")
+        return header, view
+
+    def _decrypt(self, header, view, out=None):
+        """
+        Authenticate and decrypt a parsed fragment, into out when given.
+        Session fragments are decrypted with the key derived from the session id in their nonce.
+        Raises ValueError for fragments of a cipher suite this side does not allow.
+        """
+        nonce = view[HEADER_SIZE:HEADER_SIZE + NONCE_SIZE]
+        ciphertext = view[HEADER_SIZE + NONCE_SIZE:]
+        associated_data = view[:HEADER_SIZE]
+        suite = CHACHA20_POLY1305 if header.flags & FLAG_CHACHA20 else AES_GCM
+        if suite not in self.ciphers:
+            raise ValueError(f"Fragment is encrypted with {suite}, which is not allowed.")
+        if header.flags & FLAG_SESSION:
+            aead = _session_context(suite, self.master_key, bytes(nonce[:SESSION_ID_SIZE]))
+        elif suite == self.cipher:
+            aead = self.aead
+        else:
+            aead = aead_context(suite, self.master_key)
+        data = None
+        try:
+            if out is None:
+                data = aead.decrypt(nonce, ciphertext, associated_data)
+            elif _AEAD_INTO:
+                aead.decrypt_into(nonce, ciphertext, associated_data, out)
+            else:
+                out[:] = aead.decrypt(nonce, ciphertext, associated_data)
+        except InvalidTag:
+            self._auth_failures.inc()
+            raise
+        self._decrypted.inc()
+        return data
+
+    def decrypt_fragment(self, encrypted):
+        """
+        Decrypt a single fragment.
+        Returns a tuple of (index, total, data).
+        """
+        header, view = self._parse(encrypted)
+        return header.index, header.total, self._decrypt(header, view)
 
     def decrypt_and_reassemble(self, encrypted_fragments):
         """
         Decrypt and reassemble the original data from encrypted fragments.
+        Every payload is decrypted straight into a preallocated bytearray at
+        index * fragment_size, which is returned. Missing data fragments are rebuilt
+        from parity fragments when the sender used FEC.
         """
         if not encrypted_fragments:
             logger.debug("No fragments to reassemble. Returning empty data.")
             return b''
 
+        started = time.perf_counter()
+        # Lay out the message from the clear-text metadata before decrypting anything
         fragments = {}
+        parity_fragments = []
         total = None
         for idx, encrypted in enumerate(encrypted_fragments):
             try:
-                nonce = encrypted[:12]
-                ciphertext = encrypted[12:]
-                decrypted = self.aesgcm.decrypt(nonce, ciphertext, None)
-                
-                if len(decrypted) < 2:
-                    raise ValueError("Decrypted data is too short to contain metadata length.")
-                
-                # Extract metadata length
-                metadata_length = int.from_bytes(decrypted[:2], 'big')
-                if len(decrypted) < 2 + metadata_length:
-                    raise ValueError("Decrypted data is too short to contain full metadata.")
-                
-                # Unpack metadata
-                packed_metadata = decrypted[2:2 + metadata_length]
-                metadata = msgpack.unpackb(packed_metadata)
-                
-                # Extract fragment data
-                data = decrypted[2 + metadata_length:]
-                
-                fragments[metadata['id']] = data
-                total = metadata['total']
-                logger.debug(f"Decrypted fragment {metadata['id']} of {metadata['total']} (Fragment {idx}).")
+                header, view = self._parse(encrypted)
             except Exception as e:
-                logger.error(f"Failed to decrypt fragment {idx}: {e}")
+                logger.error(f"Failed to parse fragment {idx}: {e}")
                 raise ValueError("Malformed or corrupted fragment detected.")
+            message_id = header.message_id
+            compressed = header.flags & FLAG_COMPRESSED
+            if header.flags & FLAG_PARITY:
+                parity_fragments.append((idx, header, view))
+            else:
+                fragments[header.index] = (idx, header, view)
+            # Streamed fragments carry total=0 until the last one
+            if header.total:
+                total = header.total
 
         if total is None:
             logger.error("No fragments received.")
             raise ValueError("No fragments received.")
 
-        if len(fragments) != total:
-            missing = set(range(total)) - set(fragments.keys())
-            logger.error(f"Missing fragments: {missing}")
-            raise ValueError(f"Missing fragments: {missing}")
+        if not all(0 <= index < total for index in fragments):
+            logger.error("Fragment index is out of range.")
+            raise ValueError("Fragment index is out of range.")
+        # total is not authenticated yet; each parity fragment rebuilds at most one data fragment
+        if total > len(fragments) + len(parity_fragments):
+            message = _missing_fragments(total - len(fragments), (index for index in range(total)
+                                                                  if index not in fragments))
+            logger.error(message)
+            raise ValueError(message)
+        missing = set(range(total)) - set(fragments.keys())
+        blocks = self._recovery_blocks(parity_fragments, missing, total) if missing else {}
 
-        # Reassemble data in order
-        try:
-            reassembled = b''.join(fragments[i] for i in range(total))
-        except KeyError as e:
-            logger.error(f"Missing fragment {e.args[0]} during reassembly.")
-            raise ValueError(f"Missing fragment {e.args[0]} during reassembly.")
-        
-        logger.debug("Successfully reassembled data.")
+        last = fragments.get(total - 1)
+        last_length = last[1].payload_length if last else blocks[max(blocks)][0].tail_length
+        fragment_size = next((header.payload_length for index, (_, header, _) in fragments.items()
+                              if index < total - 1), None)
+        if fragment_size is None:
+            # Every non-final fragment was lost; block 0 then holds parity as long as a fragment
+            fragment_size = len(blocks[0][0].data) if total > 1 else last_length
+        reassembled = bytearray((total - 1) * fragment_size + last_length)
+        out = memoryview(reassembled)
+
+        def decrypt_batch(indices):
+            for index in indices:
+                idx, header, view = fragments[index]
+                offset = index * fragment_size
+                try:
+                    if index < total - 1 and header.payload_length != fragment_size:
+                        raise ValueError("Fragment payload length does not match the fragment size.")
+                    self._decrypt(header, view, out[offset:offset + header.payload_length])
+                except Exception as e:
+                    logger.error(f"Failed to decrypt fragment {idx}: {e}")
+                    raise ValueError("Malformed or corrupted fragment detected.")
+
+        # Each batch writes a disjoint slice of the output, so batches can run concurrently
+        present = sorted(fragments)
+        executor = self._parallel(len(reassembled))
+        if executor is None:
+            decrypt_batch(present)
+        else:
+            batches = [present[start:start + PARALLEL_BATCH] for start in range(0, len(present), PARALLEL_BATCH)]
+            for _ in executor.map(decrypt_batch, batches):
+                pass
+
+        for block, rows in blocks.items():
+            block_size = rows[0].block_size
+            start, count = block_span(block, block_size, total)
+            received = {
+                index - start: out[index * fragment_size:index * fragment_size + fragments[index][1].payload_length]
+                for index in range(start, start + count) if index in fragments
+            }
+            try:
+                recovered = recover_missing(received, {row.row: row.data for row in rows}, block_size, count,
+                                            len(rows[0].data))
+            except (ValueError, OverflowError) as e:
+                logger.error(f"Failed to recover block {block}: {e}")
+                raise ValueError("Malformed or corrupted fragment detected.")
+            for position, data in recovered.items():
+                index = start + position
+                length = last_length if index == total - 1 else fragment_size
+                out[index * fragment_size:index * fragment_size + length] = data[:length]
+
+        if compressed:
+            reassembled = bytearray(self.decompress(reassembled))
+        self._reassemble_seconds.observe(time.perf_counter() - started)
+        logger.debug("Reassembled message %08x: %d bytes from %d fragments (%d recovered).",
+                     message_id, len(reassembled), total, len(missing))
         return reassembled
+
+    def _inflate_into(self, inflater, data, sink):
+        """
+        Inflate data in bounded pieces into sink; returns the number of bytes written.
+        """
+        written = 0
+        try:
+            while data:
+                inflated = inflater.decompress(data, COMPRESSION_SAMPLE * 16)
+                data = inflater.unconsumed_tail
+                sink.write(inflated)
+                written += len(inflated)
+        except zlib.error as e:
+            raise ValueError(f"Corrupt compressed message: {e}")
+        return written
+
+    def _recovery_blocks(self, parity_fragments, missing, total):
+        """
+        Decrypt the parity of every block with missing data fragments.
+        Returns {block: [ParityPayload, ...]}; raises ValueError when a block lost more
+        fragments than it has parity for.
+        """
+        parity = {}
+        for idx, header, view in parity_fragments:
+            try:
+                payload = unpack_parity(self._decrypt(header, view))
+            except Exception as e:
+                logger.error(f"Failed to decrypt parity fragment {idx}: {e}")
+                raise ValueError("Malformed or corrupted fragment detected.")
+            parity.setdefault(header.index, {})[payload.row] = payload
+        if not parity:
+            message = _missing_fragments(len(missing), sorted(missing))
+            logger.error(message)
+            raise ValueError(message)
+
+        block_size = next(iter(next(iter(parity.values())).values())).block_size
+        lost = {}
+        for index in missing:
+            lost.setdefault(index // block_size, []).append(index)
+        unrecoverable = {
+            index for block, indices in lost.items()
+            if len(indices) > len(parity.get(block, ())) for index in indices
+        }
+        if unrecoverable:
+            message = _missing_fragments(len(unrecoverable), sorted(unrecoverable))
+            logger.error(message)
+            raise ValueError(message)
+        return {block: list(parity[block].values()) for block in lost}
+
+    def decrypt_stream(self, encrypted_fragments, sink, window=1024):
+        """
+        Decrypt fragments from any iterable as they arrive and write the plaintext
+        to sink (anything with a write method) in order.
+        Fragments arriving ahead of a gap are held until it fills; holding more than
+        window of them raises ValueError, which bounds memory to window fragments.
+        A compressed message is inflated as it is written.
+        Returns the number of bytes written.
+        """
+        inflater = None
+        pending = {}
+        next_index = 0
+        total = None
+        written = 0
+        for idx, encrypted in enumerate(encrypted_fragments):
+            try:
+                header, view = self._parse(encrypted)
+                if header.flags & FLAG_PARITY:
+                    continue  # Streams are reassembled in order and never need parity
+                index, data = header.index, self._decrypt(header, view)
+            except Exception as e:
+                logger.error(f"Failed to decrypt fragment {idx}: {e}")
+                raise ValueError("Malformed or corrupted fragment detected.")
+            if header.total:
+                total = header.total
+            if inflater is None and header.flags & FLAG_COMPRESSED:
+                inflater = zlib.decompressobj()
+            if index < next_index or index in pending:
+                continue  # Duplicate delivery
+            pending[index] = data
+            if len(pending) > window:
+                logger.error(f"More than {window} fragments buffered waiting for fragment {next_index}.")
+                raise ValueError(f"Reassembly window of {window} fragments exceeded.")
+            while next_index in pending:
+                data = pending.pop(next_index)
+                if inflater is not None:
+                    written += self._inflate_into(inflater, data, sink)
+                else:
+                    sink.write(data)
+                    written += len(data)
+                next_index += 1
+            if next_index == total:
+                if inflater is not None and not inflater.eof:
+                    logger.error("Compressed stream ended before its end of stream marker.")
+                    raise ValueError("Truncated compressed message.")
+                logger.debug("Streamed %d bytes in %d fragments.", written, total)
+                return written
+
+        if total is None and next_index == 0 and not pending:
+            logger.debug("No fragments to reassemble. Nothing written.")
+            return 0
+        if total is None:
+            logger.error(f"Stream ended before its final fragment (next expected {next_index}).")
+            raise ValueError(f"Missing fragments: stream ended before its final fragment (next expected {next_index}).")
+        message = _missing_fragments(total - next_index - len(pending),
+                                     (index for index in range(next_index, total) if index not in pending))
+        logger.error(message)
+        raise ValueError(message)
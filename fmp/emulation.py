@@ -0,0 +1,268 @@
+# fmp/emulation.py
+
+import heapq
+import random
+import socket
+import selectors
+import threading
+import time
+import logging
+from collections import OrderedDict
+from fmp.transport import MAX_DATAGRAM_SIZE, RECEIVE_BUFFER_SIZE, resolve_path
+
+# Handlers and levels are left to the application; see fmp/__init__.py
+logger = logging.getLogger(__name__)
+
+# Upstream sockets kept per proxy; probes open a fresh socket each time
+MAX_FLOWS = 64
+
+
+class LinkProfile:
+    """
+    Emulated behaviour of one direction of a path.
+    delay and jitter are in seconds (jitter is the standard deviation of a normal
+    distribution added to delay), loss and reorder are probabilities, bandwidth is in
+    bytes per second (None for unlimited) and buffer caps the queueing delay a
+    bandwidth-limited link accepts before tail-dropping, in seconds.
+    A reordered packet is held back for an extra reorder_delay seconds.
+    """
+
+    def __init__(self, delay=0.0, jitter=0.0, loss=0.0, reorder=0.0, bandwidth=None, buffer=0.25,
+                 reorder_delay=None):
+        if not 0.0 <= loss <= 1.0 or not 0.0 <= reorder <= 1.0:
+            raise ValueError("Loss and reorder probabilities must be between 0 and 1.")
+        if delay < 0 or jitter < 0 or (bandwidth is not None and bandwidth <= 0):
+            raise ValueError("Delay and jitter must not be negative and bandwidth must be positive.")
+        self.delay = delay
+        self.jitter = jitter
+        self.loss = loss
+        self.reorder = reorder
+        self.bandwidth = bandwidth
+        self.buffer = buffer
+        self.reorder_delay = reorder_delay if reorder_delay is not None else max(2 * delay, 0.005)
+
+    def __repr__(self):
+        return (f"LinkProfile(delay={self.delay}, jitter={self.jitter}, loss={self.loss}, "
+                f"reorder={self.reorder}, bandwidth={self.bandwidth})")
+
+
+class _Direction:
+    """
+    Serialization and impairment state for one direction of an emulated path.
+    """
+
+    def __init__(self, profile, rng):
+        self.profile = profile
+        self.random = rng
+        self.next_free = 0.0
+        self.stats = {'packets': 0, 'bytes': 0, 'lost': 0, 'overflow': 0, 'reordered': 0}
+
+    def schedule(self, size, now):
+        """
+        Return the delivery time of a packet of size bytes sent now, or None if it is dropped.
+        """
+        profile = self.profile
+        self.stats['packets'] += 1
+        departure = now
+        if profile.bandwidth is not None:
+            start = max(now, self.next_free)
+            if start - now > profile.buffer:
+                self.stats['overflow'] += 1
+                return None
+            departure = start + size / profile.bandwidth
+            self.next_free = departure
+        if profile.loss and self.random.random() < profile.loss:
+            self.stats['lost'] += 1
+            return None
+        delay = profile.delay
+        if profile.jitter:
+            delay = max(0.0, self.random.gauss(delay, profile.jitter))
+        if profile.reorder and self.random.random() < profile.reorder:
+            delay += profile.reorder_delay
+            self.stats['reordered'] += 1
+        self.stats['bytes'] += size
+        return departure + delay
+
+
+class EmulatedPath:
+    """
+    Loopback UDP proxy standing in for one (host, port) path, without root or tc.
+    Senders send to the proxy's local address; datagrams are forwarded to the target
+    after the forward profile's delay, jitter, loss, reordering and bandwidth cap.
+    Replies from the target (acknowledgements, probe echoes) travel back to the client
+    that sent the datagram through the reverse profile, which defaults to the forward one.
+    """
+
+    def __init__(self, target, forward=None, reverse=None, seed=None):
+        self.target = target
+        rng = random.Random(seed)
+        self.forward = _Direction(forward or LinkProfile(), rng)
+        self.reverse = _Direction(reverse or forward or LinkProfile(), rng)
+        self.selector = selectors.DefaultSelector()
+        self.front = None
+        self._flows = OrderedDict()  # Least recently used first; client address -> upstream socket connected to the target
+        self._pending = []  # Heap of (delivery time, sequence, socket, packet, address)
+        self._sequence = 0
+        self._wakeup_r, self._wakeup_w = socket.socketpair()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self, host='127.0.0.1'):
+        """
+        Bind the proxy and start forwarding. Returns the local (host, port) to send to.
+        """
+        self._family, self._sockaddr = resolve_path(self.target, socket.SOCK_DGRAM)
+        self.front = self._socket()
+        self.front.bind((host, 0))
+        self.selector.register(self.front, selectors.EVENT_READ, None)
+        self.selector.register(self._wakeup_r, selectors.EVENT_READ, None)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self.front.getsockname()[:2]
+
+    def stop(self):
+        self._stopped.set()
+        self._wakeup_w.send(b'\0')
+        if self._thread is not None:
+            self._thread.join()
+        for sock in [self.front, self._wakeup_r, self._wakeup_w, *self._flows.values()]:
+            if sock is not None:
+                sock.close()
+        self.selector.close()
+
+    def _socket(self):
+        sock = socket.socket(self._family, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECEIVE_BUFFER_SIZE)
+        sock.setblocking(False)
+        return sock
+
+    def _flow(self, client):
+        """
+        Upstream socket for one client address, so replies find their way back to it.
+        """
+        sock = self._flows.get(client)
+        if sock is not None:
+            self._flows.move_to_end(client)
+            return sock
+        if len(self._flows) >= MAX_FLOWS:
+            _, stale = self._flows.popitem(last=False)
+            self.selector.unregister(stale)
+            stale.close()
+        sock = self._flows[client] = self._socket()
+        sock.connect(self._sockaddr)
+        self.selector.register(sock, selectors.EVENT_READ, client)
+        return sock
+
+    def _run(self):
+        while not self._stopped.is_set():
+            timeout = None
+            if self._pending:
+                timeout = max(0.0, self._pending[0][0] - time.perf_counter())
+            for key, _ in self.selector.select(timeout):
+                if key.fileobj is self.front:
+                    self._read(self.front, self.forward, None)
+                elif key.data is not None:
+                    self._read(key.fileobj, self.reverse, key.data)
+            self._deliver(time.perf_counter())
+
+    def _read(self, sock, direction, client):
+        while True:
+            try:
+                packet, addr = sock.recvfrom(MAX_DATAGRAM_SIZE)
+            except (BlockingIOError, ConnectionRefusedError):
+                return
+            if client is None:
+                out, destination = self._flow(addr), None
+            else:
+                out, destination = self.front, client
+            delivery = direction.schedule(len(packet), time.perf_counter())
+            if delivery is not None:
+                self._sequence += 1
+                heapq.heappush(self._pending, (delivery, self._sequence, out, packet, destination))
+
+    def _deliver(self, now):
+        while self._pending and self._pending[0][0] <= now:
+            _, _, out, packet, destination = heapq.heappop(self._pending)
+            if out.fileno() < 0:
+                continue
+            try:
+                if destination is None:
+                    out.send(packet)
+                else:
+                    out.sendto(packet, destination)
+            except OSError as e:
+                logger.debug("Emulated path to %s dropped a packet: %s", self.target, e)
+
+
+class NetworkEmulator:
+    """
+    A set of EmulatedPath proxies, one per target path.
+    """
+
+    def __init__(self, profiles, seed=None):
+        """
+        profiles maps each target (host, port) to a LinkProfile, or to a
+        (forward, reverse) pair of profiles for asymmetric paths.
+        """
+        self.paths = {}
+        for i, (target, profile) in enumerate(profiles.items()):
+            forward, reverse = profile if isinstance(profile, tuple) else (profile, None)
+            self.paths[target] = EmulatedPath(target, forward, reverse, None if seed is None else seed + i)
+
+    def start(self):
+        """
+        Start every proxy. Returns {target path: proxy path} so senders can be pointed at the proxies.
+        """
+        return {target: path.start() for target, path in self.paths.items()}
+
+    def stop(self):
+        for path in self.paths.values():
+            path.stop()
+
+    def stats(self):
+        """
+        Per target path packet counters for each direction.
+        """
+        return {
+            target: {'forward': dict(path.forward.stats), 'reverse': dict(path.reverse.stats)}
+            for target, path in self.paths.items()
+        }
+
+
+def _parse_path(text):
+    host, _, port = text.rpartition(':')
+    return host or '127.0.0.1', int(port)
+
+
+def main(argv=None):
+    """
+    Run one emulated path as a standalone loopback proxy, e.g. in another process:
+    python -m fmp.emulation 127.0.0.1:8001 --delay 0.02 --loss 0.01
+    """
+    import argparse
+    parser = argparse.ArgumentParser(description="Loopback UDP proxy emulating delay, jitter, loss, "
+                                                 "reordering and a bandwidth cap on one path.")
+    parser.add_argument('target', type=_parse_path, help="host:port the proxy forwards to")
+    parser.add_argument('--listen', default='127.0.0.1', help="local address to bind the proxy on")
+    parser.add_argument('--delay', type=float, default=0.0)
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--loss', type=float, default=0.0)
+    parser.add_argument('--reorder', type=float, default=0.0)
+    parser.add_argument('--bandwidth', type=float, default=None, help="bytes per second")
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args(argv)
+    profile = LinkProfile(args.delay, args.jitter, args.loss, args.reorder, args.bandwidth)
+    path = EmulatedPath(args.target, profile, seed=args.seed)
+    host, port = path.start(args.listen)
+    print(f"Emulating {profile} on {host}:{port} -> {args.target[0]}:{args.target[1]}", flush=True)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        path.stop()
+        print(path.forward.stats, path.reverse.stats)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+# fmp/fec.py
+
+import struct
+import functools
+from collections import namedtuple
+
+# Systematic Reed-Solomon erasure code over GF(2^8) built from a Cauchy matrix.
+# Every block of up to n data fragments gets k parity fragments; any n of the n + k
+# fragments rebuild the block. Columns are scaled so parity row 0 is plain XOR parity.
+GF_POLYNOMIAL = 0x11D
+MAX_CODE_LENGTH = 256
+
+# Parity payload prefix: data fragments per block, parity fragments per block,
+# parity row, length of the block's last data fragment
+PARITY_HEADER = struct.Struct('!BBBH')
+
+_EXP = [0] * 512
+_LOG = [0] * 256
+_x = 1
+for _i in range(255):
+    _EXP[_i] = _x
+    _LOG[_x] = _i
+    _x <<= 1
+    if _x & 0x100:
+        _x ^= GF_POLYNOMIAL
+for _i in range(255, 512):
+    _EXP[_i] = _EXP[_i - 255]
+
+
+def gf_mul(a, b):
+    if a == 0 or b == 0:
+        return 0
+    return _EXP[_LOG[a] + _LOG[b]]
+
+
+def gf_inv(a):
+    if a == 0:
+        raise ZeroDivisionError("0 has no inverse in GF(256).")
+    return _EXP[255 - _LOG[a]]
+
+
+# One 256-byte table per constant, so multiplying a whole fragment is a single bytes.translate
+MUL_TABLES = [bytes(gf_mul(c, b) for b in range(256)) for c in range(256)]
+
+
+def validate_code(block_size, parity):
+    if not 1 <= block_size <= 255 or not 1 <= parity <= 255:
+        raise ValueError("FEC block size and parity count must be between 1 and 255.")
+    if block_size + parity > MAX_CODE_LENGTH:
+        raise ValueError(f"FEC block size plus parity count must not exceed {MAX_CODE_LENGTH}.")
+
+
+@functools.lru_cache(maxsize=None)
+def coefficients(block_size, row):
+    """
+    Coefficients of parity row for data positions 0..block_size-1.
+    """
+    return tuple(gf_mul(gf_inv((block_size + row) ^ i), block_size ^ i) for i in range(block_size))
+
+
+def _scaled(coefficient, fragment):
+    """
+    Multiply every byte of fragment by coefficient and return the product as a little endian integer,
+    so XOR-accumulating whole fragments runs as big integer operations.
+    Shorter fragments are implicitly zero padded at their end.
+    """
+    if coefficient != 1:
+        fragment = bytes(fragment).translate(MUL_TABLES[coefficient])
+    return int.from_bytes(fragment, 'little')
+
+
+def encode_parity(fragments, parity, block_size):
+    """
+    Compute parity fragments for one block of data fragments (at most block_size of them).
+    Every parity fragment is as long as the longest data fragment.
+    """
+    fragments = [bytes(fragment) for fragment in fragments]
+    length = max(len(fragment) for fragment in fragments)
+    encoded = []
+    for row in range(parity):
+        accumulator = 0
+        for coefficient, fragment in zip(coefficients(block_size, row), fragments):
+            accumulator ^= _scaled(coefficient, fragment)
+        encoded.append(accumulator.to_bytes(length, 'little'))
+    return encoded
+
+
+def recover_missing(present, parity_rows, block_size, count, length):
+    """
+    Rebuild the missing data fragments of a block.
+    present maps block positions to received data fragments, parity_rows maps parity
+    rows to parity fragments, count is the number of data fragments in the block and
+    length the parity fragment length. Returns {position: fragment of length bytes}.
+    Raises ValueError when fewer parity fragments than missing fragments are available.
+    """
+    missing = [position for position in range(count) if position not in present]
+    if not missing:
+        return {}
+    if len(parity_rows) < len(missing):
+        raise ValueError(f"{len(missing)} fragments missing but only {len(parity_rows)} parity fragments received.")
+    rows = sorted(parity_rows)[:len(missing)]
+    syndromes = []
+    for row in rows:
+        row_coefficients = coefficients(block_size, row)
+        accumulator = _scaled(1, parity_rows[row])
+        for position, fragment in present.items():
+            accumulator ^= _scaled(row_coefficients[position], fragment)
+        syndromes.append(accumulator.to_bytes(length, 'little'))
+    inverse = _invert([[coefficients(block_size, row)[position] for position in missing] for row in rows])
+    recovered = {}
+    for position, inverse_row in zip(missing, inverse):
+        accumulator = 0
+        for coefficient, syndrome in zip(inverse_row, syndromes):
+            accumulator ^= _scaled(coefficient, syndrome)
+        recovered[position] = accumulator.to_bytes(length, 'little')
+    return recovered
+
+
+def _invert(matrix):
+    """
+    Invert a square matrix over GF(256) by Gauss-Jordan elimination.
+    """
+    size = len(matrix)
+    rows = [list(row) + [int(i == j) for j in range(size)] for i, row in enumerate(matrix)]
+    for column in range(size):
+        pivot = next(r for r in range(column, size) if rows[r][column])
+        rows[column], rows[pivot] = rows[pivot], rows[column]
+        scale = gf_inv(rows[column][column])
+        rows[column] = [gf_mul(scale, value) for value in rows[column]]
+        for r in range(size):
+            factor = rows[r][column]
+            if r != column and factor:
+                rows[r] = [value ^ gf_mul(factor, pivot_value) for value, pivot_value in zip(rows[r], rows[column])]
+    return [row[size:] for row in rows]
+
+
+ParityPayload = namedtuple('ParityPayload', 'block_size parity row tail_length data')
+
+
+def pack_parity(block_size, parity, row, tail_length, data):
+    return PARITY_HEADER.pack(block_size, parity, row, tail_length) + data
+
+
+def unpack_parity(payload):
+    """
+    Split a decrypted parity payload into its prefix fields and parity data.
+    """
+    if len(payload) < PARITY_HEADER.size:
+        raise ValueError("Parity fragment is too short.")
+    block_size, parity, row, tail_length = PARITY_HEADER.unpack_from(payload)
+    validate_code(block_size, parity)
+    if row >= parity or tail_length > len(payload) - PARITY_HEADER.size:
+        raise ValueError("Malformed parity fragment.")
+    return ParityPayload(block_size, parity, row, tail_length, memoryview(payload)[PARITY_HEADER.size:])
+
+
+def block_span(block, block_size, total):
+    """
+    Return (first data index, number of data fragments) of a block in a message of total fragments.
+    """
+    start = block * block_size
+    return start, max(0, min(block_size, total - start))
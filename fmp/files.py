@@ -0,0 +1,298 @@
+# fmp/files.py
+
+import os
+import mmap
+import struct
+import logging
+from collections import OrderedDict, namedtuple
+from fmp.core import FLAG_PARITY, FLAG_COMPRESSED
+
+# Handlers and levels are left to the application; see fmp/__init__.py
+logger = logging.getLogger(__name__)
+
+# Files are mapped a window at a time, so resident memory stays flat however large the file
+WINDOW_SIZE = 16 * 1024 * 1024
+# Receivers keep a few windows mapped for fragments arriving out of order across a boundary
+MAPPED_WINDOWS = 4
+
+# A partially received file keeps its progress in a sidecar next to it: this header, then
+# a bitmap with one bit per fragment, set once the fragment is written to the file.
+# The message id ties the partial file to one message, and the size to the file it preallocated.
+PARTIAL_SUFFIX = '.fmp-partial'
+PARTIAL_HEADER = struct.Struct('!4sBIIIIQ')  # magic, version, message id, fragment size, total, final fragment length, size
+PARTIAL_MAGIC = b'FMPP'
+PARTIAL_VERSION = 2
+
+FileProgress = namedtuple('FileProgress', 'fragment_size total missing message_id')
+
+
+def _windows(fragment_size):
+    return max(1, WINDOW_SIZE // fragment_size)
+
+
+def _map(fileno, start, end, access):
+    """
+    Map bytes [start, end) of a file. Returns the mapping and the offset of start in it,
+    since mappings must begin on an allocation boundary.
+    """
+    map_start = start - start % mmap.ALLOCATIONGRANULARITY
+    return mmap.mmap(fileno, end - map_start, access=access, offset=map_start), start - map_start
+
+
+def read_fragments(path, fragment_size, indices=None):
+    """
+    Return (total, fragments) for a file cut into fragment_size pieces. fragments yields
+    (index, payload) with payloads as read-only views sliced straight from a memory map
+    of the file. indices limits the fragments read, e.g. to those a receiver is missing
+    (see read_progress).
+    """
+    size = os.path.getsize(path)
+    total = -(-size // fragment_size)
+    return total, _read_fragments(path, size, fragment_size, range(total) if indices is None else sorted(indices))
+
+
+def _read_fragments(path, size, fragment_size, indices):
+    per_window = _windows(fragment_size)
+    with open(path, 'rb') as f:
+        window = view = None
+        for index in indices:
+            if index * fragment_size >= size:
+                raise ValueError(f"Fragment {index} is beyond the end of {path}.")
+            if index // per_window != window:
+                window = index // per_window
+                start = window * per_window * fragment_size
+                mapped, delta = _map(f.fileno(), start, min(start + per_window * fragment_size, size),
+                                     mmap.ACCESS_READ)
+                # The previous window is unmapped once the consumer drops its last view of it
+                view = memoryview(mapped)[delta:]
+                del mapped
+            offset = (index - window * per_window) * fragment_size
+            yield index, view[offset:offset + fragment_size]
+
+
+def partial_path(path):
+    return path + PARTIAL_SUFFIX
+
+
+def read_progress(path):
+    """
+    Return the FileProgress of a partially received file: its fragment size, total, the
+    sorted indices still missing and the id of the message being received. Returns None
+    when no transfer into path is pending.
+    """
+    try:
+        with open(partial_path(path), 'rb') as f:
+            sidecar = f.read()
+    except FileNotFoundError:
+        return None
+    message_id, fragment_size, total, _, _ = _unpack_partial(sidecar, path)
+    bitmap = sidecar[PARTIAL_HEADER.size:]
+    missing = [index for index in range(total) if not bitmap[index >> 3] & (1 << (index & 7))]
+    return FileProgress(fragment_size, total, missing, message_id)
+
+
+def _unpack_partial(sidecar, path):
+    if len(sidecar) < PARTIAL_HEADER.size:
+        raise ValueError(f"Corrupt progress file for {path}.")
+    magic, version, message_id, fragment_size, total, last_length, size = PARTIAL_HEADER.unpack_from(sidecar)
+    if (magic != PARTIAL_MAGIC or version != PARTIAL_VERSION or size != total * fragment_size or
+            len(sidecar) != PARTIAL_HEADER.size + -(-total // 8)):
+        raise ValueError(f"Corrupt progress file for {path}.")
+    return message_id, fragment_size, total, last_length, size
+
+
+class FileReceiver:
+    """
+    Decrypt the fragments of one message straight into a file at path, each at its offset
+    as it arrives, in any order. The file is preallocated once the layout is known (from
+    the first authenticated non-final fragment) and written through memory-mapped windows.
+    Progress is kept in a sidecar bitmap (see PARTIAL_SUFFIX), so a transfer interrupted
+    by a closed receiver or a crashed process resumes where it stopped: a later
+    FileReceiver on the same path only needs the missing fragments (see read_progress),
+    resent under the same message id. The sidecar is removed once the file is complete.
+    """
+
+    def __init__(self, core, path):
+        self.core = core
+        self.path = path
+        self.message_id = None
+        self.fragment_size = None
+        self.total = None
+        self.last_length = 0  # 0 until the final fragment is written
+        self.count = 0
+        self._file = None
+        self._sidecar = None
+        self._bitmap = None
+        self._windows = OrderedDict()  # window -> (mapping, offset of the window in it)
+        self._unplaced = None  # Authenticated final fragment held until the fragment size is known
+        if os.path.exists(partial_path(path)):
+            self._resume()
+
+    @property
+    def complete(self):
+        return self.total is not None and self.count == self.total
+
+    def _resume(self):
+        self._sidecar = open(partial_path(self.path), 'r+b')
+        self._bitmap = mmap.mmap(self._sidecar.fileno(), 0)
+        self.message_id, self.fragment_size, self.total, self.last_length, size = \
+            _unpack_partial(self._bitmap, self.path)
+        self._file = open(self.path, 'r+b')
+        if os.fstat(self._file.fileno()).st_size != size:
+            raise ValueError(f"{self.path} changed size since its transfer was interrupted.")
+        bitmap = self._bitmap[PARTIAL_HEADER.size:]
+        self.count = sum(bin(byte).count('1') for byte in bitmap)
+        logger.debug("Resuming %s: %d of %d fragments received.", self.path, self.count, self.total)
+        if self.complete:
+            self._finish()  # Interrupted after the last write
+
+    def _allocate(self, message_id, fragment_size, total):
+        """
+        Create the destination at its full size and a sidecar with an empty bitmap.
+        """
+        self.message_id, self.fragment_size, self.total = message_id, fragment_size, total
+        with open(partial_path(self.path), 'wb') as f:
+            f.write(PARTIAL_HEADER.pack(PARTIAL_MAGIC, PARTIAL_VERSION, message_id, fragment_size, total, 0,
+                                        total * fragment_size))
+            f.write(bytes(-(-total // 8)))
+        self._file = open(self.path, 'w+b')
+        # The final fragment may be shorter; the file is trimmed once it is complete
+        self._file.truncate(total * fragment_size)
+        self._sidecar = open(partial_path(self.path), 'r+b')
+        self._bitmap = mmap.mmap(self._sidecar.fileno(), 0)
+
+    def _has(self, index):
+        return self._bitmap[PARTIAL_HEADER.size + (index >> 3)] & (1 << (index & 7))
+
+    def _mark(self, index, length):
+        if index == self.total - 1:
+            self.last_length = length
+            PARTIAL_HEADER.pack_into(self._bitmap, 0, PARTIAL_MAGIC, PARTIAL_VERSION, self.message_id,
+                                     self.fragment_size, self.total, length, self.total * self.fragment_size)
+        self._bitmap[PARTIAL_HEADER.size + (index >> 3)] |= 1 << (index & 7)
+        self.count += 1
+
+    def _window(self, window):
+        """
+        Return the writable mapping holding a window of fragments, mapping it on first use.
+        """
+        if window in self._windows:
+            self._windows.move_to_end(window)
+            return self._windows[window]
+        if len(self._windows) >= MAPPED_WINDOWS:
+            self._windows.popitem(last=False)[1][0].close()
+        per_window = _windows(self.fragment_size)
+        start = window * per_window * self.fragment_size
+        end = min(start + per_window * self.fragment_size, self.total * self.fragment_size)
+        mapped = self._windows[window] = _map(self._file.fileno(), start, end, mmap.ACCESS_WRITE)
+        return mapped
+
+    def add(self, encrypted):
+        """
+        Decrypt one fragment into the file. Returns True once the file is complete.
+        Duplicates and parity fragments are ignored.
+        Raises ValueError for malformed or unauthenticated fragments and for fragments
+        that do not belong to the file's message.
+        Nothing is created on disk until a fragment has been authenticated, so a forged
+        header cannot preallocate a file or claim the path for another message.
+        """
+        header, view = self.core._parse(encrypted)
+        if header.flags & FLAG_PARITY or self.complete:
+            return self.complete
+        if header.flags & FLAG_COMPRESSED:
+            raise ValueError("Compressed messages cannot be written to a file in place.")
+        if not header.total:
+            raise ValueError("Streamed messages cannot be written to a file in place; their size is unknown.")
+        # The first authenticated fragment decides which message the file belongs to
+        owner = self if self.total is not None else self._unplaced and self._unplaced[0]
+        if owner and (header.message_id, header.total) != (owner.message_id, owner.total):
+            raise ValueError(f"Fragment of message {header.message_id:08x} does not belong to {self.path}.")
+        if not 0 <= header.index < header.total:
+            raise ValueError("Fragment index is out of range.")
+        if self.fragment_size is None:
+            # Authenticated into a scratch buffer, since the layout it implies is not trusted yet
+            data = self._decrypt(header, view)
+            if header.index == header.total - 1 and header.total > 1:
+                self._unplaced = (header, data)
+                return False
+            self._allocate(header.message_id, header.payload_length, header.total)
+            if self._unplaced is not None:
+                unplaced, self._unplaced = self._unplaced, None
+                self._place(*unplaced)
+            self._place(header, data)
+        else:
+            self._place(header, view, decrypt=True)
+        if self.complete:
+            self._finish()
+        return self.complete
+
+    def _decrypt(self, header, view, out=None):
+        try:
+            return self.core._decrypt(header, view, out)
+        except Exception as e:
+            logger.error(f"Failed to decrypt fragment {header.index} of {self.path}: {e}")
+            raise ValueError("Malformed or corrupted fragment detected.")
+
+    def _place(self, header, payload, decrypt=False):
+        """
+        Write a fragment at its offset: payload is decrypted in place when decrypt is set,
+        and is already authenticated plaintext otherwise.
+        """
+        index = header.index
+        if self._has(index):
+            return
+        last = index == self.total - 1
+        if header.payload_length > self.fragment_size or not last and header.payload_length != self.fragment_size:
+            raise ValueError("Fragment payload length does not match the file's fragment size.")
+        per_window = _windows(self.fragment_size)
+        mapped, delta = self._window(index // per_window)
+        offset = delta + (index % per_window) * self.fragment_size
+        with memoryview(mapped) as out:
+            if decrypt:
+                self._decrypt(header, payload, out[offset:offset + header.payload_length])
+            else:
+                out[offset:offset + header.payload_length] = payload
+        self._mark(index, header.payload_length)
+
+    def _finish(self):
+        size = (self.total - 1) * self.fragment_size + self.last_length
+        self._unmap()
+        self._file.truncate(size)
+        self._file.close()
+        self._file = None
+        os.remove(partial_path(self.path))
+        logger.debug("Received %s: %d bytes in %d fragments.", self.path, size, self.total)
+
+    def _unmap(self):
+        for mapped, _ in self._windows.values():
+            mapped.flush()
+            mapped.close()
+        self._windows.clear()
+        if self._bitmap is not None:
+            # Data is flushed before the bitmap that vouches for it
+            self._bitmap.flush()
+            self._bitmap.close()
+            self._bitmap = None
+            self._sidecar.close()
+            self._sidecar = None
+
+    def missing(self):
+        """
+        Return the sorted indices of the fragments not yet written, or None while the
+        layout is still unknown.
+        """
+        if self.total is None:
+            return None
+        if self._bitmap is None:
+            return []
+        return [index for index in range(self.total) if not self._has(index)]
+
+    def close(self):
+        """
+        Flush what was received and release the file. An incomplete file keeps its
+        sidecar, so a later FileReceiver on the same path resumes it.
+        """
+        self._unmap()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
@@ -0,0 +1,233 @@
+# fmp/journal.py
+
+import os
+import time
+import struct
+import logging
+
+# Handlers and levels are left to the application; see fmp/__init__.py
+logger = logging.getLogger(__name__)
+
+# Every incomplete message has a spill file of its fragments, still encrypted, appended in
+# arrival order, and a journal file: this header, then one record per fragment in the spill file
+JOURNAL_HEADER = struct.Struct('!4sB')  # magic, version
+JOURNAL_MAGIC = b'FMPJ'
+JOURNAL_VERSION = 2
+JOURNAL_RECORD = struct.Struct('!QI')  # spill offset, fragment length
+JOURNAL_SUFFIX = '.journal'
+SPILL_SUFFIX = '.spill'
+
+# Fragments are made durable in batches: one fsync per file every SYNC_EVERY fragments or
+# SYNC_INTERVAL seconds, whichever comes first
+SYNC_EVERY = 256
+SYNC_INTERVAL = 0.5
+# Journals of messages that made no progress for this long are removed when a journal opens
+MAX_AGE = 24 * 60 * 60
+# Journal files and their directory are private to the receiving user
+FILE_MODE = 0o600
+DIRECTORY_MODE = 0o700
+
+
+def _open_append(path):
+    return os.fdopen(os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, FILE_MODE), 'ab')
+
+
+class _Entry:
+    """
+    Open spill and journal files of one message and the records not yet synced.
+    """
+    __slots__ = ('spill', 'journal', 'spill_size', 'pending')
+
+    def __init__(self, spill, journal, spill_size):
+        self.spill = spill
+        self.journal = journal
+        self.spill_size = spill_size
+        self.pending = bytearray()
+
+
+class Journal:
+    """
+    On-disk record of the fragments received for incomplete messages, so a receiver that
+    restarts mid-transfer keeps what it already had and a reconnecting sender only sends
+    what is missing (see Reassembler.progress).
+    Fragments are appended to a per-message spill file as they arrived, still encrypted,
+    and indexed by a journal file of fixed-size records; the Reassembler authenticates
+    and decrypts them again when it restores a message, so no plaintext reaches the disk.
+    The files are created readable by their owner only (FILE_MODE), since headers and
+    sizes still tell what is being received. Both are fsynced in batches, the spill file first, so a
+    record never points at data that did not reach the disk; a crash loses at most the
+    last batch, whose fragments are simply sent again.
+    Not thread-safe; the Reassembler calls it with its lock held.
+    """
+
+    def __init__(self, directory, sync_every=SYNC_EVERY, sync_interval=SYNC_INTERVAL, max_age=MAX_AGE):
+        self.directory = directory
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        os.makedirs(directory, mode=DIRECTORY_MODE, exist_ok=True)
+        self._entries = {}  # message id -> _Entry for messages with open files
+        self._dirty = set()
+        self._unsynced = 0
+        self._synced_at = time.monotonic()
+        self.expire(max_age)
+
+    def _path(self, message_id, suffix):
+        return os.path.join(self.directory, f'{message_id:08x}{suffix}')
+
+    def __contains__(self, message_id):
+        return message_id in self._entries or os.path.exists(self._path(message_id, JOURNAL_SUFFIX))
+
+    def message_ids(self):
+        """
+        Return the ids of all journaled messages.
+        """
+        return sorted(int(name[:-len(JOURNAL_SUFFIX)], 16) for name in os.listdir(self.directory)
+                      if name.endswith(JOURNAL_SUFFIX))
+
+    def _open(self, message_id):
+        entry = self._entries.get(message_id)
+        if entry is not None:
+            return entry
+        journal_path = self._path(message_id, JOURNAL_SUFFIX)
+        created = not os.path.exists(journal_path)
+        spill = _open_append(self._path(message_id, SPILL_SUFFIX))
+        journal = _open_append(journal_path)
+        if created:
+            journal.write(JOURNAL_HEADER.pack(JOURNAL_MAGIC, JOURNAL_VERSION))
+        else:
+            # Cut a record left half-written by a crash, so new records stay aligned
+            size = journal.tell()
+            if size > JOURNAL_HEADER.size:
+                journal.truncate(size - (size - JOURNAL_HEADER.size) % JOURNAL_RECORD.size)
+        entry = self._entries[message_id] = _Entry(spill, journal, spill.tell())
+        if created:
+            self._dirty.add(message_id)
+        return entry
+
+    def record(self, message_id, fragment):
+        """
+        Append an encrypted fragment of a message; it is durable after the next sync.
+        """
+        entry = self._open(message_id)
+        entry.spill.write(fragment)
+        entry.pending += JOURNAL_RECORD.pack(entry.spill_size, len(fragment))
+        entry.spill_size += len(fragment)
+        self._dirty.add(message_id)
+        self._unsynced += 1
+        if self._unsynced >= self.sync_every or time.monotonic() - self._synced_at >= self.sync_interval:
+            self.sync()
+
+    def sync(self):
+        """
+        Make every recorded fragment durable: fsync the spill files, then append and
+        fsync the records pointing into them.
+        """
+        if self._dirty:
+            for message_id in self._dirty:
+                entry = self._entries.get(message_id)
+                if entry is None:
+                    continue
+                entry.spill.flush()
+                os.fsync(entry.spill.fileno())
+                entry.journal.write(entry.pending)
+                entry.journal.flush()
+                os.fsync(entry.journal.fileno())
+                entry.pending.clear()
+            self._sync_directory()
+            self._dirty.clear()
+        self._unsynced = 0
+        self._synced_at = time.monotonic()
+
+    def _sync_directory(self):
+        # New files only survive a crash once the directory entry is on disk too
+        try:
+            fd = os.open(self.directory, os.O_RDONLY)
+        except OSError:
+            return  # Directories cannot be opened on every platform
+        try:
+            os.fsync(fd)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+
+    def replay(self, message_id):
+        """
+        Yield every durable fragment of a message as bytes, still encrypted, in the order
+        they were recorded. Records cut short by a crash are ignored.
+        """
+        if message_id in self._dirty:
+            self.sync()
+        try:
+            with open(self._path(message_id, JOURNAL_SUFFIX), 'rb') as f:
+                records = f.read()
+            spill = open(self._path(message_id, SPILL_SUFFIX), 'rb')
+        except FileNotFoundError:
+            return
+        with spill:
+            spill_size = os.fstat(spill.fileno()).st_size
+            if len(records) < JOURNAL_HEADER.size or JOURNAL_HEADER.unpack_from(records) != (JOURNAL_MAGIC,
+                                                                                            JOURNAL_VERSION):
+                logger.warning("Ignoring corrupt journal of message %08x.", message_id)
+                return
+            end = len(records) - (len(records) - JOURNAL_HEADER.size) % JOURNAL_RECORD.size
+            for offset, length in JOURNAL_RECORD.iter_unpack(records[JOURNAL_HEADER.size:end]):
+                if offset + length > spill_size:
+                    break
+                spill.seek(offset)
+                yield spill.read(length)
+
+    def release(self, message_id):
+        """
+        Sync and close the files of a message while keeping it on disk, e.g. when the
+        reassembler drops it from memory; it is resumed from disk when it continues.
+        """
+        if message_id in self._dirty:
+            self.sync()
+        entry = self._entries.pop(message_id, None)
+        if entry is not None:
+            entry.spill.close()
+            entry.journal.close()
+
+    def discard(self, message_id):
+        """
+        Remove a message's journal, e.g. once it is complete.
+        """
+        entry = self._entries.pop(message_id, None)
+        self._dirty.discard(message_id)
+        if entry is not None:
+            entry.spill.close()
+            entry.journal.close()
+        for suffix in (JOURNAL_SUFFIX, SPILL_SUFFIX):
+            try:
+                os.remove(self._path(message_id, suffix))
+            except FileNotFoundError:
+                pass
+
+    def expire(self, max_age):
+        """
+        Remove the journals of messages with no progress for max_age seconds.
+        Returns the removed message ids.
+        """
+        cutoff = time.time() - max_age
+        expired = []
+        for message_id in self.message_ids():
+            if message_id in self._entries:
+                continue
+            try:
+                if os.path.getmtime(self._path(message_id, JOURNAL_SUFFIX)) < cutoff:
+                    self.discard(message_id)
+                    expired.append(message_id)
+            except FileNotFoundError:
+                pass
+        if expired:
+            logger.info("Removed %d stale message journals.", len(expired))
+        return expired
+
+    def close(self):
+        """
+        Sync every journaled fragment and close all files; journals stay on disk.
+        """
+        self.sync()
+        for message_id in list(self._entries):
+            self.release(message_id)
@@ -0,0 +1,304 @@
+# fmp/metrics.py
+
+import bisect
+import threading
+import logging
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Handlers and levels are left to the application; see fmp/__init__.py
+logger = logging.getLogger(__name__)
+
+# Upper bounds in seconds, from tens of microseconds (one fragment) to seconds (a stalled message)
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0)
+DEFAULT_EXPORTER_PORT = 9464
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def path_label(path):
+    """
+    Label value for a (host, port) path.
+    """
+    return f"{path[0]}:{path[1]}"
+
+
+class _PerThread:
+    """
+    One cell per writing thread, so hot paths update plain Python lists without a lock.
+    Readers sum the cells; each cell only ever has a single writer.
+    Cells of finished threads are folded into a base cell whenever a cell is read or
+    added, so their counts are kept while short-lived threads do not accumulate cells.
+    """
+    __slots__ = ('_local', '_cells', '_base', '_lock')
+
+    def __init__(self):
+        self._local = threading.local()
+        self._cells = []  # (thread, cell) for every live writing thread
+        self._base = self._make_cell()
+        self._lock = threading.Lock()
+
+    def _new_cell(self):
+        cell = self._local.cell = self._make_cell()
+        with self._lock:
+            self._fold()
+            self._cells.append((threading.current_thread(), cell))
+        return cell
+
+    def _fold(self):
+        # A finished thread never writes its cell again, so its counts can move to the base
+        live = []
+        for thread, cell in self._cells:
+            if thread.is_alive():
+                live.append((thread, cell))
+            else:
+                for i, count in enumerate(cell):
+                    self._base[i] += count
+        self._cells = live
+
+    def _snapshot_cells(self):
+        with self._lock:
+            self._fold()
+            # A copy of the base, so a later fold cannot count a cell twice
+            return [list(self._base)] + [cell for _, cell in self._cells]
+
+
+class _CounterChild(_PerThread):
+    __slots__ = ()
+
+    def _make_cell(self):
+        return [0]
+
+    def inc(self, amount=1):
+        try:
+            self._local.cell[0] += amount
+        except AttributeError:
+            self._new_cell()[0] += amount
+
+    def value(self):
+        return sum(cell[0] for cell in self._snapshot_cells())
+
+
+class _HistogramChild(_PerThread):
+    __slots__ = ('_buckets',)
+
+    def __init__(self, buckets):
+        self._buckets = buckets
+        super().__init__()
+
+    def _make_cell(self):
+        # Count per bucket plus one overflow bucket, then the sum of observations
+        return [0] * (len(self._buckets) + 1) + [0.0]
+
+    def observe(self, value):
+        try:
+            cell = self._local.cell
+        except AttributeError:
+            cell = self._new_cell()
+        cell[bisect.bisect_left(self._buckets, value)] += 1
+        cell[-1] += value
+
+    def value(self):
+        """
+        Returns {'buckets': {upper bound: cumulative count}, 'count': n, 'sum': total}.
+        """
+        counts = [0] * (len(self._buckets) + 2)
+        for cell in self._snapshot_cells():
+            for i, count in enumerate(cell):
+                counts[i] += count
+        cumulative = {}
+        running = 0
+        for bound, count in zip(self._buckets + (float('inf'),), counts):
+            running += count
+            cumulative[bound] = running
+        return {'buckets': cumulative, 'count': running, 'sum': counts[-1]}
+
+
+class _Metric:
+    """
+    A named metric family; label values select a child that holds the actual value.
+    """
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            # Unlabelled metrics update their only child directly
+            self._bind(self.labels())
+
+    def labels(self, *values):
+        """
+        Return the child for these label values; callers on hot paths should keep it.
+        """
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {values}.")
+            with self._lock:
+                child = self._children.setdefault(values, self._child())
+        return child
+
+    def samples(self):
+        with self._lock:
+            children = list(self._children.items())
+        return {values: child.value() for values, child in children}
+
+    def _child(self):
+        raise NotImplementedError
+
+    def _bind(self, child):
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def _child(self):
+        return _CounterChild()
+
+    def _bind(self, child):
+        self.inc = child.inc
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _child(self):
+        return _HistogramChild(self.buckets)
+
+    def _bind(self, child):
+        self.observe = child.observe
+
+
+class Registry:
+    """
+    The set of metrics components update. Metrics are created on first use and shared
+    by every component registering the same name, so several routers add up.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def _register(self, cls, name, documentation, labelnames, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, documentation, labelnames, **kwargs)
+            elif type(metric) is not cls or metric.labelnames != tuple(labelnames):
+                raise ValueError(f"Metric {name} is already registered with a different type or labels.")
+            return metric
+
+    def snapshot(self):
+        """
+        Current values as {metric name: {label values tuple: value}}; unlabelled metrics use
+        the key (). Counter values are integers, histogram values dicts (see _HistogramChild.value).
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {metric.name: metric.samples() for metric in metrics}
+
+    def render(self):
+        """
+        Render every metric in the Prometheus text exposition format.
+        """
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {_escape(metric.documentation, help_text=True)}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for values, value in sorted(metric.samples().items()):
+                labels = list(zip(metric.labelnames, values))
+                if metric.kind == 'counter':
+                    lines.append(f"{metric.name}{_labels(labels)} {value}")
+                    continue
+                for bound, count in value['buckets'].items():
+                    lines.append(f"{metric.name}_bucket{_labels(labels + [('le', _number(bound))])} {count}")
+                lines.append(f"{metric.name}_sum{_labels(labels)} {_number(value['sum'])}")
+                lines.append(f"{metric.name}_count{_labels(labels)} {value['count']}")
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(text, help_text=False):
+    text = text.replace('\\', '\\\\').replace('\n', '\\n')
+    return text if help_text else text.replace('"', '\\"')
+
+
+def _labels(pairs):
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(str(value))}"' for name, value in pairs) + '}'
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+# Registry used by FMPCore, Router and FMPProtocol unless they are given their own
+REGISTRY = Registry()
+
+
+class MetricsExporter:
+    """
+    Serve a registry in the Prometheus text format at /metrics from a background thread.
+    Binds to localhost by default; metrics reveal traffic patterns, so expose them deliberately.
+    """
+
+    def __init__(self, registry=REGISTRY, host='127.0.0.1', port=DEFAULT_EXPORTER_PORT):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self._server = None
+        self._thread = None
+
+    def start(self):
+        """
+        Start serving. Returns the bound (host, port), useful with port 0.
+        """
+        registry = self.registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?', 1)[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = registry.render().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', CONTENT_TYPE)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logger.debug("Metrics request from %s: " + format, self.client_address[0], *args)
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        bound = self._server.server_address[:2]
+        logger.debug("Serving metrics on http://%s:%d/metrics.", *bound)
+        return bound
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._thread.join()
+            self._server = None
@@ -0,0 +1,136 @@
+# fmp/probing.py
+
+import threading
+import logging
+
+# Handlers and levels are left to the application; see fmp/__init__.py
+logger = logging.getLogger(__name__)
+
+# EWMA gains: RTT and jitter follow RFC 6298, loss and bandwidth react a little faster
+RTT_GAIN = 1 / 8
+JITTER_GAIN = 1 / 4
+LOSS_GAIN = 1 / 8
+BANDWIDTH_GAIN = 1 / 4
+
+
+def initial_metrics(latency=0.05):
+    """
+    Metrics for a path that has not been probed yet: active, with a neutral latency prior.
+    """
+    return {
+        'latency': latency,
+        'jitter': 0.0,
+        'loss': 0.0,
+        'bandwidth': None,
+        'score': score(latency, 0.0, 0.0),
+        'active': True,
+        'failures': 0,
+        'samples': 0,
+    }
+
+
+def score(latency, jitter, loss):
+    """
+    Higher is better: delivered fraction over a jitter-padded RTT.
+    """
+    return (1.0 - loss) / (latency + jitter + 1e-6)
+
+
+def record_success(metrics, rtt, bandwidth=None):
+    """
+    Fold a successful probe into a path's EWMA estimates and re-admit the path.
+    """
+    if metrics['samples'] == 0:
+        metrics['latency'] = rtt
+        metrics['jitter'] = rtt / 2
+    else:
+        metrics['jitter'] += JITTER_GAIN * (abs(metrics['latency'] - rtt) - metrics['jitter'])
+        metrics['latency'] += RTT_GAIN * (rtt - metrics['latency'])
+    if bandwidth:
+        if metrics['bandwidth']:
+            metrics['bandwidth'] += BANDWIDTH_GAIN * (bandwidth - metrics['bandwidth'])
+        else:
+            metrics['bandwidth'] = bandwidth
+    metrics['loss'] += LOSS_GAIN * (0.0 - metrics['loss'])
+    metrics['samples'] += 1
+    metrics['failures'] = 0
+    metrics['active'] = True
+    metrics['score'] = score(metrics['latency'], metrics['jitter'], metrics['loss'])
+
+
+def record_failure(metrics, failure_threshold):
+    """
+    Fold a lost probe or failed send into a path's loss estimate.
+    The path is deactivated after failure_threshold consecutive failures.
+    """
+    metrics['loss'] += LOSS_GAIN * (1.0 - metrics['loss'])
+    metrics['failures'] += 1
+    if metrics['failures'] >= failure_threshold:
+        metrics['active'] = False
+    metrics['score'] = score(metrics['latency'], metrics['jitter'], metrics['loss'])
+
+
+class PathProber:
+    """
+    Probe every path of a Router from a background thread at a fixed interval,
+    keeping EWMA-smoothed RTT, jitter, loss and bandwidth in router.paths.
+    Inactive paths keep being probed and are re-admitted once they answer again.
+    """
+
+    def __init__(self, router, interval=1.0, timeout=0.5, failure_threshold=3):
+        self.router = router
+        self.interval = interval
+        self.timeout = timeout
+        self.failure_threshold = failure_threshold
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self.probe_once()
+            self._stopped.wait(self.interval)
+
+    def probe_once(self):
+        """
+        Probe each path once, update its metrics and rebuild the router's selection table.
+        """
+        for path in list(self.router.paths):
+            try:
+                rtt, bandwidth = self.router.transport.probe(path, self.timeout)
+            except Exception as e:
+                with self.router.lock:
+                    metrics = self.router.paths[path]
+                    was_active = metrics['active']
+                    record_failure(metrics, self.failure_threshold)
+                    if was_active and not metrics['active']:
+                        self.router._rebuild_selection()
+                if was_active and not metrics['active']:
+                    logger.warning(f"Path {path} marked inactive after {metrics['failures']} failed probes: {e}")
+                continue
+            # Paths sized to their MTU pick up route changes and cached PMTU drops
+            limit = None
+            if 'max_datagram' in self.router.paths[path]:
+                limit = self.router.transport.max_datagram_size(path)
+            with self.router.lock:
+                metrics = self.router.paths[path]
+                was_active = metrics['active']
+                record_success(metrics, rtt, bandwidth)
+                if limit is not None:
+                    metrics['max_datagram'] = limit
+                if not was_active:
+                    self.router._rebuild_selection()
+            if not was_active:
+                logger.info(f"Path {path} re-admitted after a successful probe.")
+            logger.debug("Path %s probed: rtt %.6fs, jitter %.6fs, loss %.3f",
+                         path, metrics['latency'], metrics['jitter'], metrics['loss'])
+        # Scores moved, so re-weight the table; activity changes above already took effect
+        self.router.rebuild_selection()
@@ -1,45 +1,304 @@
 # fmp/protocol.py
 
+import os
 import logging
 import secrets
-from fmp.core import FMPCore
-from fmp.routing import Router
+import itertools
+from fmp.core import FMPCore, MAX_STREAM_ID, FLAG_RELIABLE
+from fmp.ciphers import AES_GCM, SUITES
+from fmp.routing import Router, DEFAULT_BATCH_SIZE
+from fmp.reassembly import Reassembler, MessageProgress, DEFAULT_TIMEOUT, DEFAULT_MAX_BYTES
+from fmp.reliability import (is_progress_query, pack_progress_query, unpack_progress_query, pack_progress,
+                             unpack_progress)
+from fmp.scheduler import select_best_path
+from fmp.transport import Listener
+from fmp.sizing import AUTO, AUTO_INITIAL_SIZE
+from fmp.streams import Stream
+from fmp.files import FileReceiver, read_fragments, read_progress
+from fmp.journal import Journal
 
-# Configure logging
+# Handlers and levels are left to the application; see fmp/__init__.py
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.DEBUG)  # Set to DEBUG for detailed logs
-handler = logging.StreamHandler()
-formatter = logging.Formatter('[%(asctime)s] %(levelname)s - %(message)s')
-handler.setFormatter(formatter)
-logger.addHandler(handler)
 
 class FMPProtocol:
-    def __init__(self, fragment_size=100, paths=None, master_key=None, nonce_generator=None):
+    def __init__(self, fragment_size=100, paths=None, master_key=None, nonce_generator=None, transport='udp',
+                 queue_size=1024, probe_interval=1.0, workers=None, reassembly_timeout=DEFAULT_TIMEOUT,
+                 max_reassembly_bytes=DEFAULT_MAX_BYTES, fec=None, reliable=False, metrics=None,
+                 batch_size=DEFAULT_BATCH_SIZE, flush_interval=0.0, compression=None, journal_dir=None,
+                 cipher=AES_GCM, ciphers=tuple(SUITES)):
         """
         Initialize FMPProtocol with FMPCore and Router.
+        paths are the (host, port) destinations fragments are striped across; None uses
+        localhost ports 8001 and 8002, and [] makes a receive-only protocol.
+        fragment_size='auto' sizes every message's fragments from the paths: capped to
+        their MTU, larger on fast paths and smaller on lossy ones (see Router.fragment_size).
+        transport selects how fragments travel on each path ('udp' or 'tcp').
+        queue_size bounds each path's send queue; send_data blocks while queues are full.
+        probe_interval sets how often paths are probed in the background (None disables it).
+        workers > 1 enables FMPCore's parallel encryption/decryption for large payloads.
+        reassembly_timeout and max_reassembly_bytes bound the incomplete messages
+        receive_fragment holds (see Reassembler).
+        fec=(n, k) adds k parity fragments per n data fragments (see FMPCore).
+        compression=level (1-9) zlib-compresses messages that shrink (see FMPCore).
+        cipher selects the AEAD suite ('aes-gcm', 'chacha20-poly1305' or 'auto' for the
+        faster one on this host) among the suites in ciphers, which are also the only ones
+        accepted from peers (see FMPCore).
+        reliable=True retransmits fragments the receiver does not acknowledge (see
+        ReliabilityEngine); the receiving side must be started with listen.
+        metrics is the fmp.metrics Registry the protocol, its core and router record into
+        (fmp.metrics.REGISTRY by default); serve it with fmp.metrics.MetricsExporter.
+        batch_size and flush_interval control how many queued fragments each path worker
+        sends per transport call and how long it waits to fill a batch (see Router).
+        journal_dir keeps incomplete received messages on disk in that directory (see
+        Journal), so a restarted receiver resumes them; see message_progress and resume_data.
         """
-        paths = paths or [('localhost', 8001), ('localhost', 8002)]
-        master_key = master_key or FMPCore().master_key
-        nonce_generator = nonce_generator or (lambda: secrets.token_bytes(12))
+        if paths is None:
+            paths = [('localhost', 8001), ('localhost', 8002)]
+        master_key = master_key or secrets.token_bytes(32)
+        self.adaptive = fragment_size == AUTO
         self.core = FMPCore(
-            fragment_size=fragment_size,
+            fragment_size=AUTO_INITIAL_SIZE if self.adaptive else fragment_size,
             master_key=master_key,
-            nonce_generator=nonce_generator
+            nonce_generator=nonce_generator,
+            workers=workers,
+            fec=fec,
+            metrics=metrics,
+            compression=compression,
+            cipher=cipher,
+            ciphers=ciphers,
+            reliable=reliable
         )
-        self.router = Router(paths)
+        self.router = Router(paths, transport=transport, queue_size=queue_size, probe_interval=probe_interval,
+                             reliable=reliable, metrics=metrics, batch_size=batch_size,
+                             flush_interval=flush_interval)
+        journal = Journal(journal_dir) if journal_dir is not None else None
+        self.reassembler = Reassembler(self.core, timeout=reassembly_timeout, max_bytes=max_reassembly_bytes,
+                                       journal=journal)
+        self.listener = None
+        self.on_message = None
+        self._with_stream = False
+        # Stream 0 is the default stream of send_data; open_stream hands out the others
+        self._stream_ids = itertools.cycle(range(1, MAX_STREAM_ID + 1))
+        self.metrics = self.core.metrics
+        self._messages_sent = self.metrics.counter('fmp_messages_sent_total', "Messages sent.")
+        self._bytes_sent = self.metrics.counter('fmp_message_bytes_sent_total', "Message payload bytes sent.")
+        self._messages_received = self.metrics.counter('fmp_messages_received_total', "Messages reassembled.")
+        self._bytes_received = self.metrics.counter('fmp_message_bytes_received_total',
+                                                    "Message payload bytes reassembled.")
         logger.debug("Initialized FMPProtocol.")
 
-    def send_data(self, data):
+    def open_stream(self):
         """
-        Fragment, encrypt, and send data via the router.
+        Return a new Stream: messages sent on it share this protocol's router and path
+        connections, and its fragments are scheduled fairly against other streams.
+        Stream ids wrap around after MAX_STREAM_ID streams.
         """
-        encrypted_fragments = self.core.fragment_and_encrypt(data)
-        logger.debug(f"Sending {len(encrypted_fragments)} encrypted fragments.")
+        return Stream(self, next(self._stream_ids))
+
+    def send_data(self, data, stream_id=0):
+        """
+        Fragment, encrypt, and send data via the router on stream stream_id.
+        Safe to call from many threads at once; each path's queue interleaves the
+        fragments of different streams fairly.
+        Returns the message id, which resume_data needs, or None for empty data.
+        """
+        encrypted_fragments = self.core.fragment_and_encrypt(data, self._fragment_size(), stream_id)
+        logger.debug("Sending %d encrypted fragments.", len(encrypted_fragments))
         for fragment in encrypted_fragments:
-            self.router.send_fragment(fragment)
+            self.router.send_fragment(fragment, stream_id)
+        self._messages_sent.inc()
+        self._bytes_sent.inc(len(data))
+        return self.core.parse_fragment(encrypted_fragments[0]).message_id if encrypted_fragments else None
+
+    def resume_data(self, data, message_id, progress, stream_id=0):
+        """
+        Send again only the fragments a receiver is missing of a message sent earlier
+        with send_data, e.g. after the receiver restarted. progress is the receiver's
+        message_progress for message_id, asked over the network with query_progress. When nothing is missing, the final fragment is
+        sent anyway, so a receiver that journaled everything but stopped before delivering
+        the message completes it.
+        """
+        fragment_size = progress.fragment_size or self.core.fragment_size
+        indices = progress.missing or [progress.total - 1]
+        encrypted_fragments = self.core.encrypt_missing(data, message_id, fragment_size, indices, stream_id)
+        logger.debug("Resending %d fragments of message %08x.", len(encrypted_fragments), message_id)
+        for fragment in encrypted_fragments:
+            self.router.send_fragment(fragment, stream_id)
+
+    def _fragment_size(self):
+        if not self.adaptive:
+            return None
+        return self.router.fragment_size(self.core.fragment_overhead)
+
+    def send_stream(self, source, stream_id=0):
+        """
+        Fragment, encrypt, and send data read incrementally from a file-like object
+        or byte iterator. Memory stays bounded by the router's send queues.
+        """
+        count = 0
+        for fragment in self.core.encrypt_stream(source, self._fragment_size(), stream_id):
+            self.router.send_fragment(fragment, stream_id)
+            count += 1
+        logger.debug("Sent %d streamed fragments.", count)
+
+    def receive_stream(self, encrypted_fragments, sink):
+        """
+        Decrypt fragments as they arrive and write the plaintext to sink in order.
+        Returns the number of bytes written.
+        """
+        return self.core.decrypt_stream(encrypted_fragments, sink)
+
+    def send_file(self, path, stream_id=0, fragment_size=None, indices=None, message_id=None):
+        """
+        Send the file at path as one message, encrypting fragments sliced straight from a
+        memory map of it, so neither side holds the file in memory. Returns the message id.
+        To resume a transfer, pass the message_id, fragment_size and missing indices of
+        the receiver's file_progress; only those fragments are sent.
+        Files are sent without compression or parity.
+        """
+        fragment_size = self.core._check_fragment_size(fragment_size or self._fragment_size() or
+                                                       self.core.fragment_size)
+        total, payloads = read_fragments(path, fragment_size, indices)
+        message_id = self.core._next_message_id() if message_id is None else message_id
+        count = 0
+        for fragment in self.core.encrypt_fragments(payloads, total, stream_id, message_id):
+            self.router.send_fragment(fragment, stream_id)
+            count += 1
+        logger.debug("Sent %d of %d fragments of %s.", count, total, path)
+        self._messages_sent.inc()
+        self._bytes_sent.inc(os.path.getsize(path))
+        return message_id
+
+    def receive_file(self, encrypted_fragments, path):
+        """
+        Decrypt the fragments of one message sent with send_file (or uncompressed
+        send_data) straight into the file at path, at their offsets, in any order.
+        Resumes a transfer interrupted earlier (see file_progress). Returns the file size
+        once it is complete; raises ValueError when the fragments run out first, keeping
+        what arrived for a later call.
+        """
+        receiver = FileReceiver(self.core, path)
+        received = 0
+        try:
+            for encrypted in encrypted_fragments:
+                received += 1
+                if receiver.add(encrypted):
+                    break
+            if not received and receiver.total is None:
+                open(path, 'wb').close()  # An empty file has no fragments
+            elif not receiver.complete:
+                missing = receiver.missing()
+                raise ValueError(f"Missing fragments: {'all' if missing is None else len(missing)} of {path}.")
+        finally:
+            receiver.close()
+        return os.path.getsize(path)
+
+    def file_progress(self, path):
+        """
+        Return the FileProgress (fragment_size, total, missing indices, message_id) of a file partially
+        received by receive_file, or None when no transfer into path is pending.
+        """
+        return read_progress(path)
 
     def receive_data(self, encrypted_fragments):
         """
         Receive encrypted fragments and reassemble the original data.
         """
         return self.core.decrypt_and_reassemble(encrypted_fragments)
+
+    def message_progress(self, message_id):
+        """
+        Return the MessageProgress (fragment_size, total, missing indices) of a message this
+        receiver holds incomplete, in memory or in its journal, or None when it holds
+        nothing for it. A receiver started with listen also answers query_progress from
+        reconnecting senders with it.
+        """
+        return self.reassembler.progress(message_id)
+
+    def query_progress(self, message_id, path=None, timeout=1.0):
+        """
+        Ask the receiver listening on path (the best scored path by default) for its
+        message_progress of message_id, to pass to resume_data. Returns None when the
+        receiver holds nothing for the message. Raises OSError when it does not answer.
+        Queries and replies are not authenticated, like acknowledgements; a forged reply
+        can at worst make the sender resend fragments or skip a resume.
+        """
+        path = path or select_best_path(self.router.paths)
+        if path is None:
+            raise ConnectionError("No active paths available to query progress.")
+        reply = self.router.transport.query(path, pack_progress_query(message_id), timeout)
+        replied_id, fragment_size, total, missing = unpack_progress(reply)
+        if replied_id != message_id:
+            raise ValueError(f"Progress reply is for message {replied_id:08x}, not {message_id:08x}.")
+        return None if missing is None else MessageProgress(fragment_size, total, missing)
+
+    def receive_fragment(self, encrypted_fragment):
+        """
+        Feed one fragment as it arrives, in any order and interleaved with other messages.
+        Returns the reassembled message once its last fragment arrives, otherwise None.
+        Raises ValueError for malformed or unauthenticated fragments.
+        """
+        data = self.reassembler.add(encrypted_fragment)
+        if data is not None:
+            self._received(data)
+        return data
+
+    def listen(self, paths, on_message, with_stream=False):
+        """
+        Receive fragments on local (host, port) paths and call on_message(data) from the
+        listener thread for every reassembled message, or on_message(stream_id, data)
+        with with_stream=True. Fragments of reliable senders (FLAG_RELIABLE) are
+        answered with a selective acknowledgement. Returns the bound paths.
+        """
+        self.on_message = on_message
+        self._with_stream = with_stream
+        self.listener = Listener(paths, self._on_fragment, transport=self.router.transport.name)
+        return self.listener.start()
+
+    def _on_fragment(self, encrypted_fragment, path):
+        if is_progress_query(encrypted_fragment):
+            message_id = unpack_progress_query(encrypted_fragment)
+            progress = self.reassembler.progress(message_id)
+            return pack_progress(message_id, *progress) if progress else pack_progress(message_id)
+        try:
+            header = self.core.parse_fragment(encrypted_fragment)
+            data = self.reassembler.add(encrypted_fragment)
+        except ValueError as e:
+            logger.warning(f"Dropped malformed fragment from {path}: {e}")
+            return None
+        if data is not None:
+            self._received(data)
+            if self._with_stream:
+                self.on_message(header.stream_id, data)
+            else:
+                self.on_message(data)
+        # Only reliable senders listen for acknowledgements; add authenticated the flag
+        if header.flags & FLAG_RELIABLE:
+            return self.reassembler.sack(header.message_id)
+        return None
+
+    def _received(self, data):
+        self._messages_received.inc()
+        self._bytes_received.inc(len(data))
+
+    def flush(self, timeout=None):
+        """
+        Block until every fragment queued by send_data has been handed to the transport
+        and, in reliable mode, acknowledged. Returns False if acknowledgements are still
+        outstanding after timeout seconds.
+        """
+        self.router.flush()
+        if self.router.reliability is not None:
+            return self.router.reliability.wait(timeout)
+        return True
+
+    def close(self):
+        """
+        Flush pending fragments, stop listening and release the router's path connections.
+        """
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+        self.router.close()
+        self.reassembler.close()
+        self.core.close()
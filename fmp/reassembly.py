@@ -0,0 +1,472 @@
+# fmp/reassembly.py
+
+import time
+import threading
+import logging
+from collections import OrderedDict, namedtuple
+from fmp.core import FLAG_LAST, FLAG_PARITY, FLAG_COMPRESSED
+from fmp.fec import recover_missing, unpack_parity, block_span
+from fmp.reliability import pack_sack, MAX_SACK_BITMAP
+
+# Handlers and levels are left to the application; see fmp/__init__.py
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIMEOUT = 30.0
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+COMPLETED_HISTORY = 4096
+
+MessageProgress = namedtuple('MessageProgress', 'fragment_size total missing')
+
+
+class _OverBudget(Exception):
+    pass
+
+
+class _PartialMessage:
+    """
+    Reassembly state for one message: a received-bitmap, the plaintext buffer and any parity.
+    """
+    __slots__ = ('total', 'fragment_size', 'last_length', 'received', 'count', 'base', 'highest', 'buffer',
+                 'unplaced', 'parity', 'block_size', 'size', 'compressed', 'started', 'updated')
+
+    def __init__(self, now):
+        self.total = 0  # 0 until a fragment carrying the real total arrives
+        self.fragment_size = None  # Learned from the first non-final fragment
+        self.last_length = None
+        self.received = bytearray()
+        self.count = 0
+        self.base = 0  # Lowest index not yet received
+        self.highest = -1
+        self.buffer = bytearray()
+        self.unplaced = {}  # Final fragment held until the fragment size is known
+        self.parity = {}  # FEC block -> {parity row: ParityPayload}
+        self.block_size = None
+        self.size = 0
+        self.compressed = False
+        self.started = now
+        self.updated = now
+
+    def has(self, index):
+        byte = index >> 3
+        return byte < len(self.received) and self.received[byte] & (1 << (index & 7))
+
+    def mark(self, index):
+        byte = index >> 3
+        if byte >= len(self.received):
+            self.received.extend(bytes(byte + 1 - len(self.received)))
+        self.received[byte] |= 1 << (index & 7)
+        self.count += 1
+        self.highest = max(self.highest, index)
+        # Each index is passed over once, so the base advances in amortized constant time
+        while self.has(self.base):
+            self.base += 1
+
+
+class Reassembler:
+    """
+    Reassemble messages from fragments of many messages arriving interleaved and out of order.
+    Fragments are grouped by the message id in their header and decrypted straight into a
+    per-message buffer as they arrive; add returns the message once its last fragment lands.
+    With FEC parity fragments, a block is rebuilt as soon as enough of its fragments arrived.
+    Incomplete messages are evicted after timeout seconds without progress, and the bytes
+    buffered across all incomplete messages never exceed max_bytes: the least recently
+    active messages are evicted to make room.
+    With a Journal, every authenticated fragment is also recorded on disk, encrypted as it
+    arrived, until its message completes. Messages dropped from memory, or held by a
+    previous process with the same key, are restored from the journal when they continue,
+    and progress tells a reconnecting sender what is missing.
+    """
+
+    def __init__(self, core, timeout=DEFAULT_TIMEOUT, max_bytes=DEFAULT_MAX_BYTES, completed_history=COMPLETED_HISTORY,
+                 journal=None):
+        """
+        core is the FMPCore holding the keys fragments are decrypted with; reassembly
+        wait times and dropped messages are recorded in its metrics registry.
+        completed_history bounds how many finished message ids are remembered so
+        late duplicates of a delivered message are dropped instead of starting it again.
+        journal is an fmp.journal.Journal to persist incomplete messages in, or None.
+        """
+        self.core = core
+        self.journal = journal
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.completed_history = completed_history
+        self.buffered_bytes = 0
+        self.stats = {'completed': 0, 'expired': 0, 'evicted': 0, 'duplicates': 0, 'recovered': 0}
+        self._messages = OrderedDict()  # Least recently active first
+        self._completed = OrderedDict()
+        self.lock = threading.Lock()
+        self._wait_seconds = core.metrics.histogram(
+            'fmp_reassembly_wait_seconds', "Time from a message's first fragment to its reassembly.")
+        dropped = core.metrics.counter('fmp_messages_dropped_total', "Incomplete messages dropped by the reassembler.",
+                                       ('reason',))
+        self._expired = dropped.labels('expired')
+        self._evicted = dropped.labels('evicted')
+
+    def __len__(self):
+        return len(self._messages)
+
+    def add(self, encrypted, now=None):
+        """
+        Decrypt one fragment into its message.
+        Returns the reassembled message as a bytearray once it is complete, otherwise None.
+        Raises ValueError for malformed or unauthenticated fragments, and for fragments
+        whose header claims a message larger than the whole budget.
+        """
+        header, view = self.core._parse(encrypted)
+        # The header is not authenticated yet; this only bounds what it may make us allocate
+        span = header.total if header.total else header.index + 1
+        if span * header.payload_length > self.max_bytes:
+            raise ValueError(f"Fragment header claims a message larger than the {self.max_bytes} byte budget.")
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            self._expire(now)
+            message_id = header.message_id
+            if message_id in self._completed:
+                self.stats['duplicates'] += 1
+                return None
+            message = self._messages.get(message_id)
+            if message is None and self.journal is not None and message_id in self.journal:
+                message = self._restore(message_id, now)
+                if message is None:
+                    return None
+                if message.total and message.count >= message.total:
+                    return self._complete(message_id, message, now)
+            if message is None:
+                message = self._messages[message_id] = _PartialMessage(now)
+            if not header.flags & FLAG_PARITY and message.has(header.index):
+                self.stats['duplicates'] += 1
+                return None
+            try:
+                if not self._accept(message_id, message, header, view):
+                    self.stats['duplicates'] += 1
+                    return None
+                self._journal(message_id, encrypted)
+            except _OverBudget:
+                return None
+            except Exception as e:
+                if not message.count and not message.parity:
+                    self._drop(message_id)
+                raise ValueError(f"Malformed or corrupted fragment detected: {e}") from e
+            # Only authenticated fragments count as progress
+            self._messages.move_to_end(message_id)
+            message.updated = now
+            if not message.total or message.count < message.total:
+                return None
+            return self._complete(message_id, message, now)
+
+    def missing(self, message_id):
+        """
+        Return the indices not yet received for an incomplete message, up to its total
+        or, while the total is unknown, up to the highest index received so far.
+        """
+        with self.lock:
+            message = self._messages.get(message_id)
+            if message is None:
+                return []
+            end = message.total or message.highest + 1
+            return [index for index in range(end) if not message.has(index)]
+
+    def progress(self, message_id):
+        """
+        Return the MessageProgress of an incomplete message: its fragment size (None while
+        unknown), total (0 while unknown) and the indices still missing, restoring it from
+        the journal if it is not in memory. Returns None when nothing is held for it.
+        A reconnecting sender resends only the missing fragments (see FMPProtocol.resume_data).
+        """
+        with self.lock:
+            message = self._messages.get(message_id)
+            if message is None and self.journal is not None and message_id in self.journal:
+                message = self._restore(message_id, time.monotonic())
+            if message is None:
+                return None
+            end = message.total or message.highest + 1
+            return MessageProgress(message.fragment_size, message.total,
+                                   [index for index in range(end) if not message.has(index)])
+
+    def sack(self, message_id):
+        """
+        Build the selective acknowledgement for a message: the first index not yet received
+        and a bitmap of what arrived beyond it. Delivered messages are acknowledged as
+        complete. Returns None for messages this reassembler holds no state for.
+        """
+        with self.lock:
+            if message_id in self._completed:
+                return pack_sack(message_id, 0, complete=True)
+            message = self._messages.get(message_id)
+            if message is None:
+                return None
+            # Only the bytes a SACK can carry are converted, however large the message
+            base = message.base
+            start = base >> 3
+            window = int.from_bytes(message.received[start:start + MAX_SACK_BITMAP + 1], 'little') >> (base & 7)
+            bitmap = window.to_bytes((window.bit_length() + 7) // 8, 'little')[:MAX_SACK_BITMAP]
+            return pack_sack(message_id, base, bitmap)
+
+    def expire(self, now=None):
+        """
+        Evict incomplete messages that made no progress within the timeout.
+        Returns the evicted message ids.
+        """
+        with self.lock:
+            return self._expire(time.monotonic() if now is None else now)
+
+    def _expire(self, now):
+        cutoff = now - self.timeout
+        expired = []
+        while self._messages:
+            message_id, message = next(iter(self._messages.items()))
+            if message.updated > cutoff:
+                break
+            self._drop(message_id)
+            expired.append(message_id)
+        if expired:
+            self.stats['expired'] += len(expired)
+            self._expired.inc(len(expired))
+            logger.warning("Expired %d incomplete messages after %.1fs.", len(expired), self.timeout)
+        while self._completed and next(iter(self._completed.values())) <= cutoff:
+            self._completed.popitem(last=False)
+        return expired
+
+    def _accept(self, message_id, message, header, view):
+        """
+        Authenticate a data or parity fragment into its message and rebuild what its
+        block's parity allows. Returns False for a duplicate parity fragment.
+        """
+        if header.flags & FLAG_PARITY:
+            if not self._add_parity(message_id, message, header, view):
+                return False
+            block = header.index
+        else:
+            self._place(message_id, message, header, view)
+            message.mark(header.index)
+            block = header.index // message.block_size if message.parity else None
+        if block is not None:
+            self._recover(message_id, message, block)
+        # Flags are authenticated, so only trust them once the fragment decrypted
+        if header.flags & FLAG_COMPRESSED:
+            message.compressed = True
+        return True
+
+    def _place(self, message_id, message, header, view):
+        """
+        Decrypt a fragment into its slot of the message buffer.
+        The final fragment is held aside until another fragment reveals the fragment size.
+        Message state only changes once the fragment has been authenticated: a fragment
+        that needs the buffer to grow is decrypted aside first, so a forged header cannot
+        make the reassembler reserve memory or evict other messages.
+        """
+        index = header.index
+        is_last = header.flags & FLAG_LAST or (header.total and index + 1 == header.total)
+        if header.total and message.total and header.total != message.total:
+            raise ValueError("Fragment total does not match earlier fragments.")
+        total = message.total or header.total
+        if total and index >= total:
+            raise ValueError(f"Fragment index {index} is beyond the message total {total}.")
+        fragment_size = message.fragment_size
+        if not is_last:
+            if fragment_size is None:
+                fragment_size = header.payload_length
+            elif header.payload_length != fragment_size:
+                raise ValueError("Fragment payload length does not match the fragment size.")
+
+        if fragment_size is None:
+            data = self.core._decrypt(header, view)
+            self._reserve(message_id, message, header.payload_length)
+            message.unplaced[index] = data
+        else:
+            offset = index * fragment_size
+            end = offset + header.payload_length
+            if end <= len(message.buffer):
+                # The slot is allocated and not yet marked received, so a failed decryption leaves no state
+                self.core._decrypt(header, view, memoryview(message.buffer)[offset:end])
+            else:
+                data = self.core._decrypt(header, view)
+                self._grow(message_id, message, fragment_size, total, index)
+                message.buffer[offset:end] = data
+            self._settle(message, fragment_size)
+        message.total = total
+        message.fragment_size = fragment_size
+        if is_last:
+            message.last_length = header.payload_length
+
+    def _grow(self, message_id, message, fragment_size, total, index):
+        """
+        Preallocate the whole message once its size is known; streams grow as they go.
+        """
+        end = total * fragment_size if total else (index + 1) * fragment_size
+        if end > len(message.buffer):
+            self._reserve(message_id, message, end - len(message.buffer))
+            message.buffer.extend(bytes(end - len(message.buffer)))
+
+    def _settle(self, message, fragment_size):
+        """
+        Move a held final fragment into the buffer now that the fragment size is known.
+        """
+        for held, data in message.unplaced.items():
+            offset = held * fragment_size
+            message.buffer[offset:offset + len(data)] = data
+            message.size -= len(data)
+            self.buffered_bytes -= len(data)
+        message.unplaced.clear()
+
+    def _add_parity(self, message_id, message, header, view):
+        """
+        Authenticate and keep a parity fragment. Returns False for a duplicate.
+        """
+        if not header.total or (message.total and header.total != message.total):
+            raise ValueError("Parity fragment total does not match the message.")
+        payload = unpack_parity(self.core._decrypt(header, view))
+        if message.block_size is not None and payload.block_size != message.block_size:
+            raise ValueError("Parity fragment block size does not match earlier parity.")
+        rows = message.parity.get(header.index, {})
+        if payload.row in rows:
+            return False
+        self._reserve(message_id, message, len(payload.data))
+        rows[payload.row] = payload
+        message.parity[header.index] = rows
+        message.block_size = payload.block_size
+        message.total = header.total
+        return True
+
+    def _recover(self, message_id, message, block):
+        """
+        Rebuild the missing data fragments of a block once it has enough parity.
+        """
+        rows = message.parity.get(block)
+        if not rows:
+            return
+        start, count = block_span(block, message.block_size, message.total)
+        missing = [index for index in range(start, start + count) if not message.has(index)]
+        if not missing or len(missing) > len(rows):
+            return
+        sample = next(iter(rows.values()))
+        last_index = message.total - 1
+        fragment_size = message.fragment_size
+        if fragment_size is None and (count > 1 or start + count <= last_index):
+            # This block holds a full-size fragment, so its parity is exactly that long
+            fragment_size = len(sample.data)
+        if fragment_size is not None:
+            self._grow(message_id, message, fragment_size, message.total, last_index)
+            self._settle(message, fragment_size)
+            message.fragment_size = fragment_size
+
+        received = {}
+        for index in range(start, start + count):
+            if not message.has(index):
+                continue
+            if fragment_size is None:
+                received[index - start] = message.unplaced[index]
+            else:
+                length = message.last_length if index == last_index else fragment_size
+                offset = index * fragment_size
+                received[index - start] = memoryview(message.buffer)[offset:offset + length]
+        recovered = recover_missing(received, {row: payload.data for row, payload in rows.items()},
+                                    message.block_size, count, len(sample.data))
+        for position, data in recovered.items():
+            index = start + position
+            if index == last_index:
+                data = data[:sample.tail_length]
+                message.last_length = sample.tail_length
+            if fragment_size is None:
+                # Only the final fragment, alone in its block, can be rebuilt before the size is known
+                self._reserve(message_id, message, len(data))
+                message.unplaced[index] = data
+            else:
+                offset = index * fragment_size
+                message.buffer[offset:offset + len(data)] = data
+            message.mark(index)
+        self.stats['recovered'] += len(recovered)
+
+    def _reserve(self, message_id, message, size):
+        """
+        Account size more buffered bytes to a message, evicting the least recently
+        active other messages while the budget would be exceeded.
+        """
+        while self.buffered_bytes + size > self.max_bytes:
+            oldest = next((other for other in self._messages if other != message_id), None)
+            if oldest is None:
+                logger.warning("Message %08x needs more than the %d byte reassembly budget; dropped.",
+                               message_id, self.max_bytes)
+                self._drop(message_id)
+                self.stats['evicted'] += 1
+                self._evicted.inc()
+                raise _OverBudget()
+            self._drop(oldest)
+            self.stats['evicted'] += 1
+            self._evicted.inc()
+            logger.warning("Evicted incomplete message %08x to stay within the reassembly budget.", oldest)
+        message.size += size
+        self.buffered_bytes += size
+
+    def _drop(self, message_id):
+        message = self._messages.pop(message_id)
+        self.buffered_bytes -= message.size
+        if self.journal is not None:
+            # The journal keeps the message on disk; it is restored if it continues
+            self.journal.release(message_id)
+
+    def _journal(self, message_id, encrypted):
+        """
+        Record a fragment just authenticated, as received, in the journal. Fragments
+        rebuilt from parity are not recorded; the parity that rebuilds them is.
+        """
+        if self.journal is None:
+            return
+        try:
+            self.journal.record(message_id, encrypted)
+        except OSError as e:
+            # Reassembly goes on in memory; only resuming after a restart is affected
+            logger.error("Failed to journal a fragment of message %08x: %s", message_id, e)
+
+    def _restore(self, message_id, now):
+        """
+        Rebuild an incomplete message by authenticating its journaled fragments again.
+        Returns None when it does not fit the reassembly budget.
+        """
+        message = self._messages[message_id] = _PartialMessage(now)
+        try:
+            for encrypted in self.journal.replay(message_id):
+                header, view = self.core._parse(encrypted)
+                if header.message_id != message_id:
+                    raise ValueError(f"Journal holds a fragment of message {header.message_id:08x}.")
+                if header.flags & FLAG_PARITY or not message.has(header.index):
+                    self._accept(message_id, message, header, view)
+        except _OverBudget:
+            return None
+        except Exception as e:
+            logger.warning("Discarding inconsistent journal of message %08x: %s", message_id, e)
+            self._drop(message_id)
+            self.journal.discard(message_id)
+            message = self._messages[message_id] = _PartialMessage(now)
+        logger.info("Restored %d fragments of message %08x from its journal.", message.count, message_id)
+        return message
+
+    def close(self):
+        """
+        Sync and close the journal, if any; incomplete messages stay on disk.
+        """
+        if self.journal is not None:
+            with self.lock:
+                self.journal.close()
+
+    def _complete(self, message_id, message, now):
+        if self.journal is not None:
+            self.journal.discard(message_id)
+        self._drop(message_id)
+        self._completed[message_id] = now
+        if len(self._completed) > self.completed_history:
+            self._completed.popitem(last=False)
+        self.stats['completed'] += 1
+        self._wait_seconds.observe(now - message.started)
+        if message.fragment_size is None:
+            # A single-fragment message never learns a fragment size
+            data = bytearray(message.unplaced[0])
+        else:
+            data = message.buffer
+            del data[(message.total - 1) * message.fragment_size + message.last_length:]
+        if message.compressed:
+            # Inflated messages are held to the same budget as buffered ones
+            data = bytearray(self.core.decompress(data, self.max_bytes))
+        logger.debug("Reassembled message %08x: %d bytes from %d fragments.", message_id, len(data), message.total)
+        return data
@@ -0,0 +1,408 @@
+# fmp/reliability.py
+
+import time
+import queue
+import struct
+import selectors
+import threading
+import logging
+from collections import OrderedDict, deque
+from fmp.core import FRAGMENT_HEADER, FLAG_PARITY
+from fmp.probing import RTT_GAIN, JITTER_GAIN
+from fmp.scheduler import select_best_path
+from fmp.streams import RETRANSMIT_STREAM
+
+# Handlers and levels are left to the application; see fmp/__init__.py
+logger = logging.getLogger(__name__)
+
+# Selective acknowledgement sent back by receivers: magic, flags, message id, cumulative base
+# (every index below it was received), bitmap length, then a bitmap whose bit i (little endian)
+# marks fragment base + i as received
+SACK = struct.Struct('!4sBIIH')
+SACK_MAGIC = b'FMPA'
+SACK_COMPLETE = 0x01
+MAX_SACK_BITMAP = 1024
+
+# Progress query from a reconnecting sender (magic, message id), answered by the receiver
+# with: magic, flags, message id, fragment size (0 while unknown), total, then a bitmap whose
+# bit i (little endian) marks fragment i as received. Fragments beyond the bitmap, which is
+# capped to fit one datagram, are reported missing and so at worst sent again.
+PROGRESS_QUERY = struct.Struct('!4sI')
+PROGRESS_QUERY_MAGIC = b'FMPQ'
+PROGRESS_REPLY = struct.Struct('!4sBIHI')
+PROGRESS_REPLY_MAGIC = b'FMPR'
+PROGRESS_HELD = 0x01
+MAX_PROGRESS_BITMAP = 60000
+
+# AIMD congestion window per path, in fragments
+INITIAL_WINDOW = 10
+MIN_WINDOW = 2
+MAX_WINDOW = 1024
+# A fragment is presumed lost once this many later fragments of its message, sent on
+# the same path, were acknowledged
+DUPLICATE_THRESHOLD = 3
+MIN_RTO = 0.05
+MAX_RTO = 2.0
+MAX_RETRANSMITS = 8
+TICK = 0.01
+
+
+def is_sack(packet):
+    return len(packet) >= SACK.size and packet[:4] == SACK_MAGIC
+
+
+def pack_sack(message_id, base, bitmap=b'', complete=False):
+    bitmap = bitmap[:MAX_SACK_BITMAP]
+    return SACK.pack(SACK_MAGIC, SACK_COMPLETE if complete else 0, message_id, base, len(bitmap)) + bitmap
+
+
+def unpack_sack(packet):
+    """
+    Returns (message_id, base, bitmap as an integer, complete).
+    """
+    _, flags, message_id, base, length = SACK.unpack_from(packet)
+    if len(packet) < SACK.size + length:
+        raise ValueError("Truncated selective acknowledgement.")
+    bitmap = int.from_bytes(packet[SACK.size:SACK.size + length], 'little')
+    return message_id, base, bitmap, bool(flags & SACK_COMPLETE)
+
+
+def is_progress_query(packet):
+    return len(packet) == PROGRESS_QUERY.size and packet[:4] == PROGRESS_QUERY_MAGIC
+
+
+def pack_progress_query(message_id):
+    return PROGRESS_QUERY.pack(PROGRESS_QUERY_MAGIC, message_id)
+
+
+def unpack_progress_query(packet):
+    return PROGRESS_QUERY.unpack(packet)[1]
+
+
+def pack_progress(message_id, fragment_size=None, total=0, missing=None):
+    """
+    Reply to a progress query. Without missing, the receiver holds nothing for the message.
+    """
+    if missing is None:
+        return PROGRESS_REPLY.pack(PROGRESS_REPLY_MAGIC, 0, message_id, 0, 0)
+    bitmap = bytearray(b'\xff' * min(-(-total // 8), MAX_PROGRESS_BITMAP))
+    for index in missing:
+        if index >> 3 < len(bitmap):
+            bitmap[index >> 3] &= ~(1 << (index & 7))
+    return PROGRESS_REPLY.pack(PROGRESS_REPLY_MAGIC, PROGRESS_HELD, message_id, fragment_size or 0, total) + bitmap
+
+
+def unpack_progress(packet):
+    """
+    Returns (message_id, fragment_size or None, total, missing indices), with missing None
+    when the receiver holds nothing for the message.
+    """
+    if len(packet) < PROGRESS_REPLY.size or packet[:4] != PROGRESS_REPLY_MAGIC:
+        raise ValueError("Not a progress reply.")
+    _, flags, message_id, fragment_size, total = PROGRESS_REPLY.unpack_from(packet)
+    if not flags & PROGRESS_HELD:
+        return message_id, None, 0, None
+    bitmap = packet[PROGRESS_REPLY.size:]
+    missing = [index for index in range(total)
+               if index >> 3 >= len(bitmap) or not bitmap[index >> 3] & (1 << (index & 7))]
+    return message_id, fragment_size or None, total, missing
+
+
+class PathWindow:
+    """
+    AIMD congestion window and RFC 6298 retransmission timer for one path.
+    Slow start doubles the window every round trip up to ssthresh, then it grows by one
+    fragment per round trip; a loss halves it once per window and a timeout collapses it.
+    """
+
+    def __init__(self, latency=0.05, jitter=0.0):
+        self.cwnd = float(INITIAL_WINDOW)
+        self.ssthresh = float(MAX_WINDOW)
+        self.srtt = latency
+        self.rttvar = max(jitter, latency / 2)
+        self.reserved = 0  # Acquired by a sender but not yet handed to the transport
+        self.in_flight = OrderedDict()  # (message id, index) -> _Transmission, in send order
+        self.next_seq = 0
+        self.highest_acked = -1
+        self.recovery_seq = -1
+
+    def available(self):
+        return self.reserved + len(self.in_flight) < int(self.cwnd)
+
+    def rto(self):
+        return min(MAX_RTO, max(MIN_RTO, self.srtt + 4 * self.rttvar))
+
+    def on_ack(self, rtt=None):
+        if rtt is not None:
+            self.rttvar += JITTER_GAIN * (abs(self.srtt - rtt) - self.rttvar)
+            self.srtt += RTT_GAIN * (rtt - self.srtt)
+        if self.cwnd < self.ssthresh:
+            self.cwnd += 1
+        else:
+            self.cwnd += 1 / self.cwnd
+        self.cwnd = min(self.cwnd, MAX_WINDOW)
+
+    def on_loss(self, seq, timeout=False):
+        if timeout:
+            self.ssthresh = max(self.cwnd / 2, MIN_WINDOW)
+            self.cwnd = MIN_WINDOW
+            self.recovery_seq = self.next_seq
+        elif seq > self.recovery_seq:
+            # Only the first loss of a window cuts it
+            self.cwnd = self.ssthresh = max(self.cwnd / 2, MIN_WINDOW)
+            self.recovery_seq = self.next_seq
+
+
+class _Transmission:
+    __slots__ = ('fragment', 'key', 'path', 'seq', 'sent_at', 'attempts')
+
+    def __init__(self, fragment, key, path, seq, sent_at, attempts):
+        self.fragment = fragment
+        self.key = key
+        self.path = path
+        self.seq = seq
+        self.sent_at = sent_at
+        self.attempts = attempts
+
+
+class ReliabilityEngine:
+    """
+    Selective-ACK retransmission for a Router.
+    Every data fragment is held until the receiver's SACK bitmaps cover it. Gaps are
+    detected from acknowledgements of later fragments of the same message on the same
+    path, or by the path's retransmission timer, and resent on the best other active path. Each path sends at most its
+    congestion window of unacknowledged fragments, so a slow or lossy path throttles
+    itself while the scheduler keeps the others busy.
+    """
+
+    def __init__(self, router, max_retransmits=MAX_RETRANSMITS):
+        self.router = router
+        self.max_retransmits = max_retransmits
+        self.windows = {
+            path: PathWindow(metrics['latency'], metrics['jitter']) for path, metrics in router.paths.items()
+        }
+        self.condition = threading.Condition()
+        self.transfers = {}  # message id -> {index: latest _Transmission}
+        # Highest acknowledged send sequence per (message id, path). Acknowledgements for
+        # different messages travel on different paths, so losses are only inferred within a message.
+        self._acked_seq = {}
+        self.stats = {'acked': 0, 'fast_retransmits': 0, 'timeouts': 0, 'retransmits': 0, 'failed': 0}
+        self._retransmits = deque()
+        self._selector = selectors.DefaultSelector()
+        self._registered = {}
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._selector.close()
+
+    def acquire(self):
+        """
+        Reserve a send slot on the path the scheduler picks among active paths with
+        congestion window to spare, waiting while every window is full.
+        Returns None when no path is active.
+        """
+        with self.condition:
+            while True:
+                path = self.router.select_path(lambda path: self.windows[path].available())
+                if path is not None:
+                    self.windows[path].reserved += 1
+                    return path
+                if not any(metrics['active'] for metrics in self.router.paths.values()):
+                    return None
+                self.condition.wait(TICK)
+
+    def sending(self, fragment, path):
+        """
+        Record a fragment about to be handed to the transport on path.
+        Parity fragments are neither acknowledged nor retransmitted.
+        """
+        _, flags, _, message_id, index, _, _ = FRAGMENT_HEADER.unpack_from(fragment)
+        with self.condition:
+            window = self.windows[path]
+            window.reserved = max(0, window.reserved - 1)
+            if flags & FLAG_PARITY:
+                self.condition.notify_all()
+                return
+            transfer = self.transfers.setdefault(message_id, {})
+            previous = transfer.get(index)
+            key = (message_id, index)
+            transmission = _Transmission(fragment, key, path, window.next_seq, time.monotonic(),
+                                         previous.attempts + 1 if previous else 1)
+            window.next_seq += 1
+            window.in_flight[key] = transmission
+            transfer[index] = transmission
+
+    def send_failed(self, fragment, path):
+        """
+        Treat a fragment the transport could not send as lost, so it is resent elsewhere.
+        """
+        _, flags, _, message_id, index, _, _ = FRAGMENT_HEADER.unpack_from(fragment)
+        with self.condition:
+            transmission = self.windows[path].in_flight.get((message_id, index))
+            if transmission is not None:
+                self._lose(transmission, timeout=True)
+
+    def pending(self):
+        """
+        Return the number of fragments sent but not yet acknowledged.
+        """
+        with self.condition:
+            return sum(len(transfer) for transfer in self.transfers.values())
+
+    def wait(self, timeout=None):
+        """
+        Block until every sent fragment is acknowledged or given up on.
+        Returns False if timeout seconds pass first.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.condition:
+            while self.transfers or self._retransmits:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.condition.wait(TICK if remaining is None else min(TICK, remaining))
+        return True
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._sync_connections()
+            if self._registered:
+                events = self._selector.select(TICK)
+            else:
+                self._stopped.wait(TICK)
+                events = []
+            for key, _ in events:
+                path = key.data
+                try:
+                    packets = self.router.transport.receive(key.fileobj)
+                except OSError:
+                    self._selector.unregister(key.fileobj)
+                    del self._registered[path]
+                    self.router.transport.close_path(path)
+                    continue
+                for packet in packets:
+                    if is_sack(packet):
+                        self._on_sack(packet)
+            with self.condition:
+                now = time.monotonic()
+                for path in self.windows:
+                    self._detect_losses(path, now)
+                self._dispatch_retransmits()
+                self.condition.notify_all()
+
+    def _sync_connections(self):
+        """
+        Watch every pooled transport connection for acknowledgements.
+        """
+        connections = dict(self.router.transport.connections)
+        for path, conn in list(self._registered.items()):
+            if connections.get(path) is not conn:
+                self._selector.unregister(conn)
+                del self._registered[path]
+        for path, conn in connections.items():
+            if path not in self._registered and path in self.windows:
+                self._selector.register(conn, selectors.EVENT_READ, path)
+                self._registered[path] = conn
+
+    def _on_sack(self, packet):
+        try:
+            message_id, base, bitmap, complete = unpack_sack(packet)
+        except (ValueError, struct.error) as e:
+            logger.warning("Dropped malformed acknowledgement: %s", e)
+            return
+        with self.condition:
+            transfer = self.transfers.get(message_id)
+            if transfer is None:
+                return
+            now = time.monotonic()
+            acked_paths = set()
+            for index in list(transfer):
+                if not (complete or index < base or (bitmap >> (index - base)) & 1):
+                    continue
+                transmission = transfer.pop(index)
+                window = self.windows[transmission.path]
+                if window.in_flight.pop(transmission.key, None) is not None:
+                    # Karn's rule: only first transmissions give unambiguous RTT samples
+                    window.on_ack(now - transmission.sent_at if transmission.attempts == 1 else None)
+                    window.highest_acked = max(window.highest_acked, transmission.seq)
+                    key = (message_id, transmission.path)
+                    self._acked_seq[key] = max(self._acked_seq.get(key, -1), transmission.seq)
+                    acked_paths.add(transmission.path)
+                self.stats['acked'] += 1
+            if not transfer:
+                self._finish(message_id)
+            for path in acked_paths:
+                self._detect_losses(path, now)
+            self.condition.notify_all()
+
+    def _finish(self, message_id):
+        del self.transfers[message_id]
+        for path in self.windows:
+            self._acked_seq.pop((message_id, path), None)
+
+    def _detect_losses(self, path, now):
+        window = self.windows[path]
+        rto = window.rto()
+        lost = []
+        for transmission in window.in_flight.values():
+            acked_seq = self._acked_seq.get((transmission.key[0], path), -1)
+            if transmission.seq <= acked_seq - DUPLICATE_THRESHOLD:
+                lost.append((transmission, False))
+            elif now - transmission.sent_at > rto * 2 ** (transmission.attempts - 1):
+                lost.append((transmission, True))
+            elif transmission.seq > window.highest_acked - DUPLICATE_THRESHOLD:
+                break  # In send order: nothing later can be presumed lost yet
+        for transmission, timeout in lost:
+            self._lose(transmission, timeout)
+
+    def _lose(self, transmission, timeout):
+        window = self.windows[transmission.path]
+        window.in_flight.pop(transmission.key, None)
+        window.on_loss(transmission.seq, timeout)
+        self.stats['timeouts' if timeout else 'fast_retransmits'] += 1
+        message_id, index = transmission.key
+        if transmission.attempts > self.max_retransmits:
+            transfer = self.transfers.get(message_id)
+            if transfer is not None:
+                transfer.pop(index, None)
+                if not transfer:
+                    self._finish(message_id)
+            self.stats['failed'] += 1
+            logger.error("Gave up on fragment %d of message %08x after %d attempts.",
+                         index, message_id, transmission.attempts)
+            return
+        self._retransmits.append(transmission)
+
+    def _dispatch_retransmits(self):
+        """
+        Queue lost fragments on the best active path other than the one that lost them.
+        """
+        while self._retransmits:
+            transmission = self._retransmits[0]
+            message_id, index = transmission.key
+            if self.transfers.get(message_id, {}).get(index) is not transmission:
+                self._retransmits.popleft()  # Acknowledged in the meantime
+                continue
+            with self.router.lock:
+                others = {path: metrics for path, metrics in self.router.paths.items()
+                          if path != transmission.path and path in self.windows}
+                path = select_best_path(others)
+                if path is None and self.router.paths[transmission.path]['active']:
+                    path = transmission.path
+            if path is None:
+                return
+            try:
+                self.router.queues[path].put_nowait((transmission.fragment, time.monotonic(), RETRANSMIT_STREAM))
+            except queue.Full:
+                return
+            self._retransmits.popleft()
+            self.windows[path].reserved += 1
+            self.stats['retransmits'] += 1
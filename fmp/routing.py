@@ -1,80 +1,278 @@
 # fmp/routing.py
 
-import random
 import time
+import queue
+import itertools
 import threading
 import logging
+from fmp.transport import create_transport
+from fmp.scheduler import WeightedRoundRobinScheduler
+from fmp.probing import PathProber, initial_metrics, record_failure
+from fmp.reliability import ReliabilityEngine
+from fmp.metrics import REGISTRY, path_label
+from fmp.sizing import FragmentSizer
+from fmp.streams import FairQueue
 
-# Configure logging
+# Handlers and levels are left to the application; see fmp/__init__.py
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.DEBUG)  # Set to DEBUG for detailed logs
-handler = logging.StreamHandler()
-formatter = logging.Formatter('[%(asctime)s] %(levelname)s - %(message)s')
-handler.setFormatter(formatter)
-logger.addHandler(handler)
+
+# Fragments a path worker hands to the transport at once
+DEFAULT_BATCH_SIZE = 64
 
 class Router:
-    def __init__(self, paths):
+    def __init__(self, paths, transport='udp', queue_size=1024, scheduler=None, probe_interval=1.0, reliable=False,
+                 metrics=None, batch_size=DEFAULT_BATCH_SIZE, flush_interval=0.0):
         """
         Initialize with a list of paths.
         Each path is a tuple of (IP, port).
+        transport is 'udp', 'tcp' or a Transport instance shared with other routers.
+        Each path gets one worker draining a send queue bounded to queue_size fragments;
+        send_fragment blocks while the selected path's queue is full.
+        scheduler picks the path for each fragment; by default fragments are striped
+        across all active paths with WeightedRoundRobinScheduler. Schedulers with a table
+        method are consulted only when path metrics change (see select_path).
+        Paths start active with a neutral latency prior and are measured by a background
+        PathProber every probe_interval seconds (None disables background probing).
+        With reliable=True a ReliabilityEngine holds every fragment until the receiver
+        acknowledges it, retransmits gaps and limits each path to its congestion window.
+        metrics is the Registry per-path counters and queue delays are recorded in
+        (fmp.metrics.REGISTRY by default).
+        Workers take up to batch_size queued fragments at a time and send them with one
+        transport call. A worker finding fewer waiting keeps collecting for up to
+        flush_interval seconds; the default 0 sends whatever is queued at once, so batches
+        form only under load and never add latency.
         """
-        self.paths = {path: {'latency': float('inf'), 'score': 0.0, 'active': True} for path in paths}
+        if batch_size < 1:
+            raise ValueError("batch_size must be at least 1.")
+        if flush_interval < 0:
+            raise ValueError("flush_interval must not be negative.")
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.paths = {path: initial_metrics() for path in paths}
         self.lock = threading.Lock()
-        self.score_paths()
+        self.transport = create_transport(transport)
+        self.scheduler = scheduler or WeightedRoundRobinScheduler()
+        # Queue entries are (fragment, time queued, stream id): workers measure queueing delay,
+        # and each path's queue serves streams fairly (see FairQueue)
+        self.queues = {path: FairQueue(maxsize=queue_size) for path in paths}
+        self.metrics = metrics or REGISTRY
+        self._path_metrics = {path: self._instruments(path) for path in paths}
+        self.sizer = FragmentSizer()
+        # Copy-on-write selection table: replaced whole under self.lock, read without it
+        self._table = None
+        self._tickets = itertools.count()
+        self.rebuild_selection()
+        self.workers = {
+            path: threading.Thread(target=self._drain, args=(path,), daemon=True) for path in paths
+        }
+        for worker in self.workers.values():
+            worker.start()
+        self.reliability = None
+        if reliable:
+            self.reliability = ReliabilityEngine(self)
+            self.reliability.start()
+        self.prober = PathProber(self)
+        if probe_interval is not None:
+            self.prober.interval = probe_interval
+            self.prober.start()
 
-    def score_paths(self):
+    def _instruments(self, path):
         """
-        Simulate scoring paths based on latency.
-        In a real implementation, actual latency probing would be performed.
+        Per-path metric children, looked up once so the send loop only increments.
         """
-        for path in self.paths:
-            latency = self._probe_path_latency(path)
-            with self.lock:
-                self.paths[path]['latency'] = latency
-                self.paths[path]['score'] = 1.0 / (latency + 1e-6)  # Avoid division by zero
-            logger.debug(f"Path {path} scored with latency {latency:.3f}s and score {self.paths[path]['score']:.6f}")
+        label = path_label(path)
+        return (
+            self.metrics.counter('fmp_path_fragments_sent_total', "Fragments handed to the transport per path.",
+                                 ('path',)).labels(label),
+            self.metrics.counter('fmp_path_bytes_sent_total', "Fragment bytes handed to the transport per path.",
+                                 ('path',)).labels(label),
+            self.metrics.counter('fmp_path_send_failures_total', "Fragments the transport failed to send per path.",
+                                 ('path',)).labels(label),
+            self.metrics.histogram('fmp_path_queue_delay_seconds', "Time fragments wait in a path's send queue.",
+                                   ('path',)).labels(label),
+        )
 
-    def _probe_path_latency(self, path):
+    def fragment_size(self, overhead):
         """
-        Simulate latency probing.
-        Replace with real latency measurement in production.
+        Payload size for the next message's fragments, given overhead bytes of framing per
+        fragment: capped to every active path's MTU and tuned to their bandwidth and loss
+        (see FragmentSizer). A path's MTU is looked up the first time it is needed and
+        refreshed by the prober.
         """
-        simulated_latency = random.uniform(0.01, 0.1)  # Simulated latency between 10ms to 100ms
-        time.sleep(simulated_latency)  # Simulate probing delay
-        return simulated_latency
+        for path, metrics in self.paths.items():
+            if 'max_datagram' not in metrics:
+                limit = self.transport.max_datagram_size(path)
+                with self.lock:
+                    metrics['max_datagram'] = limit
+        with self.lock:
+            active = [metrics for metrics in self.paths.values() if metrics['active']]
+            return self.sizer.update(active or self.paths.values(), overhead)
 
-    def send_fragment(self, fragment):
+    def rebuild_selection(self):
         """
-        Send fragment through the best scored active path.
-        If the best path fails, fallback to the next best path.
+        Recompute the selection table from the current path metrics. The prober and failed
+        sends call this; call it after changing router.paths directly.
         """
         with self.lock:
-            sorted_paths = sorted(self.paths.items(), key=lambda item: item[1]['score'], reverse=True)
-            for path, metrics in sorted_paths:
-                if metrics['active']:
-                    selected_path = path
-                    break
-            else:
-                logger.error("No active paths available to send fragment.")
+            self._rebuild_selection()
+
+    def _rebuild_selection(self):
+        # Caller holds self.lock
+        table = getattr(self.scheduler, 'table', None)
+        self._table = None if table is None else table(self.paths)
+
+    def select_path(self, eligible=None):
+        """
+        Return the path for the next fragment, or None when no active path is eligible.
+        eligible optionally filters paths (a callable taking the path).
+        Dispatch takes the next slot of the precomputed selection table, which costs O(1)
+        without a lock however many paths and senders there are. Slots of paths that went
+        inactive or are not eligible are skipped until the table is rebuilt. Schedulers
+        without a table method fall back to select under the router lock.
+        """
+        table = self._table
+        if table is None:
+            with self.lock:
+                paths = self.paths
+                if eligible is not None:
+                    paths = {path: metrics for path, metrics in paths.items() if eligible(path)}
+                return self.scheduler.select(paths)
+        size = len(table)
+        if size:
+            ticket = next(self._tickets)
+            paths = self.paths
+            for offset in range(size):
+                path = table[(ticket + offset) % size]
+                if paths[path]['active'] and (eligible is None or eligible(path)):
+                    return path
+        return None
+
+    def score_paths(self):
+        """
+        Probe every path once, synchronously, and update its scores.
+        """
+        self.prober.probe_once()
+
+    def send_fragment(self, fragment, stream_id=0):
+        """
+        Queue fragment on the active path chosen by the scheduler, behind the other
+        fragments of its stream.
+        Paths marked inactive are skipped until they are re-scored.
+        In reliable mode only paths with congestion window to spare are eligible.
+        """
+        if self.reliability is not None:
+            selected_path = self.reliability.acquire()
+        else:
+            selected_path = self.select_path()
+        if selected_path is None:
+            logger.error("No active paths available to send fragment.")
+            return
+
+        # Blocks while the path's queue is full, applying backpressure to the sender
+        self.queues[selected_path].put((fragment, time.monotonic(), stream_id))
+
+    def queue_depths(self):
+        """
+        Return the number of fragments waiting in each path's send queue.
+        """
+        return {path: q.qsize() for path, q in self.queues.items()}
+
+    def flush(self):
+        """
+        Block until every queued fragment has been handed to the transport.
+        """
+        for q in self.queues.values():
+            q.join()
+
+    def _drain(self, path):
+        """
+        Worker loop sending queued fragments for a single path in batches until a None
+        sentinel arrives.
+        """
+        q = self.queues[path]
+        queue_delay = self._path_metrics[path][3]
+        while True:
+            batch = self._collect(q)
+            try:
+                fragments = []
+                now = time.monotonic()
+                for entry in batch:
+                    if entry is not None:
+                        fragment, queued_at, _ = entry
+                        queue_delay.observe(now - queued_at)
+                        fragments.append(fragment)
+                if fragments:
+                    self._send(fragments, path)
+            finally:
+                for _ in batch:
+                    q.task_done()
+            if batch[-1] is None:
                 return
 
-        threading.Thread(target=self._send, args=(fragment, selected_path), daemon=True).start()
+    def _collect(self, q):
+        """
+        Block for one queue entry, then take whatever else is waiting, up to batch_size
+        entries, waiting at most flush_interval for more. Stops at the None sentinel.
+        """
+        entry = q.get()
+        batch = [entry]
+        deadline = time.monotonic() + self.flush_interval if self.flush_interval else None
+        while entry is not None and len(batch) < self.batch_size:
+            try:
+                entry = q.get_nowait()
+            except queue.Empty:
+                if deadline is None:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    entry = q.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            batch.append(entry)
+        return batch
 
-    def _send(self, fragment, path):
+    def _send(self, fragments, path):
         """
-        Simulate sending fragment.
-        Replace with actual network transmission in production.
+        Send a batch of fragments over the path's pooled transport connection.
         """
+        if self.reliability is not None:
+            for fragment in fragments:
+                self.reliability.sending(fragment, path)
+        sent, sent_bytes, failures, _ = self._path_metrics[path]
         try:
-            # Simulated send delay based on path latency
-            time.sleep(self.paths[path]['latency'])
-            # Here you would implement actual send logic, e.g., socket transmission
-            # For MVP, we simulate successful send
-            logger.info(f"Sent fragment via {path} with latency {self.paths[path]['latency']:.3f}s")
+            send_batch = getattr(self.transport, 'send_batch', None)
+            if send_batch is not None:
+                send_batch(path, fragments)
+            else:
+                # Transports implementing only send
+                for fragment in fragments:
+                    self.transport.send(path, fragment)
+            sent.inc(len(fragments))
+            sent_bytes.inc(sum(map(len, fragments)))
         except Exception as e:
-            logger.error(f"Failed to send fragment via {path}: {e}")
+            failures.inc(len(fragments))
+            logger.error(f"Failed to send {len(fragments)} fragment(s) via {path}: {e}")
+            if self.reliability is not None:
+                for fragment in fragments:
+                    self.reliability.send_failed(fragment, path)
             with self.lock:
-                self.paths[path]['active'] = False  # Mark path as inactive on failure
-            # Optionally, trigger re-scoring of paths
-            self.score_paths()
+                # Mark path as inactive on failure; the prober re-admits it once it answers again
+                record_failure(self.paths[path], self.prober.failure_threshold)
+                self.paths[path]['active'] = False
+                self._rebuild_selection()
+
+    def close(self):
+        """
+        Send everything still queued, stop the path workers and the prober,
+        and close every pooled transport connection.
+        """
+        self.prober.stop()
+        if self.reliability is not None:
+            self.reliability.stop()
+        for q in self.queues.values():
+            q.put(None)
+        for worker in self.workers.values():
+            worker.join()
+        self.transport.close()
@@ -0,0 +1,77 @@
+# fmp/scheduler.py
+
+# Picks precomputed per selection table; a path's share is accurate to about 1/TABLE_SIZE
+TABLE_SIZE = 256
+
+def path_weight(metrics, use_bandwidth):
+    """
+    Relative share of fragments a path should carry: its measured bandwidth,
+    or the latency-based score when bandwidth is not known for every path.
+    """
+    return metrics['bandwidth'] if use_bandwidth else metrics['score']
+
+
+def select_best_path(paths):
+    """
+    Return the best scored active path from a Router-style paths dict, or None if none is active.
+    """
+    sorted_paths = sorted(paths.items(), key=lambda item: item[1]['score'], reverse=True)
+    for path, metrics in sorted_paths:
+        if metrics['active']:
+            return path
+    return None
+
+
+class BestPathScheduler:
+    """
+    Send every fragment through the single best scored active path.
+    """
+
+    def select(self, paths):
+        return select_best_path(paths)
+
+    def table(self, paths, size=TABLE_SIZE):
+        """
+        Selection table for Router: the best path alone, or () when no path is active.
+        """
+        best = select_best_path(paths)
+        return () if best is None else (best,)
+
+
+class WeightedRoundRobinScheduler:
+    """
+    Stripe fragments across all active paths using smooth weighted round-robin.
+    Over any window each path receives fragments in proportion to path_weight,
+    and picks for the same path are spread out rather than sent in bursts.
+    """
+
+    def __init__(self):
+        self.current = {}
+
+    def select(self, paths):
+        """
+        Return the next path to use from a Router-style paths dict, or None if none is active.
+        """
+        active = [(path, metrics) for path, metrics in paths.items() if metrics['active']]
+        # Bandwidths and scores are not comparable, so only mix paths on one kind of weight
+        use_bandwidth = all(metrics.get('bandwidth') for _, metrics in active)
+        selected = None
+        total = 0.0
+        for path, metrics in active:
+            weight = path_weight(metrics, use_bandwidth)
+            total += weight
+            current = self.current.get(path, 0.0) + weight
+            self.current[path] = current
+            if selected is None or current > self.current[selected]:
+                selected = path
+        if selected is not None:
+            self.current[selected] -= total
+        return selected
+
+    def table(self, paths, size=TABLE_SIZE):
+        """
+        Precompute the next size picks as a tuple, so a dispatcher can cycle through it
+        instead of calling select for every fragment. Returns () when no path is active.
+        """
+        picks = tuple(self.select(paths) for _ in range(size))
+        return () if picks[0] is None else picks
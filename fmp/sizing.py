@@ -0,0 +1,71 @@
+# fmp/sizing.py
+
+import logging
+from fmp.core import MAX_FRAGMENT_SIZE
+
+# Handlers and levels are left to the application; see fmp/__init__.py
+logger = logging.getLogger(__name__)
+
+# fragment_size value asking the protocols to size fragments per message from path measurements
+AUTO = 'auto'
+# Size FMPCore starts from (and uses for receive-only protocols) in auto mode
+AUTO_INITIAL_SIZE = 1200
+MIN_FRAGMENT_SIZE = 256
+# A fragment should occupy a path for about this long, so fast paths get large fragments
+# while slow paths keep small ones and striping stays fine grained
+SERIALIZATION_TARGET = 0.001
+# Each point of loss shrinks fragments by LOSS_PENALTY points (down to MIN_LOSS_SCALE):
+# a lost fragment costs its whole size again and stalls reassembly for longer
+LOSS_PENALTY = 4.0
+MIN_LOSS_SCALE = 0.25
+# Re-tune only when the ideal size moved by more than this fraction
+RETUNE_THRESHOLD = 0.2
+ALIGNMENT = 16
+
+
+def path_fragment_size(metrics, overhead):
+    """
+    Ideal payload size for one path from its metrics: never more than fits the path's
+    largest datagram after overhead bytes of fragment framing, scaled to its bandwidth
+    and shrunk on lossy paths.
+    """
+    limit = metrics.get('max_datagram')
+    cap = MAX_FRAGMENT_SIZE if limit is None else min(MAX_FRAGMENT_SIZE, limit - overhead)
+    size = cap
+    if metrics.get('bandwidth'):
+        size = min(size, metrics['bandwidth'] * SERIALIZATION_TARGET)
+    size *= max(MIN_LOSS_SCALE, 1.0 - LOSS_PENALTY * metrics.get('loss', 0.0))
+    size = max(MIN_FRAGMENT_SIZE, int(size) // ALIGNMENT * ALIGNMENT)
+    return max(1, min(cap, size))
+
+
+class FragmentSizer:
+    """
+    Per-message fragment size for a set of paths.
+    Every fragment of a message may be striped onto any path, so a message uses the
+    smallest size among the active paths. The size follows the path measurements with
+    some hysteresis, but always shrinks at once when it no longer fits a path.
+    """
+
+    def __init__(self, initial=None):
+        self.current = initial
+
+    def update(self, paths_metrics, overhead):
+        """
+        Re-tune from an iterable of path metrics dicts and return the fragment size to use.
+        """
+        sizes = []
+        caps = []
+        for metrics in paths_metrics:
+            sizes.append(path_fragment_size(metrics, overhead))
+            limit = metrics.get('max_datagram')
+            caps.append(MAX_FRAGMENT_SIZE if limit is None else limit - overhead)
+        if not sizes:
+            return self.current
+        ideal = min(sizes)
+        current = self.current
+        if current is None or current > min(caps) or abs(ideal - current) > RETUNE_THRESHOLD * current:
+            if current != ideal:
+                logger.debug("Fragment size re-tuned from %s to %d bytes.", current, ideal)
+            self.current = ideal
+        return self.current
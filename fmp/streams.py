@@ -0,0 +1,105 @@
+# fmp/streams.py
+
+import queue
+import logging
+from collections import deque
+
+# Handlers and levels are left to the application; see fmp/__init__.py
+logger = logging.getLogger(__name__)
+
+# Bytes a stream may send per round-robin turn; about one MTU keeps streams finely interleaved
+STREAM_QUANTUM = 1500
+# Queue key of fragments resent by the reliability engine, served as a stream of their own
+RETRANSMIT_STREAM = -1
+
+
+class FairQueue(queue.Queue):
+    """
+    Bounded queue of (fragment, queued_at, stream_id) entries that serves streams by
+    deficit round-robin instead of first in, first out: each turn a stream may take
+    STREAM_QUANTUM bytes (at least one fragment), so a bulk transfer cannot hold back a
+    small message behind everything it queued. Entries of one stream keep their order.
+    None sentinels are served once every stream is empty.
+    """
+
+    def __init__(self, maxsize=0, quantum=STREAM_QUANTUM):
+        self.quantum = quantum
+        super().__init__(maxsize)
+
+    # queue.Queue calls the hooks below with its mutex held
+    def _init(self, maxsize):
+        self.streams = {}  # stream id -> deque of entries
+        self.deficits = {}
+        self.turns = deque()  # Streams with entries, in service order
+        self.entries = 0
+        self.sentinels = deque()
+
+    def _qsize(self):
+        return self.entries + len(self.sentinels)
+
+    def _put(self, item):
+        if item is None:
+            self.sentinels.append(item)
+            return
+        stream_id = item[2]
+        entries = self.streams.get(stream_id)
+        if entries is None:
+            entries = self.streams[stream_id] = deque()
+            self.deficits[stream_id] = 0
+            self.turns.append(stream_id)
+        entries.append(item)
+        self.entries += 1
+
+    def _get(self):
+        if not self.entries:
+            return self.sentinels.popleft()
+        turns = self.turns
+        while True:
+            stream_id = turns[0]
+            entries = self.streams[stream_id]
+            cost = len(entries[0][0])
+            deficit = self.deficits[stream_id]
+            if deficit >= cost:
+                break
+            # Fragments larger than the quantum still get one per turn
+            self.deficits[stream_id] = deficit + max(self.quantum, cost)
+            turns.rotate(-1)
+        item = entries.popleft()
+        self.entries -= 1
+        if entries:
+            self.deficits[stream_id] = deficit - cost
+        else:
+            # An idle stream does not bank credit
+            del self.streams[stream_id], self.deficits[stream_id]
+            turns.popleft()
+        return item
+
+
+class Stream:
+    """
+    A logical stream of messages multiplexed over one FMPProtocol. Its fragments carry
+    the stream id, share the protocol's router and path connections, and are scheduled
+    fairly against other streams' fragments. Receivers see the id with every message
+    (see FMPProtocol.listen).
+    """
+
+    def __init__(self, protocol, stream_id):
+        self.protocol = protocol
+        self.id = stream_id
+
+    def send(self, data):
+        """
+        Send one message on this stream; see FMPProtocol.send_data.
+        Returns the message id, which FMPProtocol.resume_data needs.
+        """
+        return self.protocol.send_data(data, stream_id=self.id)
+
+    def send_stream(self, source):
+        """
+        Send a file-like object or byte iterator as one message on this stream.
+        """
+        self.protocol.send_stream(source, stream_id=self.id)
+
+    def __repr__(self):
+        return f"Stream({self.id})"
+
@@ -0,0 +1,515 @@
+# fmp/transport.py
+
+import os
+import time
+import socket
+import struct
+import secrets
+import selectors
+import threading
+import logging
+
+# Handlers and levels are left to the application; see fmp/__init__.py
+logger = logging.getLogger(__name__)
+
+# Stream paths carry each fragment behind a 4-byte big endian length prefix.
+FRAME_HEADER = struct.Struct('!I')
+MAX_DATAGRAM_SIZE = 65507
+RECEIVE_BUFFER_SIZE = 4 * 1024 * 1024
+# Acknowledgements a sender reads from one UDP connection per wake-up
+RECEIVE_BATCH = 64
+# Buffers per gathered write; Linux and the BSDs allow 1024
+try:
+    IOV_MAX = os.sysconf('SC_IOV_MAX')
+except (AttributeError, ValueError, OSError):
+    IOV_MAX = 1024
+
+# Path MTU lookup (Linux): a connected UDP socket reports the route MTU, lowered by any
+# fragmentation-needed errors the kernel has cached for the destination
+IP_MTU = getattr(socket, 'IP_MTU', 14)
+IPV6_MTU = getattr(socket, 'IPV6_MTU', 24)
+DEFAULT_MTU = 1500
+UDP_HEADER_SIZE = 8
+IP_HEADER_SIZES = {socket.AF_INET: 20, socket.AF_INET6: 40}
+
+# Probe datagrams: magic, sequence number, zero padding. Listeners echo them back unchanged.
+# They are padded so a back-to-back pair also yields a packet-pair bandwidth estimate.
+PROBE = struct.Struct('!4sI')
+PROBE_MAGIC = b'FMPP'
+PROBE_SIZE = 1200
+
+
+def is_probe(packet):
+    return len(packet) == PROBE_SIZE and packet[:4] == PROBE_MAGIC
+
+
+def resolve_path(path, socktype):
+    """
+    Resolve a (host, port) path to (family, sockaddr) for the given socket type.
+    """
+    host, port = path
+    family, _, _, _, sockaddr = socket.getaddrinfo(host, port, 0, socktype)[0]
+    return family, sockaddr
+
+
+def _split_frames(buffer):
+    """
+    Yield every complete length-prefixed frame in buffer and remove them from it.
+    """
+    offset = 0
+    while len(buffer) - offset >= FRAME_HEADER.size:
+        (length,) = FRAME_HEADER.unpack_from(buffer, offset)
+        end = offset + FRAME_HEADER.size + length
+        if len(buffer) < end:
+            break
+        yield bytes(buffer[offset + FRAME_HEADER.size:end])
+        offset = end
+    del buffer[:offset]
+
+
+def _send_vectored(sock, buffers):
+    """
+    Write buffers in order with gathered sendmsg calls (writev), resuming after partial writes.
+    """
+    if not hasattr(sock, 'sendmsg'):
+        sock.sendall(b''.join(buffers))
+        return
+    views = [memoryview(buffer) for buffer in buffers]
+    first = 0
+    while first < len(views):
+        sent = sock.sendmsg(views[first:first + IOV_MAX])
+        while first < len(views) and sent >= len(views[first]):
+            sent -= len(views[first])
+            first += 1
+        if sent:
+            views[first] = views[first][sent:]
+
+
+class Transport:
+    """
+    Base class for transports keeping one long-lived connection per path.
+    Subclasses implement _open (create the socket for a path) and _write, and may
+    override _write_batch to hand several fragments to the kernel at once.
+    """
+    name = None
+
+    def __init__(self):
+        self.connections = {}
+        self.lock = threading.Lock()
+
+    def connection(self, path):
+        """
+        Return the pooled socket for a path, opening it on first use.
+        """
+        conn = self.connections.get(path)
+        if conn is None:
+            with self.lock:
+                conn = self.connections.get(path)
+                if conn is None:
+                    conn = self._open(path)
+                    self.connections[path] = conn
+                    logger.debug(f"Opened {self.name} connection to {path}.")
+        return conn
+
+    def send(self, path, fragment):
+        """
+        Send a single fragment over the path's pooled connection.
+        On failure the connection is dropped so the next send reconnects.
+        """
+        conn = self.connection(path)
+        try:
+            self._write(conn, fragment)
+        except OSError:
+            self.close_path(path)
+            raise
+
+    def send_batch(self, path, fragments):
+        """
+        Send a list of fragments, in order, over the path's pooled connection with as few
+        system calls as the transport allows. On failure the connection is dropped and the
+        error raised; fragments before the failing one may already have been sent.
+        """
+        conn = self.connection(path)
+        try:
+            self._write_batch(conn, fragments)
+        except OSError:
+            self.close_path(path)
+            raise
+
+    def close_path(self, path):
+        with self.lock:
+            conn = self.connections.pop(path, None)
+        if conn is not None:
+            conn.close()
+
+    def close(self):
+        with self.lock:
+            conns = list(self.connections.values())
+            self.connections.clear()
+        for conn in conns:
+            conn.close()
+
+    def receive(self, conn):
+        """
+        Read the control packets (such as acknowledgements) a peer sent back on a pooled
+        connection that is ready for reading. Raises OSError when the connection is gone.
+        """
+        raise NotImplementedError
+
+    def probe(self, path, timeout):
+        """
+        Measure the path once. Returns (rtt_seconds, bandwidth_bytes_per_second or None).
+        Raises OSError (including socket.timeout) when the path does not answer.
+        """
+        raise NotImplementedError
+
+    def query(self, path, packet, timeout):
+        """
+        Send a control packet to the path's listener on a connection of its own and
+        return the first reply. Raises OSError (including socket.timeout) when the path
+        does not answer.
+        """
+        raise NotImplementedError
+
+    def max_datagram_size(self, path):
+        """
+        Largest fragment the path carries as one packet, or None when the transport
+        segments fragments itself and any size works.
+        """
+        return None
+
+    def _open(self, path):
+        raise NotImplementedError
+
+    def _write(self, conn, fragment):
+        raise NotImplementedError
+
+    def _write_batch(self, conn, fragments):
+        for fragment in fragments:
+            self._write(conn, fragment)
+
+
+class UDPTransport(Transport):
+    """
+    Send each fragment as one datagram on a connected UDP socket per path.
+    """
+    name = 'udp'
+
+    def _open(self, path):
+        family, sockaddr = resolve_path(path, socket.SOCK_DGRAM)
+        sock = socket.socket(family, socket.SOCK_DGRAM)
+        sock.connect(sockaddr)
+        return sock
+
+    def max_datagram_size(self, path):
+        """
+        UDP payload that fits the path MTU, so fragments are never split by IP fragmentation.
+        Falls back to a 1500 byte MTU where the kernel does not report one.
+        """
+        try:
+            family, sockaddr = resolve_path(path, socket.SOCK_DGRAM)
+        except OSError:
+            return DEFAULT_MTU - IP_HEADER_SIZES[socket.AF_INET6] - UDP_HEADER_SIZE
+        with socket.socket(family, socket.SOCK_DGRAM) as sock:
+            try:
+                sock.connect(sockaddr)
+                if family == socket.AF_INET6:
+                    mtu = sock.getsockopt(socket.IPPROTO_IPV6, IPV6_MTU)
+                else:
+                    mtu = sock.getsockopt(socket.IPPROTO_IP, IP_MTU)
+            except OSError:
+                mtu = DEFAULT_MTU
+        return min(MAX_DATAGRAM_SIZE, mtu - IP_HEADER_SIZES.get(family, 40) - UDP_HEADER_SIZE)
+
+    def _write(self, conn, fragment):
+        if len(fragment) > MAX_DATAGRAM_SIZE:
+            raise ValueError(f"Fragment of {len(fragment)} bytes exceeds the maximum datagram size.")
+        conn.send(fragment)
+
+    def _write_batch(self, conn, fragments):
+        # Still one datagram per fragment. sendmmsg is not in the socket module, and through
+        # ctypes its per-message setup costs more in CPython than the system calls it saves,
+        # so the batch is a tight loop without the per-fragment lookups of send
+        send = conn.send
+        for fragment in fragments:
+            if len(fragment) > MAX_DATAGRAM_SIZE:
+                raise ValueError(f"Fragment of {len(fragment)} bytes exceeds the maximum datagram size.")
+            send(fragment)
+
+    def receive(self, conn):
+        """
+        Read up to RECEIVE_BATCH waiting datagrams, so a burst of acknowledgements costs one
+        selector wake-up.
+        """
+        packets = []
+        flags = 0
+        try:
+            while len(packets) < RECEIVE_BATCH:
+                packets.append(conn.recv(MAX_DATAGRAM_SIZE, flags))
+                flags = getattr(socket, 'MSG_DONTWAIT', None)
+                if flags is None:
+                    break
+        except (BlockingIOError, ConnectionRefusedError):
+            # Connected UDP sockets report an unreachable listener here; the prober handles it
+            pass
+        return packets
+
+    def probe(self, path, timeout):
+        """
+        Send a back-to-back pair of probe datagrams to the path's listener.
+        The first echo gives the RTT; the spacing between the two echoes gives bandwidth.
+        """
+        family, sockaddr = resolve_path(path, socket.SOCK_DGRAM)
+        sequence = secrets.randbits(31)
+        with socket.socket(family, socket.SOCK_DGRAM) as sock:
+            sock.settimeout(timeout)
+            sock.connect(sockaddr)
+            probes = [PROBE.pack(PROBE_MAGIC, sequence + i).ljust(PROBE_SIZE, b'\0') for i in range(2)]
+            start = time.perf_counter()
+            for packet in probes:
+                sock.send(packet)
+            arrivals = []
+            try:
+                while len(arrivals) < 2:
+                    if sock.recv(PROBE_SIZE) in probes:
+                        arrivals.append(time.perf_counter())
+            except socket.timeout:
+                # A lost second echo still leaves a valid RTT sample
+                if not arrivals:
+                    raise
+        rtt = arrivals[0] - start
+        gap = arrivals[1] - arrivals[0] if len(arrivals) == 2 else 0.0
+        return rtt, (PROBE_SIZE / gap if gap > 0 else None)
+
+    def query(self, path, packet, timeout):
+        family, sockaddr = resolve_path(path, socket.SOCK_DGRAM)
+        with socket.socket(family, socket.SOCK_DGRAM) as sock:
+            sock.settimeout(timeout)
+            sock.connect(sockaddr)
+            sock.send(packet)
+            return sock.recv(MAX_DATAGRAM_SIZE)
+
+
+class _StreamConnection:
+    """
+    A persistent TCP connection; writes are serialized so frames never interleave.
+    """
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.lock = threading.Lock()
+        self.buffer = bytearray()  # Partial control frames sent back by the listener
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def close(self):
+        self.sock.close()
+
+
+class TCPTransport(Transport):
+    """
+    Send length-prefixed fragments over one persistent TCP stream per path.
+    """
+    name = 'tcp'
+
+    def _open(self, path):
+        sock = socket.create_connection(path)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return _StreamConnection(sock)
+
+    def _write(self, conn, fragment):
+        with conn.lock:
+            conn.sock.sendall(FRAME_HEADER.pack(len(fragment)) + fragment)
+
+    def _write_batch(self, conn, fragments):
+        # Frame headers and fragments go out in one gathered write instead of one send each
+        buffers = []
+        for fragment in fragments:
+            buffers.append(FRAME_HEADER.pack(len(fragment)))
+            buffers.append(fragment)
+        with conn.lock:
+            _send_vectored(conn.sock, buffers)
+
+    def receive(self, conn):
+        chunk = conn.sock.recv(RECEIVE_BUFFER_SIZE)
+        if not chunk:
+            raise ConnectionResetError("Listener closed the connection.")
+        conn.buffer += chunk
+        return list(_split_frames(conn.buffer))
+
+    def probe(self, path, timeout):
+        """
+        Time a TCP handshake to the path's listener; a connect takes one round trip.
+        """
+        start = time.perf_counter()
+        sock = socket.create_connection(path, timeout=timeout)
+        rtt = time.perf_counter() - start
+        sock.close()
+        return rtt, None
+
+    def query(self, path, packet, timeout):
+        with socket.create_connection(path, timeout=timeout) as sock:
+            sock.sendall(FRAME_HEADER.pack(len(packet)) + packet)
+            buffer = bytearray()
+            while True:
+                chunk = sock.recv(RECEIVE_BUFFER_SIZE)
+                if not chunk:
+                    raise ConnectionResetError("Listener closed the connection before replying.")
+                buffer += chunk
+                for frame in _split_frames(buffer):
+                    return frame
+
+
+TRANSPORTS = {
+    UDPTransport.name: UDPTransport,
+    TCPTransport.name: TCPTransport,
+}
+
+
+def create_transport(transport):
+    """
+    Return a transport instance for a name ('udp' or 'tcp'); instances are returned unchanged.
+    """
+    if not isinstance(transport, str):
+        return transport
+    try:
+        return TRANSPORTS[transport]()
+    except KeyError:
+        raise ValueError(f"Unknown transport: {transport}")
+
+
+class Listener:
+    """
+    Receive fragments on local (host, port) paths and pass each one to a callback.
+    A single background thread serves every path through a selector.
+    """
+
+    def __init__(self, paths, on_fragment, transport='udp'):
+        """
+        on_fragment is called as on_fragment(fragment, path) from the listener thread.
+        When it returns a packet (such as a selective acknowledgement), the packet is
+        sent back to the fragment's sender.
+        """
+        if transport not in TRANSPORTS:
+            raise ValueError(f"Unknown transport: {transport}")
+        self.paths = list(paths)
+        self.on_fragment = on_fragment
+        self.transport = transport
+        self.selector = selectors.DefaultSelector()
+        self.sockets = []
+        self._buffers = {}
+        self._wakeup_r, self._wakeup_w = socket.socketpair()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """
+        Bind every path and start serving. Returns the bound paths (useful with port 0).
+        """
+        self.selector.register(self._wakeup_r, selectors.EVENT_READ, None)
+        bound = []
+        for path in self.paths:
+            if self.transport == 'udp':
+                sock = self._bind_udp(path)
+                callback = self._read_datagrams
+            else:
+                sock = self._bind_tcp(path)
+                callback = self._accept
+            sock.setblocking(False)
+            self.sockets.append(sock)
+            local = sock.getsockname()[:2]
+            self.selector.register(sock, selectors.EVENT_READ, (callback, local))
+            bound.append(local)
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+        logger.debug(f"Listening for {self.transport} fragments on {bound}.")
+        return bound
+
+    def stop(self):
+        self._stopped.set()
+        self._wakeup_w.send(b'\0')
+        if self._thread is not None:
+            self._thread.join()
+        for key in list(self.selector.get_map().values()):
+            key.fileobj.close()
+        self.selector.close()
+        self._wakeup_w.close()
+
+    def _bind_udp(self, path):
+        family, sockaddr = resolve_path(path, socket.SOCK_DGRAM)
+        sock = socket.socket(family, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECEIVE_BUFFER_SIZE)
+        sock.bind(sockaddr)
+        return sock
+
+    def _bind_tcp(self, path):
+        family, sockaddr = resolve_path(path, socket.SOCK_STREAM)
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind(sockaddr)
+        sock.listen()
+        return sock
+
+    def _serve(self):
+        while not self._stopped.is_set():
+            for key, _ in self.selector.select():
+                if key.data is None:
+                    continue
+                callback, path = key.data
+                try:
+                    callback(key.fileobj, path)
+                except Exception as e:
+                    logger.error(f"Error handling fragment on {path}: {e}")
+
+    def _read_datagrams(self, sock, path):
+        while True:
+            try:
+                fragment, addr = sock.recvfrom(MAX_DATAGRAM_SIZE)
+            except (BlockingIOError, ConnectionRefusedError):
+                return
+            if is_probe(fragment):
+                sock.sendto(fragment, addr)
+                continue
+            reply = self.on_fragment(fragment, path)
+            if reply:
+                sock.sendto(reply, addr)
+
+    def _accept(self, sock, path):
+        conn, _ = sock.accept()
+        conn.setblocking(False)
+        self.selector.register(conn, selectors.EVENT_READ, (self._read_stream, path))
+        self._buffers[conn] = bytearray()
+
+    def _read_stream(self, conn, path):
+        buffer = self._buffers[conn]
+        try:
+            chunk = conn.recv(RECEIVE_BUFFER_SIZE)
+        except BlockingIOError:
+            return
+        except OSError:
+            chunk = b''
+        if not chunk:
+            self._close_stream(conn)
+            return
+        buffer += chunk
+        for fragment in _split_frames(buffer):
+            reply = self.on_fragment(fragment, path)
+            if not reply:
+                continue
+            frame = FRAME_HEADER.pack(len(reply)) + reply
+            try:
+                sent = conn.send(frame)
+            except BlockingIOError:
+                continue  # Acknowledgements are advisory; a later one supersedes this
+            except OSError:
+                sent = 0
+            if sent < len(frame):
+                # A partial frame would corrupt the reply stream, so drop the connection instead
+                self._close_stream(conn)
+                return
+
+    def _close_stream(self, conn):
+        self.selector.unregister(conn)
+        del self._buffers[conn]
+        conn.close()
@@ -2,40 +2,46 @@
 
 import logging
 import sys
+import time
 from fmp.protocol import FMPProtocol
 
 def main():
-    # Configure logging
+    # Configure logging for the script and the fmp package; fmp itself installs no handlers
+    logging.basicConfig(
+        stream=sys.stdout,
+        level=logging.DEBUG,  # Set to DEBUG for detailed logs
+        format='[%(asctime)s] %(levelname)s - %(message)s'
+    )
     logger = logging.getLogger(__name__)
-    logger.setLevel(logging.DEBUG)  # Set to DEBUG for detailed logs
-    handler = logging.StreamHandler(sys.stdout)
-    formatter = logging.Formatter('[%(asctime)s] %(levelname)s - %(message)s')
-    handler.setFormatter(formatter)
-    logger.addHandler(handler)
 
     # Initialize FMPProtocol
     fragment_size = 100
     master_key = b'0' * 32  # Ensure sender uses the same key
+    paths = [('localhost', 8001), ('localhost', 8002)]
 
+    # The receiver only listens, so its router gets no outgoing paths
     protocol = FMPProtocol(
         fragment_size=fragment_size,
-        paths=[('localhost', 8001), ('localhost', 8002)],
-        master_key=master_key
+        paths=[],
+        master_key=master_key,
+        probe_interval=None
     )
-    
-    # Simulate receiving data
-    # In a real scenario, you'd receive encrypted fragments over the network
-    # For benchmarking, we'll assume encrypted_fragments are already available
-    # Here, we'll use a placeholder for demonstration
-    
-    # Example encrypted_fragments (should be received from the sender)
-    # For demonstration, this will not work as there's no actual sending
-    # In practice, implement network receiving logic here
-    
-    # decrypted_data = protocol.receive_data(encrypted_fragments)
-    # logger.info(f"Received Data: {decrypted_data}")
 
+    # Fragments of several messages may arrive interleaved and out of order across paths;
+    # only fragments of reliable senders (FLAG_RELIABLE) are acknowledged, so they can retransmit gaps
+    def on_message(data):
+        logger.info(f"Received {len(data)} bytes.")
+
+    protocol.listen(paths, on_message)
     logger.info("Receiver is set up and ready to receive data.")
 
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        logger.info("Shutting down receiver.")
+    finally:
+        protocol.close()
+
 if __name__ == "__main__":
     main()
@@ -2,28 +2,25 @@
 
 import logging
 import sys
-import secrets
 from fmp.protocol import FMPProtocol
 
 def main():
-    # Configure logging
+    # Configure logging for the script and the fmp package; fmp itself installs no handlers
+    logging.basicConfig(
+        stream=sys.stdout,
+        level=logging.DEBUG,  # Set to DEBUG for detailed logs
+        format='[%(asctime)s] %(levelname)s - %(message)s'
+    )
     logger = logging.getLogger(__name__)
-    logger.setLevel(logging.DEBUG)  # Set to DEBUG for detailed logs
-    handler = logging.StreamHandler(sys.stdout)
-    formatter = logging.Formatter('[%(asctime)s] %(levelname)s - %(message)s')
-    handler.setFormatter(formatter)
-    logger.addHandler(handler)
 
     # Initialize FMPProtocol
     fragment_size = 100
     master_key = b'0' * 32  # Ensure receiver uses the same key
-    nonce_gen = (secrets.token_bytes(12) for _ in range(10000))  # Generator for unique nonces
 
     protocol = FMPProtocol(
         fragment_size=fragment_size,
         paths=[('localhost', 8001), ('localhost', 8002)],
-        master_key=master_key,
-        nonce_generator=lambda: next(nonce_gen)
+        master_key=master_key
     )
     
     # Read data to send, for example from command-line argument or a file
@@ -33,6 +30,7 @@ def main():
     # Send data
     logger.info("Starting to send data...")
     protocol.send_data(data)
+    protocol.close()  # Waits for queued fragments to leave before closing the path connections
     logger.info("Data sent successfully.")
 
 if __name__ == "__main__":
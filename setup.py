@@ -7,10 +7,13 @@ setup(
     version='0.1.0',
     packages=find_packages(),
     install_requires=[
-        'msgpack',
         'cryptography',
         # Add other dependencies here if necessary
     ],
+    extras_require={
+        # Only benchmarks/benchmark_header.py needs msgpack, for the previous header layout
+        'benchmarks': ['msgpack'],
+    },
     entry_points={
         'console_scripts': [
             'fmp-sender=fmp.scripts.sender:main',      # Updated entry point
@@ -0,0 +1,96 @@
+# tests/test_async_protocol.py
+
+import asyncio
+import threading
+import unittest
+import secrets
+from fmp.async_protocol import AsyncFMPProtocol
+
+class TestAsyncFMPProtocol(unittest.IsolatedAsyncioTestCase):
+    async def _round_trip(self, transport):
+        master_key = secrets.token_bytes(32)
+        receiver = AsyncFMPProtocol(fragment_size=100, master_key=master_key, transport=transport)
+        paths = await receiver.listen([('127.0.0.1', 0), ('127.0.0.1', 0)])
+        sender = AsyncFMPProtocol(fragment_size=100, paths=paths, master_key=master_key, transport=transport)
+        data = b"Test data for AsyncFMPProtocol." * 10
+        try:
+            await sender.send_data(data)
+            messages = receiver.messages()
+            received = await asyncio.wait_for(messages.__anext__(), 2)
+            await messages.aclose()
+        finally:
+            await sender.close()
+            await receiver.close()
+        return data, received
+
+    async def test_udp_round_trip(self):
+        data, received = await self._round_trip('udp')
+        self.assertEqual(received, data, "Received message does not match original data.")
+
+    async def test_tcp_round_trip(self):
+        data, received = await self._round_trip('tcp')
+        self.assertEqual(received, data, "Received message does not match original data.")
+
+    async def test_large_payload_is_encrypted_off_loop(self):
+        protocol = AsyncFMPProtocol(fragment_size=1024, offload_threshold=1024)
+        calls = []
+        original = protocol.core.fragment_and_encrypt
+
+        def fragment_and_encrypt(data):
+            calls.append(threading.get_ident())
+            return original(data)
+
+        protocol.core.fragment_and_encrypt = fragment_and_encrypt
+        protocol.paths.clear()  # Nothing to send on; only the encryption step runs
+        with self.assertRaises(ConnectionError):
+            await protocol.send_data(b'A' * 4096)
+        self.assertEqual(len(calls), 1)
+        self.assertNotEqual(calls[0], threading.get_ident(), "Large payloads should be encrypted off the event loop.")
+        await protocol.close()
+
+    async def test_failed_path_is_retried_after_backoff(self):
+        protocol = AsyncFMPProtocol(fragment_size=100, paths=[('10.0.0.1', 9000), ('10.0.0.2', 9000)])
+        broken = {('10.0.0.1', 9000)}
+        sent = []
+
+        async def send(fragment, path):
+            if path in broken:
+                raise OSError("unreachable")
+            sent.append(path)
+
+        protocol._send = send
+        await protocol.send_data(b'A' * 1000)
+        # Every fragment arrives, the failed one resent on the other path
+        self.assertEqual(sent, [('10.0.0.2', 9000)] * 10)
+        self.assertFalse(protocol.paths[('10.0.0.1', 9000)]['active'])
+        broken.clear()
+        protocol.paths[('10.0.0.1', 9000)]['retry_at'] = 0.0  # The backoff has elapsed
+        await protocol.send_data(b'A' * 1000)
+        self.assertIn(('10.0.0.1', 9000), sent[10:])
+        self.assertEqual(protocol.paths[('10.0.0.1', 9000)]['failures'], 0)
+        broken.update(protocol.paths)
+        with self.assertRaises(ConnectionError):
+            await protocol.send_data(b'A' * 1000)
+        await protocol.close()
+
+    async def test_large_message_is_reassembled_off_loop(self):
+        sender = AsyncFMPProtocol(fragment_size=100)
+        receiver = AsyncFMPProtocol(master_key=sender.core.master_key, offload_threshold=1024)
+        calls = []
+        original = receiver.reassembler.add
+
+        def add(encrypted):
+            calls.append(threading.get_ident())
+            return original(encrypted)
+
+        receiver.reassembler.add = add
+        data = secrets.token_bytes(4000)
+        for fragment in sender.core.fragment_and_encrypt(data):
+            receiver.incoming.put_nowait((fragment, None))
+        messages = receiver.messages()
+        self.assertEqual(await asyncio.wait_for(messages.__anext__(), 2), data)
+        await messages.aclose()
+        self.assertNotIn(threading.get_ident(), calls)
+
+if __name__ == '__main__':
+    unittest.main()
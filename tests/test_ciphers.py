@@ -0,0 +1,70 @@
+# tests/test_ciphers.py
+
+import io
+import random
+import secrets
+import unittest
+from unittest import mock
+from fmp.ciphers import AES_GCM, CHACHA20_POLY1305, AUTO, SUITES, fastest_suite, aead_context
+from fmp.core import FMPCore, FLAG_CHACHA20
+from fmp.protocol import FMPProtocol
+from fmp.reassembly import Reassembler
+
+class TestCiphers(unittest.TestCase):
+    def setUp(self):
+        self.key = secrets.token_bytes(32)
+        self.core = FMPCore(fragment_size=100, master_key=self.key, cipher=CHACHA20_POLY1305)
+        self.data = secrets.token_bytes(1000)
+
+    def flags(self, fragments):
+        return {self.core.parse_fragment(fragment).flags & FLAG_CHACHA20 for fragment in fragments}
+
+    def test_chacha20_round_trip(self):
+        fragments = self.core.fragment_and_encrypt(self.data)
+        self.assertEqual(self.flags(fragments), {FLAG_CHACHA20})
+        # Receivers pick the suite from the header, whatever their own cipher
+        receiver = FMPCore(master_key=self.key)
+        self.assertEqual(receiver.decrypt_and_reassemble(fragments), self.data)
+        shuffled = list(fragments)
+        random.Random(1).shuffle(shuffled)
+        reassembler = Reassembler(receiver)
+        self.assertEqual([reassembler.add(fragment) for fragment in shuffled][-1], self.data)
+        sink = io.BytesIO()
+        receiver.decrypt_stream(self.core.encrypt_stream(io.BytesIO(self.data)), sink)
+        self.assertEqual(sink.getvalue(), self.data)
+
+    def test_chacha20_with_nonce_generator(self):
+        counter = iter(range(1 << 32))
+        core = FMPCore(fragment_size=100, master_key=self.key, cipher=CHACHA20_POLY1305,
+                       nonce_generator=lambda: next(counter).to_bytes(12, 'big'))
+        fragments = core.fragment_and_encrypt(self.data)
+        self.assertEqual(FMPCore(master_key=self.key).decrypt_and_reassemble(fragments), self.data)
+
+    def test_disallowed_suite_is_rejected(self):
+        fragments = self.core.fragment_and_encrypt(self.data)
+        receiver = FMPCore(master_key=self.key, ciphers=(AES_GCM,))
+        with self.assertRaises(ValueError):
+            receiver.decrypt_and_reassemble(fragments)
+        with self.assertRaises(ValueError):
+            FMPCore(cipher=CHACHA20_POLY1305, ciphers=(AES_GCM,))
+        with self.assertRaises(ValueError):
+            FMPCore(cipher='rot13')
+
+    def test_auto_picks_an_allowed_suite(self):
+        self.assertIn(FMPCore(cipher=AUTO).cipher, SUITES)
+        self.assertEqual(FMPCore(cipher=AUTO, ciphers=(CHACHA20_POLY1305,)).cipher, CHACHA20_POLY1305)
+        self.assertEqual(fastest_suite(), fastest_suite())
+
+    def test_contexts_are_shared_by_key(self):
+        self.assertIs(FMPCore(master_key=self.key).aead, FMPCore(master_key=self.key).aead)
+        self.assertIs(FMPCore(master_key=self.key).aead, aead_context(AES_GCM, self.key))
+        self.assertIsNot(FMPCore(master_key=self.key).aead, self.core.aead)
+
+    def test_protocol_builds_one_core(self):
+        with mock.patch('fmp.protocol.FMPCore', wraps=FMPCore) as core_class:
+            protocol = FMPProtocol(paths=[], probe_interval=None)
+            protocol.close()
+        self.assertEqual(core_class.call_count, 1)
+
+if __name__ == '__main__':
+    unittest.main()
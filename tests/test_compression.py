@@ -0,0 +1,79 @@
+# tests/test_compression.py
+
+import io
+import random
+import secrets
+import unittest
+import zlib
+from fmp.core import FMPCore, FLAG_COMPRESSED
+from fmp.metrics import Registry
+from fmp.reassembly import Reassembler
+
+LOG_LINE = b'{"level": "info", "path": "/api/items", "status": 200, "ms": 12}\n'
+
+class TestCompression(unittest.TestCase):
+    def setUp(self):
+        self.registry = Registry()
+        self.core = FMPCore(fragment_size=1000, compression=6, metrics=self.registry)
+
+    def flags(self, fragments):
+        return {self.core.parse_fragment(fragment).flags & FLAG_COMPRESSED for fragment in fragments}
+
+    def test_compressible_round_trip(self):
+        data = LOG_LINE * 2000
+        fragments = self.core.fragment_and_encrypt(data)
+        self.assertEqual(self.flags(fragments), {FLAG_COMPRESSED})
+        self.assertLess(len(fragments), len(data) // 1000 // 10)
+        self.assertEqual(self.core.decrypt_and_reassemble(fragments), data)
+        self.assertEqual(self.registry.snapshot()['fmp_messages_compressed_total'][()], 1)
+
+    def test_incompressible_and_small_messages_are_sent_as_is(self):
+        data = secrets.token_bytes(100_000)
+        fragments = self.core.fragment_and_encrypt(data)
+        self.assertEqual(self.flags(fragments), {0})
+        self.assertEqual(len(fragments), 100)
+        self.assertEqual(self.core.decrypt_and_reassemble(fragments), data)
+        self.assertEqual(self.flags(self.core.fragment_and_encrypt(b'A' * 100)), {0})
+        self.assertEqual(self.registry.snapshot()['fmp_compression_skipped_total'][()], 1)
+
+    def test_receivers_need_no_configuration(self):
+        data = LOG_LINE * 500
+        fragments = self.core.fragment_and_encrypt(data)
+        random.Random(3).shuffle(fragments)
+        receiver = FMPCore(master_key=self.core.master_key)
+        reassembler = Reassembler(receiver)
+        results = [reassembler.add(fragment) for fragment in fragments]
+        self.assertEqual(results[-1], data)
+        sink = io.BytesIO()
+        self.assertEqual(receiver.decrypt_stream(fragments, sink), len(data))
+        self.assertEqual(sink.getvalue(), data)
+
+    def test_inflation_is_bounded(self):
+        fragments = self.core.fragment_and_encrypt(b'\0' * 1_000_000)
+        reassembler = Reassembler(FMPCore(master_key=self.core.master_key), max_bytes=100_000)
+        with self.assertRaises(ValueError):
+            for fragment in fragments:
+                reassembler.add(fragment)
+        with self.assertRaises(ValueError):
+            self.core.decompress(b'not zlib')
+
+    def test_truncated_stream_is_rejected(self):
+        compressed = zlib.compress(secrets.token_bytes(3000), 6)
+        payloads = [(0, compressed[:1000]), (1, compressed[1000:2000])]  # The deflate stream is cut short
+        fragments = self.core.encrypt_fragments(payloads, len(payloads), flags=FLAG_COMPRESSED)
+        with self.assertRaises(ValueError):
+            self.core.decrypt_stream(fragments, io.BytesIO())
+
+    def test_with_fec(self):
+        core = FMPCore(fragment_size=200, compression=1, fec=(4, 1))
+        data = LOG_LINE * 200
+        fragments = core.fragment_and_encrypt(data)
+        del fragments[1]
+        self.assertEqual(core.decrypt_and_reassemble(fragments), data)
+
+    def test_invalid_level(self):
+        with self.assertRaises(ValueError):
+            FMPCore(compression=10)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,10 @@
 # tests/test_core.py
 
+import io
+import logging
 import unittest
-from fmp.core import FMPCore
+from fmp.core import (FMPCore, FLAG_LAST, FLAG_PARITY, FLAG_SESSION, HEADER_SIZE, SESSION_ID_SIZE, FRAGMENT_HEADER,
+                      HEADER_VERSION)
 import secrets
 
 class TestFMPCore(unittest.TestCase):
@@ -72,5 +75,201 @@ class TestFMPCore(unittest.TestCase):
             self.core.decrypt_and_reassemble(incomplete_fragments)
         self.assertIn("Missing fragments", str(context.exception))
 
+    def test_stream_round_trip_from_file(self):
+        """
+        Test that data streamed from a file object is written back to a sink intact.
+        """
+        data = b"Streaming test data." * 50
+        encrypted_fragments = self.core.encrypt_stream(io.BytesIO(data))
+        sink = io.BytesIO()
+        written = self.core.decrypt_stream(encrypted_fragments, sink)
+        self.assertEqual(written, len(data))
+        self.assertEqual(sink.getvalue(), data, "Streamed data does not match original data.")
+
+    def test_stream_rechunks_iterators(self):
+        """
+        Test that arbitrary chunk sizes are re-cut into fragment_size fragments.
+        """
+        data = bytes(range(256)) * 3
+        chunks = (data[i:i + 37] for i in range(0, len(data), 37))
+        encrypted_fragments = list(self.core.encrypt_stream(chunks))
+        sizes = [len(self.core.decrypt_fragment(f)[2]) for f in encrypted_fragments]
+        self.assertEqual(sizes, [100] * 7 + [68])
+        # Streamed fragments are also accepted by decrypt_and_reassemble
+        self.assertEqual(self.core.decrypt_and_reassemble(encrypted_fragments), data)
+
+    def test_stream_reorders_within_window(self):
+        """
+        Test that out-of-order fragments are buffered and written in order.
+        """
+        data = b"Out of order stream data." * 20
+        encrypted_fragments = list(self.core.encrypt_stream(io.BytesIO(data)))
+        encrypted_fragments.reverse()
+        sink = io.BytesIO()
+        self.core.decrypt_stream(encrypted_fragments, sink)
+        self.assertEqual(sink.getvalue(), data)
+        with self.assertRaises(ValueError) as context:
+            self.core.decrypt_stream(encrypted_fragments, io.BytesIO(), window=2)
+        self.assertIn("window", str(context.exception))
+
+    def test_stream_missing_fragment(self):
+        """
+        Test that decrypt_stream raises ValueError when the stream is truncated.
+        """
+        data = b"Truncated stream data." * 20
+        encrypted_fragments = list(self.core.encrypt_stream(io.BytesIO(data)))
+        with self.assertRaises(ValueError) as context:
+            self.core.decrypt_stream(encrypted_fragments[:-1], io.BytesIO())
+        self.assertIn("Missing fragments", str(context.exception))
+
+    def test_header_parsed_before_decryption(self):
+        """
+        Test that the clear-text header identifies the message and fragment.
+        """
+        data = b"Header test data." * 10
+        encrypted_fragments = self.core.fragment_and_encrypt(data)
+        headers = [self.core.parse_fragment(f) for f in encrypted_fragments]
+        self.assertEqual(len({h.message_id for h in headers}), 1, "Fragments of one message share its id.")
+        self.assertEqual([h.index for h in headers], [0, 1])
+        self.assertEqual([h.flags & FLAG_LAST for h in headers], [0, FLAG_LAST])
+        self.assertEqual([h.payload_length for h in headers], [100, 70])
+        self.assertNotEqual(
+            headers[0].message_id, self.core.parse_fragment(self.core.fragment_and_encrypt(data)[0]).message_id,
+            "Each message should get a new id."
+        )
+
+    def test_tampered_header_fails_authentication(self):
+        """
+        Test that the header is authenticated as associated data.
+        """
+        encrypted_fragments = self.core.fragment_and_encrypt(b"Tampered header data.")
+        tampered = bytearray(encrypted_fragments[0])
+        tampered[2] ^= 0xFF  # Alter the message id
+        with self.assertRaises(ValueError) as context:
+            self.core.decrypt_and_reassemble([bytes(tampered)])
+        self.assertIn("Malformed or corrupted fragment detected", str(context.exception))
+
+    def test_unsupported_header_version(self):
+        """
+        Test that fragments with an unknown header version are rejected before decryption.
+        """
+        fragment = bytearray(self.core.fragment_and_encrypt(b"Version test data.")[0])
+        fragment[0] = 99
+        with self.assertRaises(ValueError) as context:
+            self.core.parse_fragment(fragment)
+        self.assertIn("Unsupported fragment header version", str(context.exception))
+        self.assertEqual(len(fragment), HEADER_SIZE + 12 + len(b"Version test data.") + 16)
+
+    def test_parallel_mode_matches_serial_output(self):
+        """
+        Test that parallel encryption keeps fragment order and nonce assignment deterministic.
+        """
+        data = secrets.token_bytes(100 * 1000 + 37)
+        nonces = [secrets.token_bytes(12) for _ in range(1001)]
+        serial_nonces, parallel_nonces = iter(nonces), iter(nonces)
+        serial = FMPCore(fragment_size=100, master_key=self.master_key, nonce_generator=lambda: next(serial_nonces))
+        parallel = FMPCore(fragment_size=100, master_key=self.master_key, nonce_generator=lambda: next(parallel_nonces),
+                           workers=4, parallel_threshold=1)
+        parallel._message_ids, serial._message_ids = iter(range(1, 10)), iter(range(1, 10))
+        try:
+            parallel_fragments = parallel.fragment_and_encrypt(data)
+            self.assertEqual(parallel_fragments, serial.fragment_and_encrypt(data))
+            self.assertEqual(parallel.decrypt_and_reassemble(parallel_fragments), data)
+        finally:
+            parallel.close()
+
+    def test_parallel_mode_detects_corruption(self):
+        """
+        Test that a corrupted fragment still raises ValueError in parallel mode.
+        """
+        core = FMPCore(fragment_size=100, master_key=self.master_key, workers=4, parallel_threshold=1)
+        encrypted_fragments = core.fragment_and_encrypt(b"Parallel corruption data." * 100)
+        encrypted_fragments[17][-1] ^= 0xFF
+        with self.assertRaises(ValueError) as context:
+            core.decrypt_and_reassemble(encrypted_fragments)
+        self.assertIn("Malformed or corrupted fragment detected", str(context.exception))
+        core.close()
+
+    def test_session_mode_counter_nonces(self):
+        """
+        Test that the default session mode uses a derived key and counter nonces.
+        """
+        sender = FMPCore(fragment_size=100, master_key=self.master_key)
+        receiver = FMPCore(fragment_size=100, master_key=self.master_key)
+        data = secrets.token_bytes(100 * 12_000)  # More fragments than the old pre-built nonce pools
+        encrypted_fragments = sender.fragment_and_encrypt(data)
+        nonces = [bytes(f[HEADER_SIZE:HEADER_SIZE + 12]) for f in encrypted_fragments]
+        self.assertEqual(len({n[:SESSION_ID_SIZE] for n in nonces}), 1, "One session per transfer.")
+        self.assertEqual([int.from_bytes(n[SESSION_ID_SIZE:], 'big') for n in nonces], list(range(12_000)))
+        self.assertTrue(all(sender.parse_fragment(f).flags & FLAG_SESSION for f in encrypted_fragments))
+        self.assertEqual(receiver.decrypt_and_reassemble(encrypted_fragments), data)
+
+    def test_session_keys_differ_per_transfer(self):
+        """
+        Test that each transfer uses a new session and that a wrong master key fails.
+        """
+        sender = FMPCore(fragment_size=100, master_key=self.master_key)
+        first = sender.fragment_and_encrypt(b"Session data.")[0]
+        second = sender.fragment_and_encrypt(b"Session data.")[0]
+        self.assertNotEqual(first[HEADER_SIZE:HEADER_SIZE + SESSION_ID_SIZE],
+                            second[HEADER_SIZE:HEADER_SIZE + SESSION_ID_SIZE])
+        with self.assertRaises(ValueError):
+            FMPCore(master_key=secrets.token_bytes(32)).decrypt_and_reassemble([first])
+    def test_fec_recovers_lost_fragments(self):
+        """
+        With fec=(n, k), losing up to k fragments of every block, parity included, still reassembles.
+        """
+        core = FMPCore(fragment_size=100, fec=(4, 2))
+        data = secrets.token_bytes(1050)  # 11 data fragments in 3 blocks, the last one short
+        fragments = core.fragment_and_encrypt(data)
+        headers = [core.parse_fragment(fragment) for fragment in fragments]
+        self.assertEqual(sum(1 for header in headers if header.flags & FLAG_PARITY), 6)
+        self.assertEqual(sum(1 for header in headers if header.flags & FLAG_LAST), 1)
+        # Lose fragment 0, the final fragment and two fragments of the middle block
+        lost = {0, 5, 6, 10}
+        survivors = [fragment for header, fragment in zip(headers, fragments)
+                     if header.flags & FLAG_PARITY or header.index not in lost]
+        self.assertEqual(core.decrypt_and_reassemble(survivors), data)
+        # A block that lost more than k fragments cannot be rebuilt
+        survivors = [fragment for header, fragment in zip(headers, fragments)
+                     if header.flags & FLAG_PARITY or header.index not in {4, 5, 6}]
+        with self.assertRaises(ValueError) as context:
+            core.decrypt_and_reassemble(survivors)
+        self.assertIn("Missing fragments", str(context.exception))
+        # Stream reassembly skips parity
+        sink = io.BytesIO()
+        core.decrypt_stream(fragments, sink)
+        self.assertEqual(sink.getvalue(), data)
+
+    def test_forged_total_is_rejected_before_allocation(self):
+        """
+        Test that a header claiming more fragments than were received fails fast with a short error.
+        """
+        forged = bytearray(self.core.fragment_and_encrypt(b'x' * 100)[0])
+        FRAGMENT_HEADER.pack_into(forged, 0, HEADER_VERSION, FLAG_LAST, 0, 1234, 0, 0xFFFFFFFF, 100)
+        with self.assertRaises(ValueError) as context:
+            self.core.decrypt_and_reassemble([forged])
+        self.assertIn("Missing fragments: 4294967294 (1, 2, 3, 4, 5, 6, 7, 8, ...)", str(context.exception))
+
+    def test_import_leaves_logging_unconfigured(self):
+        """
+        Importing fmp must not attach handlers or force a level on its loggers.
+        """
+        for name in ('fmp.core', 'fmp.routing', 'fmp.protocol', 'fmp.transport', 'fmp.probing'):
+            logger = logging.getLogger(name)
+            self.assertEqual(logger.handlers, [])
+            self.assertEqual(logger.level, logging.NOTSET)
+        handlers = logging.getLogger('fmp').handlers
+        self.assertTrue(all(isinstance(handler, logging.NullHandler) for handler in handlers))
+
+    def test_no_per_fragment_logging(self):
+        """
+        A message produces a constant number of debug records, not one per fragment.
+        """
+        data = secrets.token_bytes(5000)
+        with self.assertLogs('fmp.core', level='DEBUG') as logs:
+            self.core.decrypt_and_reassemble(self.core.fragment_and_encrypt(data))
+        self.assertEqual(len(logs.records), 2)
+
 if __name__ == '__main__':
     unittest.main()
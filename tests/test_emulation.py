@@ -0,0 +1,106 @@
+# tests/test_emulation.py
+
+import random
+import socket
+import time
+import unittest
+import secrets
+from fmp.emulation import LinkProfile, EmulatedPath, NetworkEmulator, _Direction
+from fmp.protocol import FMPProtocol
+
+class TestLinkProfile(unittest.TestCase):
+    def test_invalid_profiles(self):
+        with self.assertRaises(ValueError):
+            LinkProfile(loss=1.5)
+        with self.assertRaises(ValueError):
+            LinkProfile(delay=-1)
+        with self.assertRaises(ValueError):
+            LinkProfile(bandwidth=0)
+
+    def test_bandwidth_serializes_packets(self):
+        direction = _Direction(LinkProfile(bandwidth=1000), random.Random(1))
+        deliveries = [direction.schedule(100, 0.0) for _ in range(3)]
+        for delivery, expected in zip(deliveries, [0.1, 0.2, 0.3]):
+            self.assertAlmostEqual(delivery, expected)
+
+    def test_buffer_overflow_drops(self):
+        direction = _Direction(LinkProfile(bandwidth=1000, buffer=0.15), random.Random(1))
+        deliveries = [direction.schedule(100, 0.0) for _ in range(4)]
+        self.assertEqual(deliveries, [0.1, 0.2, None, None])
+        self.assertEqual(direction.stats['overflow'], 2)
+
+    def test_loss_and_reorder_rates(self):
+        direction = _Direction(LinkProfile(delay=0.01, loss=0.25, reorder=0.5), random.Random(1))
+        deliveries = [direction.schedule(100, 0.0) for _ in range(2000)]
+        lost = deliveries.count(None)
+        self.assertAlmostEqual(lost / 2000, 0.25, delta=0.05)
+        self.assertAlmostEqual(direction.stats['reordered'] / (2000 - lost), 0.5, delta=0.05)
+        self.assertEqual(min(d for d in deliveries if d is not None), 0.01)
+
+class TestEmulatedPath(unittest.TestCase):
+    def setUp(self):
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.server.bind(('127.0.0.1', 0))
+        self.server.settimeout(2)
+        self.client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.client.settimeout(2)
+
+    def tearDown(self):
+        self.server.close()
+        self.client.close()
+
+    def test_delayed_round_trip(self):
+        path = EmulatedPath(self.server.getsockname(), LinkProfile(delay=0.05))
+        proxy = path.start()
+        try:
+            start = time.perf_counter()
+            self.client.sendto(b'ping', proxy)
+            packet, source = self.server.recvfrom(64)
+            self.assertEqual(packet, b'ping')
+            self.server.sendto(b'pong', source)
+            packet, _ = self.client.recvfrom(64)
+            self.assertEqual(packet, b'pong')
+            self.assertGreaterEqual(time.perf_counter() - start, 0.1)
+        finally:
+            path.stop()
+
+    def test_total_loss(self):
+        path = EmulatedPath(self.server.getsockname(), LinkProfile(loss=1.0))
+        proxy = path.start()
+        try:
+            self.client.sendto(b'ping', proxy)
+            self.server.settimeout(0.2)
+            with self.assertRaises(socket.timeout):
+                self.server.recvfrom(64)
+            self.assertEqual(path.forward.stats['lost'], 1)
+        finally:
+            path.stop()
+
+class TestEmulatedProtocol(unittest.TestCase):
+    def test_reliable_delivery_through_emulator(self):
+        master_key = secrets.token_bytes(32)
+        received = []
+        receiver = FMPProtocol(paths=[], master_key=master_key, probe_interval=None)
+        bound = receiver.listen([('127.0.0.1', 0), ('127.0.0.1', 0)], lambda data: received.append(bytes(data)))
+        emulator = NetworkEmulator({
+            bound[0]: LinkProfile(delay=0.005, jitter=0.002, loss=0.05),
+            bound[1]: LinkProfile(delay=0.02, reorder=0.1, loss=0.05),
+        }, seed=3)
+        proxies = emulator.start()
+        sender = FMPProtocol(fragment_size=500, paths=list(proxies.values()), master_key=master_key,
+                             probe_interval=None, reliable=True)
+        messages = [secrets.token_bytes(20_000) for _ in range(5)]
+        try:
+            for data in messages:
+                sender.send_data(data)
+            self.assertTrue(sender.flush(timeout=20))
+        finally:
+            sender.close()
+            receiver.close()
+            emulator.stop()
+        self.assertEqual(sorted(received), sorted(messages))
+        stats = emulator.stats()
+        self.assertTrue(any(s['forward']['lost'] for s in stats.values()))
+
+if __name__ == '__main__':
+    unittest.main()
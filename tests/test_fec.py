@@ -0,0 +1,67 @@
+# tests/test_fec.py
+
+import itertools
+import unittest
+import secrets
+from fmp.fec import (encode_parity, recover_missing, coefficients, gf_mul, gf_inv, validate_code, pack_parity,
+                     unpack_parity, block_span)
+
+class TestFEC(unittest.TestCase):
+    def test_field_inverse(self):
+        for value in range(1, 256):
+            self.assertEqual(gf_mul(value, gf_inv(value)), 1)
+
+    def test_first_parity_row_is_xor(self):
+        self.assertEqual(set(coefficients(8, 0)), {1})
+        fragments = [secrets.token_bytes(64) for _ in range(4)]
+        (parity,) = encode_parity(fragments, 1, 8)
+        expected = bytes(a ^ b ^ c ^ d for a, b, c, d in zip(*fragments))
+        self.assertEqual(parity, expected)
+
+    def test_recover_any_erasure_pattern(self):
+        """
+        Any k lost fragments of an n + k block can be rebuilt, including a short final fragment.
+        """
+        block_size, parity = 6, 3
+        fragments = [secrets.token_bytes(50) for _ in range(block_size - 1)] + [secrets.token_bytes(17)]
+        parity_fragments = dict(enumerate(encode_parity(fragments, parity, block_size)))
+        for lost_data in range(1, parity + 1):
+            for lost in itertools.combinations(range(block_size), lost_data):
+                for rows in itertools.combinations(parity_fragments, lost_data):
+                    present = {i: fragment for i, fragment in enumerate(fragments) if i not in lost}
+                    recovered = recover_missing(present, {row: parity_fragments[row] for row in rows},
+                                                block_size, block_size, 50)
+                    for i in lost:
+                        self.assertEqual(recovered[i][:len(fragments[i])], fragments[i])
+
+    def test_short_block(self):
+        """
+        A final block with fewer than n data fragments uses the same code.
+        """
+        fragments = [secrets.token_bytes(32) for _ in range(3)]
+        parity_fragments = dict(enumerate(encode_parity(fragments, 2, 8)))
+        recovered = recover_missing({1: fragments[1]}, parity_fragments, 8, 3, 32)
+        self.assertEqual(recovered, {0: fragments[0], 2: fragments[2]})
+
+    def test_too_many_losses(self):
+        fragments = [secrets.token_bytes(32) for _ in range(4)]
+        parity_fragments = dict(enumerate(encode_parity(fragments, 1, 4)))
+        with self.assertRaises(ValueError):
+            recover_missing({0: fragments[0], 1: fragments[1]}, parity_fragments, 4, 4, 32)
+
+    def test_parity_payload(self):
+        payload = unpack_parity(pack_parity(8, 2, 1, 17, b'x' * 32))
+        self.assertEqual((payload.block_size, payload.parity, payload.row, payload.tail_length), (8, 2, 1, 17))
+        self.assertEqual(bytes(payload.data), b'x' * 32)
+        with self.assertRaises(ValueError):
+            unpack_parity(pack_parity(8, 2, 2, 17, b'x' * 32))
+        self.assertEqual(block_span(2, 8, 20), (16, 4))
+
+    def test_validate_code(self):
+        validate_code(200, 56)
+        for block_size, parity in ((0, 1), (8, 0), (200, 57)):
+            with self.assertRaises(ValueError):
+                validate_code(block_size, parity)
+
+if __name__ == '__main__':
+    unittest.main()
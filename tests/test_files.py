@@ -0,0 +1,135 @@
+# tests/test_files.py
+
+import os
+import random
+import secrets
+import tempfile
+import unittest
+from unittest import mock
+from fmp.core import FMPCore, FRAGMENT_HEADER, HEADER_VERSION
+from fmp.files import FileReceiver, read_fragments, partial_path
+from fmp.protocol import FMPProtocol
+from tests.test_utils import RecordingTransport
+
+class TestFiles(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.source = os.path.join(self.directory.name, 'source.bin')
+        self.destination = os.path.join(self.directory.name, 'received.bin')
+        self.data = secrets.token_bytes(50_000)
+        with open(self.source, 'wb') as f:
+            f.write(self.data)
+        # Small windows so a file spans several mappings
+        patcher = mock.patch('fmp.files.WINDOW_SIZE', 8192)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.directory.cleanup)
+
+    def protocol(self, **options):
+        transport = RecordingTransport()
+        protocol = FMPProtocol(fragment_size=1000, paths=[('10.0.0.1', 9000)], transport=transport,
+                               probe_interval=None, master_key=b'k' * 32, **options)
+        self.addCleanup(protocol.close)
+        return protocol, transport
+
+    def sent_file(self, **options):
+        protocol, transport = self.protocol()
+        protocol.send_file(self.source, **options)
+        protocol.flush()
+        return transport.fragments()
+
+    def received(self):
+        with open(self.destination, 'rb') as f:
+            return f.read()
+
+    def test_round_trip_out_of_order(self):
+        fragments = self.sent_file()
+        self.assertEqual(len(fragments), 50)
+        random.Random(1).shuffle(fragments)
+        receiver, _ = self.protocol()
+        self.assertEqual(receiver.receive_file(fragments, self.destination), len(self.data))
+        self.assertEqual(self.received(), self.data)
+        self.assertFalse(os.path.exists(partial_path(self.destination)))
+        self.assertIsNone(receiver.file_progress(self.destination))
+
+    def test_final_fragment_first(self):
+        fragments = self.sent_file()
+        receiver, _ = self.protocol()
+        receiver.receive_file(fragments[::-1], self.destination)
+        self.assertEqual(self.received(), self.data)
+
+    def test_resume_sends_only_missing_fragments(self):
+        fragments = self.sent_file()
+        receiver, _ = self.protocol()
+        with self.assertRaises(ValueError):
+            receiver.receive_file(fragments[::2], self.destination)
+        progress = receiver.file_progress(self.destination)
+        self.assertEqual((progress.fragment_size, progress.total), (1000, 50))
+        self.assertEqual(progress.missing, list(range(1, 50, 2)))
+
+        # Another message cannot resume into the partial file
+        receiver, _ = self.protocol()
+        with self.assertRaises(ValueError):
+            receiver.receive_file(self.sent_file(fragment_size=progress.fragment_size), self.destination)
+        self.assertEqual(receiver.file_progress(self.destination), progress)
+
+        # A new send of the missing fragments under the same message id fills the gaps
+        resent = self.sent_file(fragment_size=progress.fragment_size, indices=progress.missing,
+                                message_id=progress.message_id)
+        self.assertEqual(len(resent), 25)
+        receiver.receive_file(resent, self.destination)
+        self.assertEqual(self.received(), self.data)
+        self.assertIsNone(receiver.file_progress(self.destination))
+
+    def test_duplicates_and_wrong_messages(self):
+        core = FMPCore(fragment_size=1000, master_key=b'k' * 32)
+        total, payloads = read_fragments(self.source, 1000)
+        fragments = list(core.encrypt_fragments(payloads, total))
+        receiver = FileReceiver(core, self.destination)
+        self.addCleanup(receiver.close)
+        self.assertFalse(receiver.add(fragments[0]))
+        self.assertFalse(receiver.add(fragments[0]))
+        self.assertEqual(receiver.count, 1)
+        with self.assertRaises(ValueError):
+            receiver.add(core.fragment_and_encrypt(b'x' * 5000)[0])
+        tampered = bytearray(fragments[1])
+        tampered[-1] ^= 1
+        with self.assertRaises(ValueError):
+            receiver.add(tampered)
+        self.assertEqual(receiver.missing(), list(range(1, 50)))
+
+    def test_forged_fragment_creates_nothing(self):
+        core = FMPCore(fragment_size=1000, master_key=b'k' * 32)
+        forged = bytearray(core.fragment_and_encrypt(b'x' * 5000)[0])
+        FRAGMENT_HEADER.pack_into(forged, 0, HEADER_VERSION, 0, 0, 1234, 0, 0xFFFFFFFF, 1000)
+        receiver = FileReceiver(core, self.destination)
+        self.addCleanup(receiver.close)
+        with self.assertRaises(ValueError):
+            receiver.add(forged)
+        self.assertFalse(os.path.exists(self.destination))
+        self.assertFalse(os.path.exists(partial_path(self.destination)))
+        # A legitimate message is still received afterwards
+        total, payloads = read_fragments(self.source, 1000)
+        for fragment in core.encrypt_fragments(payloads, total):
+            receiver.add(fragment)
+        self.assertTrue(receiver.complete)
+        self.assertEqual(self.received(), self.data)
+
+    def test_compressed_messages_are_rejected(self):
+        core = FMPCore(fragment_size=1000, master_key=b'k' * 32, compression=1)
+        fragments = core.fragment_and_encrypt(b'A' * 50_000)
+        receiver = FileReceiver(core, self.destination)
+        self.addCleanup(receiver.close)
+        with self.assertRaises(ValueError):
+            receiver.add(fragments[0])
+
+    def test_empty_file(self):
+        with open(self.source, 'wb'):
+            pass
+        self.assertEqual(self.sent_file(), [])
+        receiver, _ = self.protocol()
+        self.assertEqual(receiver.receive_file([], self.destination), 0)
+        self.assertEqual(self.received(), b'')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,164 @@
+# tests/test_journal.py
+
+import os
+import random
+import secrets
+import tempfile
+import unittest
+from unittest import mock
+from fmp.core import FMPCore
+from fmp.journal import Journal, JOURNAL_SUFFIX
+from fmp.protocol import FMPProtocol
+from tests.test_utils import RecordingTransport
+from fmp.reassembly import Reassembler
+
+class TestJournal(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.core = FMPCore(fragment_size=1000, master_key=b'k' * 32)
+        self.data = secrets.token_bytes(20_500)
+
+    def reassembler(self, **options):
+        journal = Journal(self.directory.name, **options)
+        reassembler = Reassembler(FMPCore(master_key=b'k' * 32), journal=journal)
+        self.addCleanup(reassembler.close)
+        return reassembler
+
+    def test_record_and_replay(self):
+        journal = Journal(self.directory.name)
+        journal.record(7, b'second')
+        journal.record(7, b'first')
+        self.assertIn(7, journal)
+        journal.close()
+        reopened = Journal(self.directory.name)
+        self.assertEqual(reopened.message_ids(), [7])
+        self.assertEqual(list(reopened.replay(7)), [b'second', b'first'])
+        reopened.discard(7)
+        self.assertNotIn(7, reopened)
+        self.assertEqual(os.listdir(self.directory.name), [])
+
+    def test_torn_record_is_ignored_and_overwritten(self):
+        journal = Journal(self.directory.name)
+        journal.record(7, b'first')
+        journal.close()
+        with open(os.path.join(self.directory.name, '00000007' + JOURNAL_SUFFIX), 'ab') as f:
+            f.write(b'\x00\x01\x02')  # A record cut short by a crash
+        reopened = Journal(self.directory.name)
+        self.assertEqual(list(reopened.replay(7)), [b'first'])
+        reopened.record(7, b'second')
+        self.assertEqual(list(reopened.replay(7)), [b'first', b'second'])
+
+    def test_fsyncs_are_batched(self):
+        with mock.patch('fmp.journal.os.fsync', wraps=os.fsync) as fsync:
+            journal = Journal(self.directory.name, sync_every=8, sync_interval=60)
+            for index in range(32):
+                journal.record(1, b'x' * 100)
+        # Spill file, journal file and directory once per batch of 8 fragments
+        self.assertEqual(fsync.call_count, 4 * 3)
+
+    def test_restart_resumes_from_journal(self):
+        fragments = self.core.fragment_and_encrypt(self.data)
+        message_id = self.core.parse_fragment(fragments[0]).message_id
+        first = self.reassembler()
+        for fragment in fragments[::2]:
+            self.assertIsNone(first.add(fragment))
+        first.close()  # The receiver stops with half the message
+
+        second = self.reassembler()
+        progress = second.progress(message_id)
+        self.assertEqual((progress.fragment_size, progress.total), (1000, 21))
+        self.assertEqual(progress.missing, list(range(1, 21, 2)))
+        resent = self.core.encrypt_missing(self.data, message_id, progress.fragment_size, progress.missing)
+        self.assertEqual(len(resent), 10)
+        results = [second.add(fragment) for fragment in resent]
+        self.assertEqual(results[-1], self.data)
+        self.assertEqual(os.listdir(self.directory.name), [])
+
+    def test_journal_holds_no_plaintext(self):
+        fragments = self.core.fragment_and_encrypt(self.data)
+        reassembler = self.reassembler()
+        for fragment in fragments[:10]:
+            reassembler.add(fragment)
+        reassembler.close()
+        for name in os.listdir(self.directory.name):
+            path = os.path.join(self.directory.name, name)
+            self.assertEqual(os.stat(path).st_mode & 0o777, 0o600)
+            with open(path, 'rb') as f:
+                self.assertNotIn(self.data[:64], f.read())
+
+    def test_journal_of_another_key_is_discarded(self):
+        first = self.reassembler()
+        fragments = self.core.fragment_and_encrypt(self.data)
+        message_id = self.core.parse_fragment(fragments[0]).message_id
+        first.add(fragments[0])
+        first.close()
+        other = Reassembler(FMPCore(master_key=b'o' * 32), journal=Journal(self.directory.name))
+        self.addCleanup(other.close)
+        self.assertEqual(other.progress(message_id), (None, 0, []))
+        self.assertEqual(os.listdir(self.directory.name), [])
+
+    def test_messages_dropped_from_memory_are_restored(self):
+        fragments = self.core.fragment_and_encrypt(self.data)
+        random.Random(3).shuffle(fragments)
+        reassembler = self.reassembler()
+        for fragment in fragments[:10]:
+            reassembler.add(fragment, now=0.0)
+        self.assertEqual(reassembler.expire(now=1000.0), [self.core.parse_fragment(fragments[0]).message_id])
+        results = [reassembler.add(fragment, now=1000.0) for fragment in fragments[10:]]
+        self.assertEqual(results[-1], self.data)
+
+    def test_recovered_fragments_are_journaled(self):
+        core = FMPCore(fragment_size=1000, master_key=b'k' * 32, fec=(4, 1))
+        fragments = core.fragment_and_encrypt(self.data)
+        message_id = core.parse_fragment(fragments[0]).message_id
+        first = self.reassembler()
+        for fragment in fragments[1:10]:  # Data fragment 0 is lost and rebuilt from parity
+            first.add(fragment)
+        first.close()
+        self.assertNotIn(0, self.reassembler().progress(message_id).missing)
+
+    def test_protocol_resume(self):
+        sender = FMPProtocol(fragment_size=1000, paths=[('10.0.0.1', 9000)], transport=RecordingTransport(),
+                             probe_interval=None, master_key=b'k' * 32, compression=1)
+        self.addCleanup(sender.close)
+        data = b''.join(b'%d,%d\n' % (i, i * i) for i in range(20_000))
+        message_id = sender.send_data(data)
+        sender.flush()
+        fragments = sender.router.transport.fragments()
+        receiver = FMPProtocol(paths=[], master_key=b'k' * 32, probe_interval=None, journal_dir=self.directory.name)
+        for fragment in fragments[:-3]:
+            receiver.receive_fragment(fragment)
+        receiver.close()
+
+        receiver = FMPProtocol(paths=[], master_key=b'k' * 32, probe_interval=None, journal_dir=self.directory.name)
+        self.addCleanup(receiver.close)
+        progress = receiver.message_progress(message_id)
+        self.assertEqual(len(progress.missing), 3)
+        sender.router.transport.sent = []
+        sender.resume_data(data, message_id, progress)
+        sender.flush()
+        self.assertEqual(len(sender.router.transport.fragments()), 3)
+        results = [receiver.receive_fragment(fragment) for fragment in sender.router.transport.fragments()]
+        self.assertEqual(results[-1], data)
+        self.assertIsNone(receiver.message_progress(message_id))
+
+    def test_sender_queries_progress_over_the_network(self):
+        core = FMPCore(fragment_size=1000, master_key=b'k' * 32)
+        fragments = core.fragment_and_encrypt(self.data)
+        message_id = core.parse_fragment(fragments[0]).message_id
+        for transport in ('udp', 'tcp'):
+            receiver = FMPProtocol(paths=[], master_key=b'k' * 32, probe_interval=None, transport=transport)
+            self.addCleanup(receiver.close)
+            for fragment in fragments[::2]:
+                receiver.receive_fragment(fragment)
+            paths = receiver.listen([('127.0.0.1', 0)], lambda data: None)
+            sender = FMPProtocol(paths=paths, master_key=b'k' * 32, probe_interval=None, transport=transport)
+            self.addCleanup(sender.close)
+            progress = sender.query_progress(message_id, timeout=2)
+            self.assertEqual(progress, receiver.message_progress(message_id))
+            self.assertEqual(progress.missing, list(range(1, 21, 2)))
+            self.assertIsNone(sender.query_progress(message_id + 1, timeout=2))
+
+if __name__ == '__main__':
+    unittest.main()
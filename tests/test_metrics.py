@@ -0,0 +1,109 @@
+# tests/test_metrics.py
+
+import threading
+import unittest
+import urllib.request
+import urllib.error
+from fmp.core import FMPCore
+from fmp.metrics import Registry, MetricsExporter
+from fmp.routing import Router
+from tests.test_utils import RecordingTransport
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        self.registry = Registry()
+
+    def test_counter_sums_threads(self):
+        counter = self.registry.counter('test_total', "Test counter.")
+
+        def work():
+            for _ in range(1000):
+                counter.inc()
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        counter.inc(5)
+        self.assertEqual(self.registry.snapshot()['test_total'], {(): 4005})
+
+    def test_finished_threads_are_folded(self):
+        counter = self.registry.counter('test_total', "Test counter.")
+        histogram = self.registry.histogram('test_seconds', "Test histogram.", buckets=(0.1, 1.0))
+        for _ in range(50):
+            thread = threading.Thread(target=lambda: (counter.inc(2), histogram.observe(0.5)))
+            thread.start()
+            thread.join()
+        snapshot = self.registry.snapshot()
+        self.assertEqual(snapshot['test_total'], {(): 100})
+        self.assertEqual(snapshot['test_seconds'][()]['count'], 50)
+        self.assertEqual(len(counter.labels()._cells), 0)
+        self.assertEqual(len(histogram.labels()._cells), 0)
+
+    def test_histogram_buckets(self):
+        histogram = self.registry.histogram('test_seconds', "Test histogram.", ('stage',), buckets=(0.1, 1.0))
+        child = histogram.labels('a')
+        for value in (0.05, 0.1, 0.5, 5.0):
+            child.observe(value)
+        value = self.registry.snapshot()['test_seconds'][('a',)]
+        self.assertEqual(value['buckets'], {0.1: 2, 1.0: 3, float('inf'): 4})
+        self.assertEqual(value['count'], 4)
+        self.assertAlmostEqual(value['sum'], 5.65)
+
+    def test_registration_conflicts(self):
+        self.assertIs(self.registry.counter('a_total', "A."), self.registry.counter('a_total', "A."))
+        with self.assertRaises(ValueError):
+            self.registry.histogram('a_total', "A.")
+        with self.assertRaises(ValueError):
+            self.registry.counter('b_total', "B.", ('path',)).labels()
+
+    def test_prometheus_render(self):
+        self.registry.counter('sent_total', "Sent \"things\".", ('path',)).labels('h:1').inc(3)
+        self.registry.histogram('wait_seconds', "Wait.", buckets=(1.0,)).observe(0.5)
+        text = self.registry.render()
+        self.assertIn('# TYPE sent_total counter\n', text)
+        self.assertIn('sent_total{path="h:1"} 3\n', text)
+        self.assertIn('wait_seconds_bucket{le="1.0"} 1\n', text)
+        self.assertIn('wait_seconds_bucket{le="+Inf"} 1\n', text)
+        self.assertIn('wait_seconds_count 1\n', text)
+
+    def test_exporter(self):
+        self.registry.counter('served_total', "Served.").inc()
+        exporter = MetricsExporter(self.registry, port=0)
+        host, port = exporter.start()
+        try:
+            with urllib.request.urlopen(f'http://{host}:{port}/metrics', timeout=5) as response:
+                self.assertIn(b'served_total 1', response.read())
+            with self.assertRaises(urllib.error.HTTPError):
+                urllib.request.urlopen(f'http://{host}:{port}/other', timeout=5)
+        finally:
+            exporter.stop()
+
+    def test_core_counters(self):
+        core = FMPCore(fragment_size=10, metrics=self.registry)
+        fragments = core.fragment_and_encrypt(b'x' * 95)
+        core.decrypt_and_reassemble(fragments)
+        fragments[0][-1] ^= 1
+        with self.assertRaises(ValueError):
+            core.decrypt_and_reassemble(fragments)
+        snapshot = self.registry.snapshot()
+        self.assertEqual(snapshot['fmp_fragments_encrypted_total'][()], 10)
+        self.assertEqual(snapshot['fmp_auth_failures_total'][()], 1)
+        self.assertEqual(snapshot['fmp_fragments_decrypted_total'][()], 10)
+        self.assertEqual(snapshot['fmp_stage_seconds'][('encrypt',)]['count'], 1)
+        self.assertEqual(snapshot['fmp_stage_seconds'][('reassemble',)]['count'], 1)
+
+    def test_router_path_metrics(self):
+        path = ('127.0.0.1', 9)
+        router = Router([path], transport=RecordingTransport(), probe_interval=None, metrics=self.registry)
+        for _ in range(3):
+            router.send_fragment(b'abcd')
+        router.close()
+        snapshot = self.registry.snapshot()
+        self.assertEqual(snapshot['fmp_path_fragments_sent_total'][('127.0.0.1:9',)], 3)
+        self.assertEqual(snapshot['fmp_path_bytes_sent_total'][('127.0.0.1:9',)], 12)
+        self.assertEqual(snapshot['fmp_path_queue_delay_seconds'][('127.0.0.1:9',)]['count'], 3)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -26,6 +26,12 @@ class TestFMPProtocol(unittest.TestCase):
         decrypted_data = self.protocol.receive_data(encrypted_fragments)
         self.assertEqual(decrypted_data, self.data, "Decrypted data does not match original data.")
 
+    def test_empty_paths_are_kept(self):
+        receiver = FMPProtocol(paths=[], master_key=self.master_key, probe_interval=None)
+        self.addCleanup(receiver.close)
+        self.assertEqual(receiver.router.paths, {})
+        self.assertEqual(len(self.protocol.router.paths), 2)
+
     def test_receive_data_incomplete(self):
         # Fragment and encrypt data
         encrypted_fragments = self.protocol.core.fragment_and_encrypt(self.data)
@@ -37,7 +43,7 @@ class TestFMPProtocol(unittest.TestCase):
 
     def test_send_data_failure(self):
         # Define a side_effect function that can access 'self'
-        def side_effect(fragment):
+        def side_effect(fragment, stream_id=0):
             # Simulate failure by deactivating the first path
             self.protocol.router.paths[('localhost', 8001)]['active'] = False
 
@@ -62,5 +68,19 @@ class TestFMPProtocol(unittest.TestCase):
         decrypted_data = self.protocol.receive_data(encrypted_fragments)
         self.assertEqual(decrypted_data, empty_data, "Decrypted data should be empty for empty input data.")
 
+    def test_receive_fragment_interleaved(self):
+        """
+        Fragments of two messages fed one by one, interleaved and reversed, yield both messages.
+        """
+        other = secrets.token_bytes(150)
+        first = self.protocol.core.fragment_and_encrypt(self.data)
+        second = self.protocol.core.fragment_and_encrypt(other)
+        received = []
+        for fragment in reversed(first[:1] + second + first[1:]):
+            message = self.protocol.receive_fragment(fragment)
+            if message is not None:
+                received.append(message)
+        self.assertEqual(received, [other, self.data])
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,134 @@
+# tests/test_reassembly.py
+
+import io
+import random
+import unittest
+import secrets
+from fmp.core import FMPCore, FRAGMENT_HEADER, HEADER_VERSION
+from fmp.reassembly import Reassembler
+
+class TestReassembler(unittest.TestCase):
+    def setUp(self):
+        self.core = FMPCore(fragment_size=100)
+        self.reassembler = Reassembler(self.core, timeout=10.0)
+
+    def test_interleaved_out_of_order_messages(self):
+        """
+        Fragments of several messages, shuffled together, each reassemble exactly once.
+        """
+        messages = [secrets.token_bytes(size) for size in (1, 100, 250, 1000, 4321)]
+        fragments = [fragment for message in messages for fragment in self.core.fragment_and_encrypt(message)]
+        random.Random(7).shuffle(fragments)
+        received = []
+        for fragment in fragments:
+            message = self.reassembler.add(fragment, now=0.0)
+            if message is not None:
+                received.append(bytes(message))
+        self.assertCountEqual(received, messages)
+        self.assertEqual(len(self.reassembler), 0)
+        self.assertEqual(self.reassembler.buffered_bytes, 0)
+
+    def test_last_fragment_first(self):
+        data = secrets.token_bytes(350)
+        fragments = self.core.fragment_and_encrypt(data)
+        for fragment in reversed(fragments[1:]):
+            self.assertIsNone(self.reassembler.add(fragment, now=0.0))
+        self.assertEqual(self.reassembler.add(fragments[0], now=0.0), data)
+
+    def test_streamed_message(self):
+        data = secrets.token_bytes(1234)
+        fragments = list(self.core.encrypt_stream(io.BytesIO(data)))
+        fragments.insert(0, fragments.pop())
+        results = [self.reassembler.add(fragment, now=0.0) for fragment in fragments]
+        self.assertEqual(results[-1], data)
+        self.assertTrue(all(result is None for result in results[:-1]))
+
+    def test_duplicates_dropped(self):
+        data = secrets.token_bytes(300)
+        fragments = self.core.fragment_and_encrypt(data)
+        self.reassembler.add(fragments[0], now=0.0)
+        self.assertIsNone(self.reassembler.add(fragments[0], now=0.0))
+        self.assertEqual(self.reassembler.add(fragments[1], now=0.0), None)
+        self.assertEqual(self.reassembler.add(fragments[2], now=0.0), data)
+        # A late duplicate of a delivered message does not start it again
+        self.assertIsNone(self.reassembler.add(fragments[1], now=0.0))
+        self.assertEqual(len(self.reassembler), 0)
+        self.assertEqual(self.reassembler.stats['duplicates'], 2)
+
+    def test_missing(self):
+        fragments = self.core.fragment_and_encrypt(secrets.token_bytes(500))
+        self.reassembler.add(fragments[1], now=0.0)
+        self.reassembler.add(fragments[4], now=0.0)
+        message_id = self.core.parse_fragment(fragments[1]).message_id
+        self.assertEqual(self.reassembler.missing(message_id), [0, 2, 3])
+
+    def test_timeout_evicts_incomplete_messages(self):
+        fragments = self.core.fragment_and_encrypt(secrets.token_bytes(300))
+        self.reassembler.add(fragments[0], now=0.0)
+        self.assertEqual(len(self.reassembler), 1)
+        self.assertEqual(len(self.reassembler.expire(now=20.0)), 1)
+        self.assertEqual(len(self.reassembler), 0)
+        self.assertEqual(self.reassembler.buffered_bytes, 0)
+        self.assertEqual(self.reassembler.stats['expired'], 1)
+
+    def test_memory_budget(self):
+        """
+        A flood of partial messages never holds more than max_bytes; the oldest are evicted.
+        """
+        reassembler = Reassembler(self.core, max_bytes=1000)
+        for _ in range(50):
+            fragments = self.core.fragment_and_encrypt(secrets.token_bytes(400))
+            reassembler.add(fragments[0], now=0.0)
+            self.assertLessEqual(reassembler.buffered_bytes, 1000)
+        self.assertEqual(len(reassembler), 2)
+        self.assertEqual(reassembler.stats['evicted'], 48)
+        # A message larger than the whole budget is rejected rather than buffered
+        fragments = self.core.fragment_and_encrypt(secrets.token_bytes(2000))
+        with self.assertRaises(ValueError):
+            reassembler.add(fragments[0], now=0.0)
+        self.assertEqual(len(reassembler), 2)
+        self.assertLessEqual(reassembler.buffered_bytes, 1000)
+
+    def test_fec_recovery(self):
+        """
+        A message missing fragments is emitted as soon as parity makes up for them.
+        """
+        core = FMPCore(fragment_size=100, fec=(4, 1))
+        reassembler = Reassembler(core)
+        data = secrets.token_bytes(750)
+        fragments = core.fragment_and_encrypt(data)  # 4 data + 1 parity, then 4 data (last short) + 1 parity
+        survivors = [fragment for i, fragment in enumerate(fragments) if i not in (0, 8)]
+        results = [reassembler.add(fragment, now=0.0) for fragment in reversed(survivors)]
+        self.assertEqual(results[-1], data)
+        self.assertTrue(all(result is None for result in results[:-1]))
+        self.assertEqual(reassembler.stats['recovered'], 2)
+        self.assertEqual(reassembler.buffered_bytes, 0)
+
+    def test_forged_fragment_rejected(self):
+        fragments = self.core.fragment_and_encrypt(secrets.token_bytes(300))
+        tampered = bytearray(fragments[0])
+        tampered[-1] ^= 0xFF
+        with self.assertRaises(ValueError):
+            self.reassembler.add(tampered, now=0.0)
+        self.assertEqual(len(self.reassembler), 0)
+        with self.assertRaises(ValueError):
+            self.reassembler.add(b'short', now=0.0)
+
+    def test_forged_header_does_not_evict(self):
+        """
+        A fragment forged without the key cannot make room for itself by evicting real messages.
+        """
+        reassembler = Reassembler(self.core, max_bytes=10_000)
+        for _ in range(5):
+            reassembler.add(self.core.fragment_and_encrypt(secrets.token_bytes(1000))[0], now=0.0)
+        forged = bytearray(self.core.fragment_and_encrypt(secrets.token_bytes(200))[0])
+        for total in (0xFFFFFFFF, 50):
+            FRAGMENT_HEADER.pack_into(forged, 0, HEADER_VERSION, 0, 0, 1234, 0, total, 100)
+            with self.assertRaises(ValueError):
+                reassembler.add(forged, now=0.0)
+        self.assertEqual(len(reassembler), 5)
+        self.assertEqual(reassembler.stats['evicted'], 0)
+        self.assertEqual(reassembler.buffered_bytes, 5000)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,158 @@
+# tests/test_reliability.py
+
+import random
+import threading
+import unittest
+import secrets
+from fmp.core import FMPCore, FLAG_RELIABLE
+from fmp.protocol import FMPProtocol
+from fmp.reassembly import Reassembler
+from fmp.reliability import (PathWindow, pack_sack, unpack_sack, is_sack, MIN_WINDOW, MAX_SACK_BITMAP, is_progress_query,
+                             pack_progress_query, unpack_progress_query, pack_progress, unpack_progress,
+                             MAX_PROGRESS_BITMAP)
+from fmp.transport import UDPTransport
+
+class LossyUDPTransport(UDPTransport):
+    """
+    Loopback UDP transport that drops outgoing fragments with a per-path probability.
+    """
+    def __init__(self, loss, seed=1):
+        super().__init__()
+        self.loss = loss
+        self.random = random.Random(seed)
+        self.dropped = 0
+
+    def send(self, path, fragment):
+        if not self._drop(path):
+            super().send(path, fragment)
+
+    def send_batch(self, path, fragments):
+        kept = [fragment for fragment in fragments if not self._drop(path)]
+        if kept:
+            super().send_batch(path, kept)
+
+    def _drop(self, path):
+        if self.random.random() < self.loss.get(path, 0.0):
+            self.dropped += 1
+            return True
+        return False
+
+class TestReliability(unittest.TestCase):
+    def setUp(self):
+        self.master_key = secrets.token_bytes(32)
+        self.received = []
+        self.delivered = threading.Event()
+        self.receiver = FMPProtocol(paths=[], master_key=self.master_key, probe_interval=None)
+        self.paths = self.receiver.listen([('127.0.0.1', 0), ('127.0.0.1', 0)], self.on_message)
+
+    def tearDown(self):
+        self.receiver.close()
+
+    def on_message(self, data):
+        self.received.append(bytes(data))
+
+    def send(self, loss, messages):
+        transport = LossyUDPTransport({path: rate for path, rate in zip(self.paths, loss)})
+        sender = FMPProtocol(fragment_size=500, paths=self.paths, master_key=self.master_key,
+                             transport=transport, probe_interval=None, reliable=True)
+        try:
+            for data in messages:
+                sender.send_data(data)
+            self.assertTrue(sender.flush(timeout=20))
+        finally:
+            sender.close()
+        return sender.router.reliability, transport
+
+    def test_sack_round_trip(self):
+        packet = pack_sack(7, 3, b'\x05')
+        self.assertTrue(is_sack(packet))
+        self.assertEqual(unpack_sack(packet), (7, 3, 5, False))
+        self.assertEqual(unpack_sack(pack_sack(7, 0, complete=True))[3], True)
+
+    def test_progress_round_trip(self):
+        query = pack_progress_query(7)
+        self.assertTrue(is_progress_query(query))
+        self.assertEqual(unpack_progress_query(query), 7)
+        self.assertEqual(unpack_progress(pack_progress(7, 1000, 20, [3, 19])), (7, 1000, 20, [3, 19]))
+        self.assertEqual(unpack_progress(pack_progress(7)), (7, None, 0, None))
+        # Fragments beyond what one reply carries are reported missing
+        total = MAX_PROGRESS_BITMAP * 8 + 10
+        self.assertEqual(unpack_progress(pack_progress(7, 100, total, [0]))[3],
+                         [0] + list(range(MAX_PROGRESS_BITMAP * 8, total)))
+
+    def test_reassembler_sack(self):
+        core = FMPCore(fragment_size=100, master_key=self.master_key)
+        reassembler = Reassembler(core)
+        fragments = core.fragment_and_encrypt(secrets.token_bytes(1000))
+        message_id = core.parse_fragment(fragments[0]).message_id
+        for index in (0, 1, 3, 5):
+            reassembler.add(fragments[index])
+        _, base, bitmap, complete = unpack_sack(reassembler.sack(message_id))
+        self.assertEqual((base, bitmap, complete), (2, 0b1010, False))
+        for index in (2, 4, 6, 7, 8, 9):
+            reassembler.add(fragments[index])
+        self.assertTrue(unpack_sack(reassembler.sack(message_id))[3])
+
+    def test_only_reliable_senders_are_acknowledged(self):
+        receiver = FMPProtocol(paths=[], master_key=self.master_key, probe_interval=None)
+        self.addCleanup(receiver.close)
+        data = secrets.token_bytes(1000)
+        plain = FMPCore(fragment_size=100, master_key=self.master_key).fragment_and_encrypt(data)
+        self.assertIsNone(receiver._on_fragment(plain[0], None))
+        reliable = FMPCore(fragment_size=100, master_key=self.master_key, reliable=True).fragment_and_encrypt(data)
+        self.assertTrue(receiver.core.parse_fragment(reliable[0]).flags & FLAG_RELIABLE)
+        self.assertTrue(is_sack(receiver._on_fragment(reliable[0], None)))
+
+    def test_sack_base_is_cumulative(self):
+        core = FMPCore(fragment_size=10, master_key=self.master_key)
+        reassembler = Reassembler(core)
+        fragments = core.fragment_and_encrypt(secrets.token_bytes(200_000))
+        message_id = core.parse_fragment(fragments[0]).message_id
+        for fragment in fragments[:1000] + fragments[1001:]:
+            reassembler.add(fragment)
+        _, base, bitmap, complete = unpack_sack(reassembler.sack(message_id))
+        self.assertEqual((base, complete), (1000, False))
+        # The bitmap is bounded by what one acknowledgement carries
+        self.assertEqual(bitmap.bit_length(), MAX_SACK_BITMAP * 8)
+
+    def test_window_aimd(self):
+        window = PathWindow(latency=0.01)
+        initial = window.cwnd
+        for _ in range(5):
+            window.on_ack(0.01)
+        self.assertEqual(window.cwnd, initial + 5)
+        window.next_seq = 10
+        window.on_loss(5)
+        self.assertEqual(window.cwnd, (initial + 5) / 2)
+        # Further losses from the same window do not cut it again
+        window.on_loss(6)
+        self.assertEqual(window.cwnd, (initial + 5) / 2)
+        window.on_loss(11, timeout=True)
+        self.assertEqual(window.cwnd, MIN_WINDOW)
+
+    def test_lossless_delivery(self):
+        messages = [secrets.token_bytes(5000) for _ in range(5)]
+        reliability, _ = self.send((0.0, 0.0), messages)
+        self.assertCountEqual(self.received, messages)
+        self.assertEqual(reliability.stats['retransmits'], 0)
+
+    def test_retransmits_gaps_over_lossy_paths(self):
+        messages = [secrets.token_bytes(20000) for _ in range(5)]
+        reliability, transport = self.send((0.2, 0.2), messages)
+        self.assertGreater(transport.dropped, 0)
+        self.assertGreater(reliability.stats['retransmits'], 0)
+        self.assertEqual(reliability.stats['failed'], 0)
+        self.assertCountEqual(self.received, messages)
+
+    def test_dead_path_does_not_stall_transfer(self):
+        """
+        Everything sent on a black-holed path is resent on the other one, and the dead
+        path's congestion window collapses so it stops taking fragments.
+        """
+        messages = [secrets.token_bytes(20000) for _ in range(3)]
+        reliability, _ = self.send((1.0, 0.0), messages)
+        self.assertCountEqual(self.received, messages)
+        self.assertEqual(reliability.windows[self.paths[0]].cwnd, MIN_WINDOW)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,8 +1,25 @@
 # tests/test_routing.py
 
 import unittest
+import threading
 from fmp.routing import Router
+from fmp.transport import Listener
+from fmp.scheduler import WeightedRoundRobinScheduler
+from collections import Counter
 import secrets
+from tests.test_utils import RecordingTransport
+
+class BatchRecordingTransport(RecordingTransport):
+    """
+    Records the batches handed over by the path workers.
+    """
+    def __init__(self):
+        super().__init__()
+        self.batches = []
+
+    def send_batch(self, path, fragments):
+        self.gate.wait()
+        self.batches.append(list(fragments))
 
 class TestFMPRouting(unittest.TestCase):
     def setUp(self):
@@ -34,5 +51,144 @@ class TestFMPRouting(unittest.TestCase):
         # Verify that the fragment was sent via the remaining active path
         # This can be done by checking logs or modifying Router to track sent paths
 
+    def test_queue_depth_and_backpressure(self):
+        transport = RecordingTransport()
+        transport.gate.clear()
+        router = Router([('localhost', 8001)], transport=transport, queue_size=2, probe_interval=None,
+                        batch_size=1)
+        # The worker takes one fragment and blocks on the gate; two more fill the queue
+        for i in range(3):
+            router.send_fragment(bytes([i]))
+        blocked = threading.Thread(target=router.send_fragment, args=(b'\x03',))
+        blocked.start()
+        blocked.join(0.2)
+        self.assertTrue(blocked.is_alive(), "send_fragment should block while the queue is full.")
+        self.assertEqual(router.queue_depths()[('localhost', 8001)], 2)
+
+        transport.gate.set()
+        blocked.join(1)
+        router.flush()
+        self.assertEqual(transport.fragments(), [b'\x00', b'\x01', b'\x02', b'\x03'])
+        self.assertEqual(router.queue_depths()[('localhost', 8001)], 0)
+        router.close()
+
+    def test_workers_send_queued_fragments_in_batches(self):
+        import time
+        transport = BatchRecordingTransport()
+        transport.gate.clear()
+        path = ('localhost', 8001)
+        router = Router([path], transport=transport, probe_interval=None, batch_size=4)
+        router.send_fragment(b'\x00')
+        while router.queue_depths()[path]:
+            time.sleep(0.001)  # The worker holds the first fragment at the closed gate
+        for i in range(1, 7):
+            router.send_fragment(bytes([i]))
+        transport.gate.set()
+        router.flush()
+        router.close()
+        self.assertEqual(transport.batches, [[b'\x00'], [bytes([i]) for i in range(1, 5)], [b'\x05', b'\x06']])
+
+    def test_flush_interval_fills_batches(self):
+        import time
+        transport = BatchRecordingTransport()
+        router = Router([('localhost', 8001)], transport=transport, probe_interval=None, batch_size=3,
+                        flush_interval=0.5)
+        start = time.monotonic()
+        for i in range(3):
+            router.send_fragment(bytes([i]))
+        router.flush()
+        router.close()
+        self.assertEqual(transport.batches, [[b'\x00', b'\x01', b'\x02']])
+        self.assertLess(time.monotonic() - start, 0.5, "A full batch should not wait for the deadline.")
+
+    def test_invalid_batching(self):
+        with self.assertRaises(ValueError):
+            Router([('localhost', 8001)], batch_size=0, probe_interval=None)
+        with self.assertRaises(ValueError):
+            Router([('localhost', 8001)], flush_interval=-1, probe_interval=None)
+
+    def test_select_path_follows_rebuilt_table(self):
+        paths = [('localhost', 8001), ('localhost', 8002)]
+        router = Router(paths, transport=RecordingTransport(), probe_interval=None)
+        try:
+            router.paths[paths[0]]['score'] = 3 * router.paths[paths[1]]['score']
+            router.rebuild_selection()
+            counts = Counter(router.select_path() for _ in range(400))
+            self.assertEqual(counts, {paths[0]: 300, paths[1]: 100})
+            # Deactivated paths are skipped even before the table is rebuilt
+            router.paths[paths[0]]['active'] = False
+            self.assertEqual({router.select_path() for _ in range(50)}, {paths[1]})
+            self.assertEqual(router.select_path(eligible=lambda path: path == paths[0]), None)
+        finally:
+            router.close()
+
+    def test_schedulers_without_table_are_called_per_fragment(self):
+        class Alternating(WeightedRoundRobinScheduler):
+            table = None
+
+        paths = [('localhost', 8001), ('localhost', 8002)]
+        router = Router(paths, transport=RecordingTransport(), scheduler=Alternating(), probe_interval=None)
+        try:
+            self.assertIsNone(router._table)
+            self.assertEqual([router.select_path() for _ in range(4)], paths * 2)
+        finally:
+            router.close()
+
+    def test_concurrent_dispatch(self):
+        paths = [('localhost', 8000 + i) for i in range(16)]
+        router = Router(paths, transport=RecordingTransport(), probe_interval=None)
+        picks = Counter()
+        lock = threading.Lock()
+
+        def work():
+            local = Counter(router.select_path() for _ in range(1024))
+            with lock:
+                picks.update(local)
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        router.close()
+        # Equal scores and a whole number of table cycles: every path gets exactly its share
+        self.assertEqual(set(picks.values()), {256})
+
+    def test_construction_does_not_block_on_probing(self):
+        import time
+        start = time.perf_counter()
+        router = Router([('localhost', 8001), ('localhost', 8002)], probe_interval=None)
+        self.assertLess(time.perf_counter() - start, 0.05)
+        router.close()
+
+    def test_probe_updates_metrics_and_readmits_path(self):
+        listener = Listener([('127.0.0.1', 0)], lambda fragment, path: None)
+        path = listener.start()[0]
+        router = Router([path], probe_interval=None)
+        try:
+            router.paths[path]['active'] = False
+            router.score_paths()
+            metrics = router.paths[path]
+            self.assertTrue(metrics['active'], "A path answering probes should be re-admitted.")
+            self.assertLess(metrics['latency'], 0.05, "Loopback RTT should replace the latency prior.")
+            self.assertEqual(metrics['samples'], 1)
+        finally:
+            router.close()
+            listener.stop()
+
+    def test_unanswered_probes_deactivate_path(self):
+        listener = Listener([('127.0.0.1', 0)], lambda fragment, path: None)
+        path = listener.start()[0]
+        listener.stop()  # Nothing answers on this port any more
+        router = Router([path], probe_interval=None)
+        router.prober.timeout = 0.05
+        try:
+            for _ in range(router.prober.failure_threshold):
+                router.score_paths()
+            self.assertFalse(router.paths[path]['active'])
+            self.assertGreater(router.paths[path]['loss'], 0.0)
+        finally:
+            router.close()
+
 if __name__ == '__main__':
     unittest.main()
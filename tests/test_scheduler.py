@@ -0,0 +1,48 @@
+# tests/test_scheduler.py
+
+import unittest
+from collections import Counter
+from fmp.scheduler import BestPathScheduler, WeightedRoundRobinScheduler
+
+class TestFMPScheduler(unittest.TestCase):
+    def setUp(self):
+        self.paths = {
+            ('localhost', 8001): {'latency': 0.01, 'score': 100.0, 'active': True},
+            ('localhost', 8002): {'latency': 0.02, 'score': 50.0, 'active': True},
+            ('localhost', 8003): {'latency': 0.04, 'score': 25.0, 'active': True},
+        }
+
+    def test_weighted_round_robin_is_proportional(self):
+        scheduler = WeightedRoundRobinScheduler()
+        counts = Counter(scheduler.select(self.paths) for _ in range(700))
+        self.assertEqual(counts[('localhost', 8001)], 400)
+        self.assertEqual(counts[('localhost', 8002)], 200)
+        self.assertEqual(counts[('localhost', 8003)], 100)
+
+    def test_measured_bandwidth_overrides_score(self):
+        self.paths[('localhost', 8003)]['bandwidth'] = 1_000_000.0
+        self.paths[('localhost', 8001)]['bandwidth'] = 3_000_000.0
+        self.paths[('localhost', 8002)]['active'] = False
+        scheduler = WeightedRoundRobinScheduler()
+        counts = Counter(scheduler.select(self.paths) for _ in range(400))
+        self.assertEqual(counts, {('localhost', 8001): 300, ('localhost', 8003): 100})
+
+    def test_table_is_proportional_and_spread(self):
+        table = WeightedRoundRobinScheduler().table(self.paths, size=70)
+        self.assertEqual(Counter(table), {('localhost', 8001): 40, ('localhost', 8002): 20, ('localhost', 8003): 10})
+        self.assertNotIn((('localhost', 8001),) * 3, zip(table, table[1:], table[2:]))
+
+    def test_no_active_paths(self):
+        for metrics in self.paths.values():
+            metrics['active'] = False
+        self.assertIsNone(WeightedRoundRobinScheduler().select(self.paths))
+        self.assertIsNone(BestPathScheduler().select(self.paths))
+        self.assertEqual(WeightedRoundRobinScheduler().table(self.paths), ())
+        self.assertEqual(BestPathScheduler().table(self.paths), ())
+
+    def test_best_path_scheduler(self):
+        scheduler = BestPathScheduler()
+        self.assertEqual({scheduler.select(self.paths) for _ in range(10)}, {('localhost', 8001)})
+
+if __name__ == '__main__':
+    unittest.main()
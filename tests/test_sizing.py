@@ -0,0 +1,85 @@
+# tests/test_sizing.py
+
+import threading
+import unittest
+import secrets
+from fmp.core import FMPCore, HEADER_SIZE, NONCE_SIZE, TAG_SIZE, MAX_FRAGMENT_SIZE
+from fmp.protocol import FMPProtocol
+from fmp.sizing import FragmentSizer, path_fragment_size, MIN_FRAGMENT_SIZE
+
+OVERHEAD = HEADER_SIZE + NONCE_SIZE + TAG_SIZE
+
+class TestFragmentSizing(unittest.TestCase):
+    def test_capped_to_path_mtu(self):
+        size = path_fragment_size({'max_datagram': 1472, 'loss': 0.0, 'bandwidth': None}, OVERHEAD)
+        self.assertLessEqual(size + OVERHEAD, 1472)
+        self.assertGreater(size, 1300)
+
+    def test_stream_paths_are_uncapped(self):
+        self.assertEqual(path_fragment_size({'max_datagram': None, 'loss': 0.0, 'bandwidth': None}, OVERHEAD),
+                         MAX_FRAGMENT_SIZE // 16 * 16)
+
+    def test_bandwidth_and_loss(self):
+        fast = path_fragment_size({'max_datagram': 65507, 'loss': 0.0, 'bandwidth': 50e6}, OVERHEAD)
+        slow = path_fragment_size({'max_datagram': 65507, 'loss': 0.0, 'bandwidth': 1e6}, OVERHEAD)
+        lossy = path_fragment_size({'max_datagram': 65507, 'loss': 0.1, 'bandwidth': 50e6}, OVERHEAD)
+        self.assertGreater(fast, slow)
+        self.assertLess(lossy, fast)
+        self.assertEqual(path_fragment_size({'max_datagram': 65507, 'loss': 0.0, 'bandwidth': 1e3}, OVERHEAD),
+                         MIN_FRAGMENT_SIZE)
+
+    def test_sizer_hysteresis(self):
+        sizer = FragmentSizer()
+        paths = [{'max_datagram': 65507, 'loss': 0.0, 'bandwidth': 10e6},
+                 {'max_datagram': 65507, 'loss': 0.0, 'bandwidth': 20e6}]
+        self.assertEqual(sizer.update(paths, OVERHEAD), 10000)
+        paths[0]['bandwidth'] = 11e6
+        self.assertEqual(sizer.update(paths, OVERHEAD), 10000)  # Within the re-tune threshold
+        paths[0]['bandwidth'] = 15e6
+        self.assertEqual(sizer.update(paths, OVERHEAD), 14992)  # Rounded down to 16 bytes
+
+    def test_sizer_shrinks_to_new_mtu_at_once(self):
+        sizer = FragmentSizer()
+        paths = [{'max_datagram': 1472, 'loss': 0.0, 'bandwidth': None}]
+        first = sizer.update(paths, OVERHEAD)
+        paths[0]['max_datagram'] = 1400
+        self.assertLessEqual(sizer.update(paths, OVERHEAD) + OVERHEAD, 1400)
+        self.assertLess(sizer.current, first)
+
+    def test_per_message_fragment_size(self):
+        core = FMPCore(fragment_size=100)
+        data = secrets.token_bytes(5000)
+        fragments = core.fragment_and_encrypt(data, 1000)
+        self.assertEqual(len(fragments), 5)
+        self.assertEqual(core.decrypt_and_reassemble(fragments), data)
+        self.assertEqual(len(core.fragment_and_encrypt(data)), 50)
+        with self.assertRaises(ValueError):
+            core.fragment_and_encrypt(data, MAX_FRAGMENT_SIZE + 1)
+
+    def test_auto_protocol_round_trip(self):
+        master_key = secrets.token_bytes(32)
+        received = []
+        done = threading.Event()
+
+        def on_message(data):
+            received.append(bytes(data))
+            done.set()
+
+        receiver = FMPProtocol(fragment_size='auto', paths=[], master_key=master_key, probe_interval=None)
+        paths = receiver.listen([('127.0.0.1', 0), ('127.0.0.1', 0)], on_message)
+        sender = FMPProtocol(fragment_size='auto', paths=paths, master_key=master_key, probe_interval=None,
+                             reliable=True)
+        data = secrets.token_bytes(200_000)
+        try:
+            sender.send_data(data)
+            self.assertTrue(sender.flush(timeout=10))
+            self.assertTrue(done.wait(5))
+        finally:
+            sender.close()
+            receiver.close()
+        self.assertEqual(received, [data])
+        # Loopback has a 64 KiB MTU, so auto mode uses far larger fragments than the fixed default
+        self.assertGreater(sender.router.sizer.current, 8192)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+# tests/test_streams.py
+
+import queue
+import secrets
+import threading
+import unittest
+from fmp.core import FMPCore, MAX_STREAM_ID
+from fmp.protocol import FMPProtocol
+from fmp.streams import FairQueue
+from tests.test_utils import RecordingTransport
+
+def entry(stream_id, size=100, tag=0):
+    return (bytes([tag]) * size, 0.0, stream_id)
+
+class TestFairQueue(unittest.TestCase):
+    def test_small_stream_is_not_stuck_behind_bulk(self):
+        q = FairQueue(quantum=100)
+        for i in range(10):
+            q.put(entry(1, tag=i))
+        q.put(entry(2, tag=99))
+        order = [q.get()[2] for _ in range(11)]
+        self.assertLessEqual(order.index(2), 2)
+        self.assertEqual(order.count(1), 10)
+
+    def test_order_within_stream_and_sentinel_last(self):
+        q = FairQueue(quantum=100)
+        for i in range(3):
+            q.put(entry(1, tag=i))
+            q.put(entry(2, tag=10 + i))
+        q.put(None)
+        q.put(entry(3, tag=20))
+        served = [q.get() for _ in range(8)]
+        self.assertIsNone(served[-1])
+        by_stream = {}
+        for item in served[:-1]:
+            by_stream.setdefault(item[2], []).append(item[0][0])
+        self.assertEqual(by_stream, {1: [0, 1, 2], 2: [10, 11, 12], 3: [20]})
+
+    def test_fair_by_bytes(self):
+        q = FairQueue(quantum=1000)
+        for _ in range(100):
+            q.put(entry(1, size=1000))
+            for _ in range(10):
+                q.put(entry(2, size=100))
+        sent = {1: 0, 2: 0}
+        for _ in range(40):
+            item = q.get()
+            sent[item[2]] += len(item[0])
+        self.assertLessEqual(abs(sent[1] - sent[2]), 1000)
+
+    def test_bounded(self):
+        q = FairQueue(maxsize=2)
+        q.put(entry(1))
+        q.put(entry(2))
+        with self.assertRaises(queue.Full):
+            q.put_nowait(entry(3))
+        self.assertEqual(q.qsize(), 2)
+
+class TestStreams(unittest.TestCase):
+    def test_stream_id_in_header(self):
+        core = FMPCore(fragment_size=10)
+        fragments = core.fragment_and_encrypt(b'x' * 25, stream_id=7)
+        self.assertEqual({core.parse_fragment(fragment).stream_id for fragment in fragments}, {7})
+        self.assertEqual(core.decrypt_and_reassemble(fragments), b'x' * 25)
+        with self.assertRaises(ValueError):
+            core.fragment_and_encrypt(b'x', stream_id=MAX_STREAM_ID + 1)
+
+    def test_concurrent_streams_over_one_protocol(self):
+        master_key = secrets.token_bytes(32)
+        received = {}
+        lock = threading.Lock()
+        done = threading.Event()
+        streams_count, messages = 20, 5
+
+        def on_message(stream_id, data):
+            with lock:
+                received.setdefault(stream_id, []).append(bytes(data))
+                if sum(map(len, received.values())) == streams_count * messages:
+                    done.set()
+
+        receiver = FMPProtocol(paths=[], master_key=master_key, probe_interval=None)
+        paths = receiver.listen([('127.0.0.1', 0), ('127.0.0.1', 0)], on_message, with_stream=True)
+        sender = FMPProtocol(fragment_size=512, paths=paths, master_key=master_key, probe_interval=None,
+                             reliable=True)
+        streams = [sender.open_stream() for _ in range(streams_count)]
+        payloads = {stream.id: [secrets.token_bytes(3000) for _ in range(messages)] for stream in streams}
+
+        def send(stream):
+            for data in payloads[stream.id]:
+                stream.send(data)
+
+        threads = [threading.Thread(target=send, args=(stream,)) for stream in streams]
+        try:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertTrue(sender.flush(timeout=10))
+            self.assertTrue(done.wait(5))
+        finally:
+            sender.close()
+            receiver.close()
+        self.assertEqual(len({stream.id for stream in streams}), streams_count)
+        self.assertEqual({stream_id: sorted(data) for stream_id, data in received.items()},
+                         {stream_id: sorted(data) for stream_id, data in payloads.items()})
+
+    def test_stream_send_returns_message_id(self):
+        sender = FMPProtocol(fragment_size=100, paths=[('10.0.0.1', 9000)], transport=RecordingTransport(),
+                             probe_interval=None, master_key=b'k' * 32)
+        self.addCleanup(sender.close)
+        stream = sender.open_stream()
+        data = secrets.token_bytes(1000)
+        message_id = stream.send(data)
+        sender.flush()
+        fragments = sender.router.transport.fragments()
+        self.assertEqual({sender.core.parse_fragment(fragment).message_id for fragment in fragments}, {message_id})
+        # The id lets the stream's message be resumed like any other
+        receiver = FMPProtocol(paths=[], master_key=b'k' * 32, probe_interval=None)
+        self.addCleanup(receiver.close)
+        for fragment in fragments[:-2]:
+            receiver.receive_fragment(fragment)
+        sender.router.transport.sent = []
+        sender.resume_data(data, message_id, receiver.message_progress(message_id), stream_id=stream.id)
+        sender.flush()
+        results = [receiver.receive_fragment(fragment) for fragment in sender.router.transport.fragments()]
+        self.assertEqual(results[-1], data)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+# tests/test_transport.py
+
+import unittest
+import threading
+from fmp.transport import Listener, UDPTransport, TCPTransport, create_transport, _send_vectored
+
+class TrickleSocket:
+    """
+    Socket stand-in whose sendmsg writes at most a few bytes per call.
+    """
+    def __init__(self):
+        self.data = bytearray()
+
+    def sendmsg(self, buffers):
+        chunk = b''.join(bytes(buffer) for buffer in buffers)[:7]
+        self.data += chunk
+        return len(chunk)
+
+class TestFMPTransport(unittest.TestCase):
+    def _round_trip(self, transport_name, transport, batched=False):
+        received = []
+        done = threading.Event()
+        fragments = [bytes([i]) * (100 + i) for i in range(20)]
+
+        def on_fragment(fragment, path):
+            received.append(fragment)
+            if len(received) == len(fragments):
+                done.set()
+
+        listener = Listener([('127.0.0.1', 0)], on_fragment, transport=transport_name)
+        path = listener.start()[0]
+        try:
+            if batched:
+                transport.send_batch(path, fragments)
+            else:
+                for fragment in fragments:
+                    transport.send(path, fragment)
+            self.assertTrue(done.wait(2), "Listener did not receive every fragment.")
+        finally:
+            transport.close()
+            listener.stop()
+        return fragments, received
+
+    def test_udp_round_trip(self):
+        fragments, received = self._round_trip('udp', UDPTransport())
+        self.assertEqual(sorted(received), sorted(fragments))
+
+    def test_tcp_round_trip_preserves_framing(self):
+        fragments, received = self._round_trip('tcp', TCPTransport())
+        self.assertEqual(received, fragments, "TCP frames should arrive intact and in order.")
+
+    def test_udp_batch_round_trip(self):
+        fragments, received = self._round_trip('udp', UDPTransport(), batched=True)
+        self.assertEqual(sorted(received), sorted(fragments))
+
+    def test_tcp_batch_preserves_framing(self):
+        fragments, received = self._round_trip('tcp', TCPTransport(), batched=True)
+        self.assertEqual(received, fragments)
+
+    def test_vectored_write_resumes_partial_sends(self):
+        sock = TrickleSocket()
+        buffers = [b'header', bytearray(b'payload' * 5), b'', b'tail']
+        _send_vectored(sock, buffers)
+        self.assertEqual(bytes(sock.data), b''.join(buffers))
+
+    def test_connection_is_reused_per_path(self):
+        transport = UDPTransport()
+        path = ('127.0.0.1', 9)
+        try:
+            self.assertIs(transport.connection(path), transport.connection(path))
+        finally:
+            transport.close()
+
+    def test_unknown_transport(self):
+        with self.assertRaises(ValueError):
+            create_transport('carrier-pigeon')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,6 @@
 # tests/test_utils.py
 
+import threading
 from unittest.mock import Mock
 
 def mock_thread(target, args=(), kwargs=None, daemon=None):
@@ -10,3 +11,29 @@ def mock_thread(target, args=(), kwargs=None, daemon=None):
     thread = Mock()
     thread.start.side_effect = lambda: target(*args, **(kwargs or {}))
     return thread
+
+class RecordingTransport:
+    """
+    In-memory transport that records every fragment sent as (path, fragment) and can be
+    paused, by clearing gate, to fill the queues.
+    """
+    name = 'udp'
+    connections = {}
+
+    def __init__(self):
+        self.sent = []
+        self.gate = threading.Event()
+        self.gate.set()
+
+    def send(self, path, fragment):
+        self.gate.wait()
+        self.sent.append((path, bytes(fragment)))
+
+    def fragments(self):
+        return [fragment for _, fragment in self.sent]
+
+    def probe(self, path, timeout):
+        return 0.001, None
+
+    def close(self):
+        pass